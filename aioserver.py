@@ -0,0 +1,224 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+import paho.mqtt.client as mqtt
+
+from notify import AsyncNotificationDispatcher
+from provider import LazyTwilio, twilio_installed
+from server import SosServer
+
+
+# Drives a paho client from an asyncio loop instead of loop_forever(): paho's
+# external-event-loop hooks register the socket with loop.add_reader /
+# add_writer, and keepalive pings run from a periodic task. paho calls the
+# hooks from whichever thread touched the client (a publish from another
+# thread, connect in an executor), so they are marshalled onto the loop.
+class AsyncioMqtt:
+	def __init__(self, client: mqtt.Client, loop: asyncio.AbstractEventLoop, min_delay: float = 1.0, max_delay: float = 120.0):
+		self.client = client
+		self.loop = loop
+		self.min_delay = min_delay
+		self.max_delay = max_delay
+		self._thread = threading.get_ident()
+		self._closing = False
+		self._misc: Optional[asyncio.Task] = None
+		self._reconnect: Optional[asyncio.Task] = None
+		client.on_socket_open = self._on_socket_open
+		client.on_socket_close = self._on_socket_close
+		client.on_socket_register_write = self._on_socket_register_write
+		client.on_socket_unregister_write = self._on_socket_unregister_write
+
+	def _call(self, func, *args) -> None:
+		if threading.get_ident() == self._thread:
+			func(*args)
+		else:
+			self.loop.call_soon_threadsafe(func, *args)
+
+	def _on_socket_open(self, client, userdata, sock) -> None:
+		self._call(self.loop.add_reader, sock, client.loop_read)
+
+	def _on_socket_close(self, client, userdata, sock) -> None:
+		self._call(self.loop.remove_reader, sock)
+		self._call(self.loop.remove_writer, sock)
+
+	def _on_socket_register_write(self, client, userdata, sock) -> None:
+		self._call(self.loop.add_writer, sock, client.loop_write)
+
+	def _on_socket_unregister_write(self, client, userdata, sock) -> None:
+		self._call(self.loop.remove_writer, sock)
+
+	async def connect(self, host: str, port: int, keepalive: int = 60) -> None:
+		# The TCP connect (and DNS) blocks, so it runs in the default executor
+		await self.loop.run_in_executor(None, lambda: self.client.connect(host, port, keepalive=keepalive))
+		self._misc = self.loop.create_task(self._misc_loop())
+
+	def connection_lost(self) -> None:
+		# Call from on_disconnect; reconnects with paho's default backoff
+		if self._closing or (self._reconnect is not None and not self._reconnect.done()):
+			return
+		self._reconnect = self.loop.create_task(self._reconnect_loop())
+
+	async def _reconnect_loop(self) -> None:
+		delay = self.min_delay
+		while not self._closing:
+			await asyncio.sleep(delay)
+			try:
+				await self.loop.run_in_executor(None, self.client.reconnect)
+				return
+			except (OSError, ValueError) as exc:
+				print(f"[server] MQTT reconnect failed: {exc}")
+				delay = min(delay * 2, self.max_delay)
+
+	async def _misc_loop(self) -> None:
+		while not self._closing:
+			self.client.loop_misc()
+			await asyncio.sleep(1.0)
+
+	async def close(self) -> None:
+		self._closing = True
+		for task in (self._misc, self._reconnect):
+			if task is not None:
+				task.cancel()
+		sock = self.client.socket()
+		if sock is not None:
+			self.loop.remove_reader(sock)
+			self.loop.remove_writer(sock)
+
+
+# SERVER_MODE=asyncio: the same handlers as SosServer on one event loop.
+# MQTT I/O runs on the loop (AsyncioMqtt), Twilio requests are awaited through
+# twilio's aiohttp client with asyncio backoff, and event-log writes go to a
+# single storage thread so an fsync never stalls the loop. The outbox write
+# that gates the SOS ACK stays inline, as in sync mode, and a notification
+# still waits for the SOS row it follows to be durable.
+class AsyncSosServer(SosServer):
+	def __init__(self, config: dict):
+		super().__init__(config)
+		self.dispatcher = AsyncNotificationDispatcher(
+			concurrency=config["notify_async_concurrency"],
+			queue_size=config["notify_queue_size"],
+		)
+		# Not built yet, so it can still become twilio's aiohttp client; that
+		# needs a running loop, which the first send or the warm-up provides
+		if isinstance(self.twilio, LazyTwilio):
+			if not twilio_installed(asynchronous=True):
+				raise RuntimeError("SERVER_MODE=asyncio needs aiohttp for Twilio (pip install aiohttp)")
+			self.twilio.asynchronous = True
+		self._warm_task: Optional[asyncio.Task] = None
+		# One thread keeps rows in arrival order; _durable is the latest fsynced write
+		self._storage = ThreadPoolExecutor(max_workers=1, thread_name_prefix="store")
+		self._durable: Optional[Future] = None
+		self._loop: Optional[asyncio.AbstractEventLoop] = None
+		self._done: Optional[asyncio.Event] = None
+		self.mqtt: Optional[AsyncioMqtt] = None
+
+	def run(self) -> None:
+		# The loop gets its own thread so Ctrl+C still lands in the caller,
+		# which then runs stop() while the loop drains notifications
+		error: list[BaseException] = []
+
+		def serve() -> None:
+			try:
+				asyncio.run(self.serve())
+			except BaseException as exc:
+				error.append(exc)
+
+		thread = threading.Thread(target=serve, name="aio-server", daemon=True)
+		thread.start()
+		while thread.is_alive():
+			thread.join(0.5)
+		if error:
+			raise error[0]
+
+	async def serve(self) -> None:
+		self._loop = asyncio.get_running_loop()
+		self._done = asyncio.Event()
+		self.mqtt = AsyncioMqtt(self.client, self._loop, *self.reconnect_delay)
+		self._start_services()
+		await self.mqtt.connect(self.broker_host, self.broker_port, keepalive=60)
+		await self._done.wait()
+		await self.mqtt.close()
+		if self._warm_task is not None:
+			self._warm_task.cancel()
+		if isinstance(self.twilio, LazyTwilio):
+			await self.twilio.aclose()
+
+	def stop(self) -> None:
+		super().stop()
+		if self._loop is not None and not self._loop.is_closed():
+			self._loop.call_soon_threadsafe(self._done.set)
+
+	def _start_warmup(self) -> None:
+		# A task on the loop instead of a thread; on_connect runs on the loop
+		if self._warming or not isinstance(self.twilio, LazyTwilio) or self.twilio_warm_connections <= 0:
+			return
+		self._warming = True
+		self._warm_task = self._loop.create_task(self.twilio.keep_warm_async(self.twilio_warm_connections, self.twilio_keepwarm_seconds))
+
+	def _on_disconnect(self, client, userdata, rc):
+		super()._on_disconnect(client, userdata, rc)
+		if rc != 0 and not self._stopping.is_set() and self.mqtt is not None:
+			self.mqtt.connection_lost()
+
+	def _store_append(self, kind: str, row: list, durable: bool = False) -> None:
+		# Also called from the status pipeline's applier thread
+		future = self._storage.submit(super()._store_append, kind, row, durable)
+		if durable:
+			self._durable = future
+
+	def _close_storage(self) -> None:
+		self._storage.shutdown(wait=True)
+		super()._close_storage()
+
+	def _dispatch(self, channel: str, number: str, body: str, priority: int, keys: tuple[str, ...] = ()) -> None:
+		label = f"{channel.upper()} to {number}"
+		send = self._twilio_make_call_async if channel == "call" else self._twilio_send_sms_async
+		durable = self._durable
+
+		async def job() -> bool:
+			loop = asyncio.get_running_loop()
+			if durable is not None:
+				try:
+					await asyncio.wrap_future(durable)
+				except Exception as exc:
+					# Notify anyway; the guardian matters more than the log row
+					print(f"[server] event log write failed before {label}: {exc}")
+			ok = await self._with_retries_async(lambda: send(number, body), label, channel)
+			if keys and self.outbox is not None:
+				mark = self.outbox.mark_sent if ok else self.outbox.mark_failed
+				await loop.run_in_executor(self._storage, mark, keys)
+			return ok
+
+		self.dispatcher.submit(channel, job, label, priority)
+
+	async def _with_retries_async(self, func, label: str, channel: str = "sms") -> bool:
+		# _with_retries with the backoff awaited instead of slept
+		latency = self._m_provider.labels(channel)
+		delay = 1.0
+		for attempt in range(1, self.retry_attempts + 1):
+			if attempt > 1:
+				self._m_retries.labels(channel).inc()
+			start = time.perf_counter()
+			try:
+				await func()
+				latency.observe(time.perf_counter() - start)
+				return True
+			except Exception as exc:
+				latency.observe(time.perf_counter() - start)
+				print(f"[server] {label} failed (attempt {attempt}): {exc}")
+				if attempt < self.retry_attempts:
+					await asyncio.sleep(delay)
+					delay *= 2
+		self._m_failures.labels(channel).inc()
+		return False
+
+	async def _twilio_send_sms_async(self, number: str, body: str) -> None:
+		msg = await self.twilio.messages.create_async(body=body, from_=self.twilio_from, to=number)  # type: ignore
+		print(f"[server] SMS sent to {number} sid={msg.sid}")
+
+	async def _twilio_make_call_async(self, number: str, twiml: str) -> None:
+		call = await self.twilio.calls.create_async(to=number, from_=self.twilio_from, twiml=twiml)  # type: ignore
+		print(f"[server] Call initiated to {number} sid={call.sid}")
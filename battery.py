@@ -0,0 +1,190 @@
+import math
+import threading
+import time
+from typing import Optional
+
+
+# Per-device battery tracking for the status ingestion path. Each device
+# keeps one fixed-slot record: an exponentially weighted least-squares fit of
+# battery level against time (weighted Welford sums, so an update is O(1) and
+# older samples fade out with half_life_seconds), plus the alert level it has
+# already been warned about.
+#
+# Levels: "low" when the level is at or below low_percent, or the fit predicts
+# less than warn_hours until empty; "critical" at or below critical_percent.
+# A device is alerted once per level as it gets worse and re-armed only when
+# it recovers (back to recover_percent with more than twice warn_hours left,
+# i.e. it was charged), so a ring sitting at 5% does not page its guardians
+# on every heartbeat. A jump up of charge_jump_percent or more is treated as
+# a charge and restarts the fit, since charging and discharging samples would
+# average into nonsense.
+
+LEVEL_OK = 0
+LEVEL_LOW = 1
+LEVEL_CRITICAL = 2
+
+LEVEL_NAMES = {LEVEL_OK: "ok", LEVEL_LOW: "low", LEVEL_CRITICAL: "critical"}
+
+
+class BatteryEstimate:
+	__slots__ = ("percent", "drain_per_hour", "hours_left")
+
+	def __init__(self, percent: float, drain_per_hour: Optional[float], hours_left: Optional[float]):
+		self.percent = percent
+		self.drain_per_hour = drain_per_hour
+		self.hours_left = hours_left
+
+	def describe(self) -> str:
+		text = f"{self.percent:.0f}%"
+		if self.hours_left is not None:
+			text += f", about {_duration(self.hours_left)} left at {self.drain_per_hour:.1f}%/h"
+		return text
+
+	def as_dict(self) -> dict:
+		return {name: getattr(self, name) for name in self.__slots__}
+
+
+class BatteryAlert:
+	__slots__ = ("device_id", "level", "estimate")
+
+	def __init__(self, device_id: str, level: int, estimate: BatteryEstimate):
+		self.device_id = device_id
+		self.level = level
+		self.estimate = estimate
+
+	@property
+	def name(self) -> str:
+		return LEVEL_NAMES[self.level]
+
+	def describe(self) -> str:
+		prefix = "Critical battery" if self.level == LEVEL_CRITICAL else "Low battery"
+		return f"{prefix} alert for {self.device_id} ({self.estimate.describe()}). Consider charging."
+
+
+def _duration(hours: float) -> str:
+	if hours < 1:
+		return f"{max(1, round(hours * 60))} min"
+	return f"{hours:.1f} h"
+
+
+class _Cell:
+	__slots__ = ("weight", "mean_t", "mean_b", "c_tt", "c_tb", "first", "last", "percent", "alerted")
+
+	def __init__(self, now: float, percent: float):
+		self.alerted = LEVEL_OK
+		self.reset(now, percent)
+
+	def reset(self, now: float, percent: float) -> None:
+		self.weight = 1.0
+		self.mean_t = now
+		self.mean_b = percent
+		self.c_tt = 0.0
+		self.c_tb = 0.0
+		self.first = now
+		self.last = now
+		self.percent = percent
+
+
+class BatteryTracker:
+	def __init__(
+		self,
+		low_percent: float = 10.0,
+		critical_percent: float = 5.0,
+		recover_percent: float = 20.0,
+		warn_hours: float = 2.0,
+		half_life_seconds: float = 3600.0,
+		min_span_seconds: float = 600.0,
+		charge_jump_percent: float = 5.0,
+	):
+		self.low_percent = low_percent
+		self.critical_percent = critical_percent
+		self.recover_percent = max(recover_percent, low_percent)
+		self.warn_hours = warn_hours
+		self.half_life_seconds = half_life_seconds
+		self.min_span_seconds = min_span_seconds
+		self.charge_jump_percent = charge_jump_percent
+		self._cells: dict[str, _Cell] = {}
+		self._lock = threading.Lock()
+		self.alerts = {name: 0 for name in LEVEL_NAMES.values() if name != "ok"}
+		self.charges = 0
+
+	def __len__(self) -> int:
+		return len(self._cells)
+
+	def update(self, device_id: str, percent: float, now: Optional[float] = None) -> Optional[BatteryAlert]:
+		# Returns an alert only when the device gets worse than it was last warned about
+		now = time.time() if now is None else now
+		with self._lock:
+			cell = self._cells.get(device_id)
+			if cell is None:
+				cell = self._cells[device_id] = _Cell(now, percent)
+			elif percent - cell.percent >= self.charge_jump_percent:
+				self.charges += 1
+				cell.reset(now, percent)
+			elif now > cell.last:
+				decay = 0.5 ** ((now - cell.last) / self.half_life_seconds) if self.half_life_seconds > 0 else 1.0
+				cell.weight = cell.weight * decay + 1.0
+				cell.c_tt *= decay
+				cell.c_tb *= decay
+				dt = now - cell.mean_t
+				cell.mean_t += dt / cell.weight
+				cell.mean_b += (percent - cell.mean_b) / cell.weight
+				cell.c_tt += dt * (now - cell.mean_t)
+				cell.c_tb += dt * (percent - cell.mean_b)
+				cell.last = now
+				cell.percent = percent
+			else:
+				cell.percent = percent
+			estimate = self._estimate(cell, now)
+			level = self._level(estimate)
+			if cell.alerted and self._recovered(estimate):
+				cell.alerted = LEVEL_OK
+			if level <= cell.alerted:
+				return None
+			cell.alerted = level
+			self.alerts[LEVEL_NAMES[level]] += 1
+			return BatteryAlert(device_id, level, estimate)
+
+	def _estimate(self, cell: _Cell, now: float) -> BatteryEstimate:
+		drain = hours = None
+		if now - cell.first >= self.min_span_seconds and cell.c_tt > 0:
+			slope = cell.c_tb / cell.c_tt
+			if slope < 0:
+				drain = -slope * 3600.0
+				level = cell.mean_b + slope * (now - cell.mean_t)
+				hours = max(0.0, min(level, cell.percent)) / drain
+		return BatteryEstimate(cell.percent, None if drain is None else round(drain, 2), None if hours is None else round(hours, 2))
+
+	def _level(self, estimate: BatteryEstimate) -> int:
+		if estimate.percent <= self.critical_percent:
+			return LEVEL_CRITICAL
+		if estimate.percent <= self.low_percent:
+			return LEVEL_LOW
+		if estimate.hours_left is not None and estimate.hours_left <= self.warn_hours:
+			return LEVEL_LOW
+		return LEVEL_OK
+
+	def _recovered(self, estimate: BatteryEstimate) -> bool:
+		# Clear of both triggers by a margin, so a level or a runtime hovering
+		# around its threshold does not alert repeatedly
+		if estimate.percent < self.recover_percent:
+			return False
+		return estimate.hours_left is None or estimate.hours_left > 2 * self.warn_hours
+
+	def estimate(self, device_id: str, now: Optional[float] = None) -> Optional[BatteryEstimate]:
+		with self._lock:
+			cell = self._cells.get(device_id)
+			if cell is None:
+				return None
+			return self._estimate(cell, time.time() if now is None else now)
+
+	def stats(self) -> dict:
+		return {"devices": len(self._cells), "alerts": dict(self.alerts), "charges": self.charges}
+
+
+def parse_percent(value) -> Optional[float]:
+	try:
+		percent = float(value)
+	except (TypeError, ValueError):
+		return None
+	return percent if math.isfinite(percent) else None
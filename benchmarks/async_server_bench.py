@@ -0,0 +1,121 @@
+import argparse
+import contextlib
+import io
+import json
+import tempfile
+import threading
+import time
+
+from aioserver import AsyncSosServer
+from benchmarks.local_broker import LocalBroker
+from benchmarks.mock_twilio import MockTwilio
+from benchmarks.sos_latency import SOS_BODY, _Probe, _git_version, _pcts, _wait_subscribed
+from server import SosServer, load_config
+
+
+# A burst of SOS from many devices at once against a slow provider (several
+# seconds per request), in sync and asyncio mode. ACKs never wait on Twilio in
+# either mode; what differs is how many sends can be waiting at the same time:
+# NOTIFY_WORKERS threads vs NOTIFY_ASYNC_CONCURRENCY tasks.
+
+
+def run_mode(broker: LocalBroker, mode: str, args: argparse.Namespace) -> dict:
+	with tempfile.TemporaryDirectory() as tmp:
+		config = load_config()
+		config.update({
+			"broker_host": "127.0.0.1",
+			"broker_port": broker.port,
+			"emergency_numbers": [f"+1555000{i:04d}" for i in range(args.recipients)],
+			"rate_limit_seconds": 0,
+			"notify_coalesce_seconds": 0.0,
+			"notify_workers": args.notify_workers,
+			"notify_async_concurrency": args.concurrency,
+			"notify_queue_size": max(1000, args.devices * args.recipients),
+			"store_dir": tmp,
+			"metrics_port": 0,
+			"metrics_file": "",
+			"client_id": f"async-bench-{mode}",
+		})
+		server = AsyncSosServer(config) if mode == "asyncio" else SosServer(config)
+		mock = server.twilio = MockTwilio(latency=args.twilio_latency, jitter=args.twilio_jitter)
+		server_thread = threading.Thread(target=server.run, name="sos-server", daemon=True)
+		server_thread.start()
+		_wait_subscribed(broker, server.client_id)
+
+		probes = [_Probe("127.0.0.1", broker.port, f"{mode}-probe-{i:04d}", 13.0827, 80.2707) for i in range(args.devices)]
+		for probe in probes:
+			probe.connect()
+		time.sleep(1.0)
+
+		sent: dict[tuple[str, str], float] = {}
+		burst = time.monotonic()
+		for probe in probes:
+			ts, at = probe.timed_sos()
+			sent[(probe.device_id, ts)] = at
+
+		expected = len(sent) * args.recipients
+		deadline = time.monotonic() + args.drain
+		while time.monotonic() < deadline:
+			if sum(len(p.pending) for p in probes) == 0 and len(mock.sent) >= expected:
+				break
+			time.sleep(0.05)
+		elapsed = time.monotonic() - burst
+		for probe in probes:
+			probe.disconnect()
+		server.stop()
+		server_thread.join(timeout=5.0)
+
+	ack_rtts = [rtt for p in probes for rtt in p.rtts]
+	notify = []
+	for kind, _, body, done in mock.sent:
+		match = SOS_BODY.match(body) if kind == "sms" else None
+		if match and (match.group(1), match.group(2)) in sent:
+			notify.append(done - sent[(match.group(1), match.group(2))])
+	return {
+		"mode": mode,
+		"sos_sent": len(sent),
+		"acks": len(ack_rtts),
+		"ack_ms": _pcts(ack_rtts),
+		"notifications": len(notify),
+		"notify_ms": _pcts(notify),
+		"all_notified_s": round(max(notify), 2) if len(notify) >= expected else None,
+		"elapsed_s": round(elapsed, 2),
+		"dispatcher": server.dispatcher.stats(),
+	}
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="Concurrent SOS with a slow provider: sync vs asyncio server mode, fully offline")
+	parser.add_argument("--modes", default="sync,asyncio", help="Comma-separated server modes to run")
+	parser.add_argument("--devices", type=int, default=50, help="Devices pressing SOS at the same moment")
+	parser.add_argument("--recipients", type=int, default=2, help="Emergency numbers per SOS")
+	parser.add_argument("--twilio-latency", type=float, default=3.0, help="Seconds per provider request")
+	parser.add_argument("--twilio-jitter", type=float, default=0.0)
+	parser.add_argument("--notify-workers", type=int, default=4, help="Dispatcher threads in sync mode")
+	parser.add_argument("--concurrency", type=int, default=100, help="Dispatcher tasks in asyncio mode")
+	parser.add_argument("--drain", type=float, default=300.0, help="Max seconds to wait for every notification")
+	parser.add_argument("--json", help="Write results to this file")
+	parser.add_argument("--verbose", action="store_true", help="Show server/device console output")
+	args = parser.parse_args()
+
+	broker = LocalBroker().start()
+	runs = []
+	for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+		sink = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+		with sink:
+			result = run_mode(broker, mode, args)
+		runs.append(result)
+		print(
+			f"{mode:8s} {result['sos_sent']} SOS x {args.recipients} recipients at {args.twilio_latency}s/request: "
+			f"ACK p50/p99 = {result['ack_ms']['p50']}/{result['ack_ms']['p99']} ms, "
+			f"notified p50/p99 = {result['notify_ms']['p50'] / 1000:.2f}/{result['notify_ms']['p99'] / 1000:.2f} s, "
+			f"all {result['notifications']} sent after {result['all_notified_s']} s"
+		)
+	broker.stop()
+	if args.json:
+		with open(args.json, "w", encoding="utf-8") as f:
+			json.dump({"version": _git_version(), "params": {k: v for k, v in vars(args).items() if k not in ("json", "verbose")}, "runs": runs}, f, indent=2)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,53 @@
+import argparse
+import random
+import time
+
+from battery import BatteryTracker
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="Battery tracker cost per heartbeat and alerts vs the fixed 10% threshold")
+	parser.add_argument("--devices", type=int, default=10000)
+	parser.add_argument("--hours", type=float, default=8.0, help="Simulated time")
+	parser.add_argument("--interval", type=float, default=60.0, help="Seconds between heartbeats")
+	parser.add_argument("--min-drain", type=float, default=2.0, help="Slowest drain in %%/hour")
+	parser.add_argument("--max-drain", type=float, default=25.0, help="Fastest drain in %%/hour")
+	parser.add_argument("--floor", type=float, default=5.0, help="Reported level stops here (the simulators clamp at 5%%)")
+	parser.add_argument("--seed", type=int, default=1)
+	args = parser.parse_args()
+
+	rng = random.Random(args.seed)
+	fleet = [(f"ring-{i}", rng.uniform(30, 100), rng.uniform(args.min_drain, args.max_drain)) for i in range(args.devices)]
+	steps = int(args.hours * 3600 / args.interval)
+	beats = []
+	for step in range(steps):
+		now = step * args.interval
+		for device_id, start, drain in fleet:
+			# Whole percents, as devices report them
+			beats.append((device_id, float(max(args.floor, round(start - drain * now / 3600))), now))
+
+	tracker = BatteryTracker()
+	alerts = []
+	t0 = time.perf_counter()
+	for device_id, percent, now in beats:
+		alert = tracker.update(device_id, percent, now)
+		if alert is not None:
+			alerts.append((alert, now))
+	elapsed = time.perf_counter() - t0
+
+	threshold = sum(1 for _, percent, _ in beats if percent <= 10)
+	drains = {device_id: (start, drain) for device_id, start, drain in fleet}
+	lead = []
+	for alert, now in alerts:
+		if alert.name == "low":
+			start, drain = drains[alert.device_id]
+			lead.append(start / drain - now / 3600)
+	lead.sort()
+	print(f"update: {len(beats) / elapsed:,.0f} heartbeats/s ({elapsed / len(beats) * 1e9:.0f} ns each) over {args.devices} devices")
+	print(f"alerts: {len(alerts)} from the tracker {tracker.stats()['alerts']}, vs {threshold} from a per-heartbeat <=10% check")
+	if lead:
+		print(f"low alert lead time before empty: min {lead[0]:.2f} h, median {lead[len(lead) // 2]:.2f} h, max {lead[-1]:.2f} h")
+
+
+if __name__ == "__main__":
+	main()
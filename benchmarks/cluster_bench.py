@@ -0,0 +1,160 @@
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import paho.mqtt.client as mqtt
+
+from benchmarks.local_broker import LocalBroker
+
+
+def _worker(port: int, mode: str, workers: int, index: int, counts, ready, store_dir: str) -> None:
+	from server import SosServer, load_config, worker_config
+
+	config = load_config()
+	config.update({
+		"broker_host": "127.0.0.1",
+		"broker_port": port,
+		"cluster_mode": mode,
+		"cluster_workers": workers,
+		"emergency_numbers": [],
+		"store_dir": store_dir,
+		"metrics_port": 0,
+		"metrics_file": "",
+		"offline_grace_multiple": 0,
+	})
+	with contextlib.redirect_stdout(io.StringIO()):
+		server = SosServer(worker_config(config, index))
+	status = server._m_messages["status"]
+
+	def report() -> None:
+		while True:
+			counts[index] = int(status.value)
+			time.sleep(0.02)
+
+	threading.Thread(target=report, daemon=True).start()
+	server.client.on_subscribe = lambda *args: ready.release()
+	with contextlib.redirect_stdout(io.StringIO()):
+		server.run()
+
+
+def _broker(port_queue) -> None:
+	broker = LocalBroker().start()
+	port_queue.put(broker.port)
+	threading.Event().wait()
+
+
+def _publisher(port: int, start: int, count: int, devices: int, go) -> None:
+	client = mqtt.Client(client_id=f"cluster-bench-pub-{start}")
+	client.connect("127.0.0.1", port, keepalive=60)
+	client.loop_start()
+	payloads = []
+	for i in range(start, start + count):
+		device_id = f"bench-ring-{i % devices:06d}"
+		body = {"deviceId": device_id, "ts": "2024-01-01T00:00:00+00:00", "state": "armed", "batteryPercent": 80, "lat": 13.08, "lon": 80.27}
+		payloads.append((f"wearable/{device_id}/status", json.dumps(body)))
+	go.wait()
+	for topic, payload in payloads:
+		client.publish(topic, payload, qos=0)
+	time.sleep(1.0)
+	client.loop_stop()
+	client.disconnect()
+
+
+def run(port: int, mode: str, workers: int, messages: int, devices: int, publishers: int, timeout: float) -> dict:
+	ctx = multiprocessing.get_context("spawn")
+	counts = ctx.Array("q", workers)
+	ready = ctx.Semaphore(0)
+	go = ctx.Event()
+	with tempfile.TemporaryDirectory() as tmp:
+		procs = [
+			ctx.Process(target=_worker, args=(port, mode, workers, i, counts, ready, tmp), daemon=True)
+			for i in range(workers)
+		]
+		for proc in procs:
+			proc.start()
+		# Three subscriptions per worker
+		for _ in range(workers * 3):
+			ready.acquire(timeout=30)
+		per_pub = messages // publishers
+		pubs = [
+			ctx.Process(target=_publisher, args=(port, i * per_pub, per_pub, devices, go), daemon=True)
+			for i in range(publishers)
+		]
+		for pub in pubs:
+			pub.start()
+		time.sleep(1.0)
+		total = per_pub * publishers
+		start = time.perf_counter()
+		go.set()
+		while sum(counts) < total and time.perf_counter() - start < timeout:
+			time.sleep(0.01)
+		elapsed = time.perf_counter() - start
+		handled = sum(counts)
+		per_worker = list(counts)
+		for proc in pubs + procs:
+			proc.terminate()
+			proc.join()
+	return {
+		"mode": mode,
+		"workers": workers,
+		"messages": total,
+		"handled": handled,
+		"seconds": round(elapsed, 3),
+		"status_per_sec": round(handled / elapsed),
+		"per_worker": per_worker,
+	}
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="Status throughput vs clustered worker count against a local broker")
+	parser.add_argument("--workers", default="1,2,4", help="Comma-separated worker counts")
+	parser.add_argument("--modes", default="shared,partition")
+	parser.add_argument("--messages", type=int, default=40000)
+	parser.add_argument("--devices", type=int, default=5000)
+	parser.add_argument("--publishers", type=int, default=2)
+	parser.add_argument("--broker-port", type=int, default=0, help="Use an external broker on 127.0.0.1:PORT instead of the in-process one")
+	parser.add_argument("--timeout", type=float, default=60.0)
+	parser.add_argument("--json", help="Write results to this file")
+	args = parser.parse_args()
+
+	# The in-process broker gets its own process so it does not share a GIL
+	# with this coordinator. It is single-threaded and caps out around 20k
+	# msg/s; point --broker-port at mosquitto/EMQX to measure beyond that.
+	broker = None
+	port = args.broker_port
+	if not port:
+		ctx = multiprocessing.get_context("spawn")
+		port_queue = ctx.Queue()
+		broker = ctx.Process(target=_broker, args=(port_queue,), daemon=True)
+		broker.start()
+		port = port_queue.get(timeout=10)
+	results = []
+	try:
+		for mode in args.modes.split(","):
+			baseline = None
+			for workers in (int(w) for w in args.workers.split(",")):
+				result = run(port, mode, workers, args.messages, args.devices, args.publishers, args.timeout)
+				baseline = baseline or result["status_per_sec"] / workers
+				result["scaling_efficiency"] = round(result["status_per_sec"] / (baseline * workers), 2)
+				results.append(result)
+				print(
+					f"{mode:>9} workers={workers}: {result['status_per_sec']:>8} status/s "
+					f"(handled {result['handled']}/{result['messages']}, efficiency {result['scaling_efficiency']}) "
+					f"per worker={result['per_worker']}"
+				)
+	finally:
+		if broker is not None:
+			broker.terminate()
+			broker.join()
+	if args.json:
+		Path(args.json).write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,57 @@
+import argparse
+import json
+import time
+
+import codec
+
+
+def sample_messages() -> dict[str, dict]:
+	base = {"deviceId": "sim-ring-3f9a2c", "ts": "2024-01-01T12:00:00.123456+00:00", "batteryPercent": 76, "lat": 13.082712, "lon": 80.270655}
+	return {
+		"status": dict(base, state="armed"),
+		"sos": dict(base, type="SOS", reason="double_tap", mapsUrl="https://maps.google.com/?q=13.082712,80.270655"),
+		"tamper": {"deviceId": base["deviceId"], "ts": base["ts"], "type": "TAMPER", "reason": "case_open", "batteryPercent": 76},
+	}
+
+
+def per_msg_ns(func, payload: bytes, ops: int, repeat: int = 3) -> float:
+	# Best of a few runs, so scheduler noise does not decide the comparison
+	best = float("inf")
+	for _ in range(repeat):
+		start = time.perf_counter()
+		for _ in range(ops):
+			func(payload)
+		best = min(best, time.perf_counter() - start)
+	return best / ops * 1e9
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="Decode cost and wire size per payload format")
+	parser.add_argument("--ops", type=int, default=200000)
+	parser.add_argument("--json", help="Write results to this file")
+	args = parser.parse_args()
+
+	backends = ["json"] + (["orjson"] if codec.orjson is not None else [])
+	results = []
+	for kind, message in sample_messages().items():
+		json_payload = codec.encode(kind, message, "json")
+		binary_payload = codec.encode(kind, message, "binary")
+		# The pre-codec server path, for reference
+		rows = [("legacy json.loads", len(json_payload), per_msg_ns(lambda p: json.loads(p.decode("utf-8")), json_payload, args.ops))]
+		for backend in backends:
+			codec.use_json_backend(backend)
+			rows.append((f"{backend} + validate", len(json_payload), per_msg_ns(lambda p: codec.decode(kind, p), json_payload, args.ops)))
+		rows.append(("binary + validate", len(binary_payload), per_msg_ns(lambda p: codec.decode(kind, p), binary_payload, args.ops)))
+		validate = codec.VALIDATORS[kind]
+		rows.append(("validate only", 0, per_msg_ns(lambda p: validate(message), b"", args.ops)))
+		for name, size, ns in rows:
+			print(f"{kind:>6} {name:<20} {size:>4} B  {ns:8.1f} ns/msg")
+			results.append({"kind": kind, "format": name, "bytes": size, "ns_per_msg": round(ns, 1)})
+	codec.use_json_backend("auto")
+	if args.json:
+		with open(args.json, "w", encoding="utf-8") as f:
+			json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,79 @@
+import argparse
+import random
+import time
+
+from geofence import ANY_DEVICE, Fence, GeofenceEngine
+
+
+def make_fences(count: int, devices: int, shared: int, rng: random.Random, center: tuple[float, float], spread: float) -> list[Fence]:
+	# Mostly per-device circles (home, school, ...) plus a few zones for every
+	# device, with one square polygon in ten
+	fences = []
+	for i in range(count):
+		owner = ANY_DEVICE if i < shared else f"ring-{rng.randrange(devices)}"
+		kind = "danger" if rng.random() < 0.3 else "safe"
+		lat = center[0] + rng.uniform(-spread, spread)
+		lon = center[1] + rng.uniform(-spread, spread)
+		if i % 10 == 0:
+			d = rng.uniform(0.001, 0.005)
+			polygon = [(lat - d, lon - d), (lat - d, lon + d), (lat + d, lon + d), (lat + d, lon - d)]
+			fences.append(Fence(f"f{i}", kind, device_id=owner, polygon=polygon))
+		else:
+			fences.append(Fence(f"f{i}", kind, device_id=owner, lat=lat, lon=lon, radius_m=rng.uniform(50, 500)))
+	return fences
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="Geofence checks per second with a grid index vs testing every fence")
+	parser.add_argument("--fences", type=int, default=100000)
+	parser.add_argument("--devices", type=int, default=10000)
+	parser.add_argument("--shared", type=int, default=100, help="Fences that apply to every device")
+	parser.add_argument("--checks", type=int, default=200000)
+	parser.add_argument("--spread", type=float, default=0.5, help="Half-width in degrees of the area fences and fixes fall in")
+	parser.add_argument("--cell", type=float, default=0.01, help="Grid cell size in degrees")
+	parser.add_argument("--verify", type=int, default=500, help="Checks to compare against a brute-force scan")
+	parser.add_argument("--seed", type=int, default=1)
+	args = parser.parse_args()
+
+	rng = random.Random(args.seed)
+	center = (13.0827, 80.2707)
+	fences = make_fences(args.fences, args.devices, args.shared, rng, center, args.spread)
+	engine = GeofenceEngine(args.cell)
+	start = time.perf_counter()
+	for fence in fences:
+		engine.add(fence)
+	build = time.perf_counter() - start
+
+	fixes = [
+		(f"ring-{rng.randrange(args.devices)}", center[0] + rng.uniform(-args.spread, args.spread), center[1] + rng.uniform(-args.spread, args.spread))
+		for _ in range(args.checks)
+	]
+	events = 0
+	start = time.perf_counter()
+	for device_id, lat, lon in fixes:
+		events += len(engine.check(device_id, lat, lon))
+	elapsed = time.perf_counter() - start
+	stats = engine.stats()
+
+	by_owner: dict[str, list[Fence]] = {}
+	for fence in fences:
+		by_owner.setdefault(fence.device_id, []).append(fence)
+	mismatches = 0
+	brute_start = time.perf_counter()
+	for device_id, lat, lon in fixes[: args.verify]:
+		expected = {f.fence_id for f in by_owner.get(device_id, []) + by_owner.get(ANY_DEVICE, []) if f.contains(lat, lon)}
+		engine.check(device_id, lat, lon)
+		if {f.fence_id for f in engine.inside(device_id)} != expected:
+			mismatches += 1
+	brute = (time.perf_counter() - brute_start) / max(1, min(args.verify, len(fixes)))
+
+	print(f"index: {stats['fences']} fences in {stats['cells']} cells, built in {build:.2f}s")
+	print(
+		f"check: {args.checks / elapsed:,.0f} checks/s ({elapsed / args.checks * 1e6:.1f} us each, "
+		f"{stats['tests_per_check']} exact tests per check), {events} transitions"
+	)
+	print(f"brute force (per-device list scan): {1 / brute:,.0f} checks/s; mismatches vs index: {mismatches}/{args.verify}")
+
+
+if __name__ == "__main__":
+	main()
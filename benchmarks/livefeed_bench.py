@@ -0,0 +1,149 @@
+import argparse
+import multiprocessing
+import random
+import selectors
+import socket
+import time
+
+from device_sim import percentile
+from livefeed import LiveFeed
+from registry import DeviceRegistry
+
+
+# Fan-out of the dashboard feed to many local SSE subscribers while a
+# producer thread applies heartbeats at a fixed rate, as the status path
+# would. Fast subscribers measure tick -> receive latency from the "t" stamp
+# of each delta; slow ones never read, to show they are resynced (or cut off)
+# without holding back ingestion or the other subscribers. Subscribers run in
+# a child process.
+
+
+def _read_feeds(port: int, fast: int, slow: int, filtered: float, devices: int, seed: int, ready, stop, results) -> None:
+	# Runs in a child process so the subscribers do not share a GIL with the feed
+	rng = random.Random(seed)
+	selector = selectors.DefaultSelector()
+	stuck = []
+	for i in range(fast + slow):
+		query = ""
+		# Stuck subscribers watch the whole fleet, the worst case for backpressure
+		if i < fast and rng.random() < filtered:
+			query = "?devices=" + ",".join(f"ring-{rng.randrange(devices)}" for _ in range(10))
+		sock = socket.create_connection(("127.0.0.1", port))
+		if i >= fast:
+			# Tiny receive window and never read: a stuck dashboard tab
+			sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+			stuck.append(sock)
+		sock.sendall(f"GET /feed{query} HTTP/1.1\r\nHost: bench\r\n\r\n".encode())
+		if i < fast:
+			sock.setblocking(False)
+			selector.register(sock, selectors.EVENT_READ, [b""])
+	ready.set()
+	latencies = []
+	frames = received = closed = 0
+	while not stop.is_set():
+		for key, _ in selector.select(0.1):
+			try:
+				data = key.fileobj.recv(65536)
+			except (BlockingIOError, InterruptedError):
+				continue
+			except OSError:
+				data = b""
+			if not data:
+				selector.unregister(key.fileobj)
+				closed += 1
+				continue
+			now = time.time()
+			received += len(data)
+			*done, key.data[0] = (key.data[0] + data).split(b"\n\n")
+			for frame in done:
+				frames += 1
+				if frame.startswith(b"event: delta"):
+					start = frame.index(b'{"t":') + 5
+					latencies.append(now - float(frame[start:frame.index(b",", start)]))
+	results.put((latencies, frames, received, closed))
+	for sock in stuck:
+		sock.close()
+
+
+def _produce(registry: DeviceRegistry, feed, devices: int, rate: float, seconds: float, rng: random.Random) -> tuple[int, float]:
+	# Heartbeats at `rate` per second; returns (applied, seconds spent in registry + feed calls)
+	applied = 0
+	busy = 0.0
+	batch = max(1, int(rate / 100))
+	start = time.monotonic()
+	while True:
+		now = time.monotonic()
+		if now - start >= seconds:
+			break
+		t0 = time.perf_counter()
+		for _ in range(batch):
+			device_id = f"ring-{rng.randrange(devices)}"
+			registry.update_status(device_id, None, "armed", rng.randint(20, 100), 13.0 + rng.random() / 10, 80.2 + rng.random() / 10)
+			if feed is not None:
+				feed.touch(device_id)
+			applied += 1
+		busy += time.perf_counter() - t0
+		# Pace to the target rate
+		ahead = applied / rate - (time.monotonic() - start)
+		if ahead > 0:
+			time.sleep(ahead)
+	return applied, busy
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="Dashboard feed fan-out to many local SSE subscribers")
+	parser.add_argument("--subscribers", type=int, default=1000)
+	parser.add_argument("--slow", type=int, default=20, help="Of which never read (unfiltered)")
+	parser.add_argument("--filtered", type=float, default=0.95, help="Share of subscribers filtering on 10 devices (guardians); the rest see the whole fleet (operations desk)")
+	parser.add_argument("--devices", type=int, default=10000)
+	parser.add_argument("--rate", type=float, default=5000.0, help="Heartbeats per second applied by the producer (every one moves its ring)")
+	parser.add_argument("--seconds", type=float, default=20.0, help="Long enough for stuck subscribers to fill their socket buffers")
+	parser.add_argument("--tick", type=float, default=0.5)
+	parser.add_argument("--max-buffer", type=int, default=256 * 1024)
+	parser.add_argument("--stall", type=float, default=30.0)
+	parser.add_argument("--seed", type=int, default=1)
+	args = parser.parse_args()
+
+	rng = random.Random(args.seed)
+	baseline_registry = DeviceRegistry()
+	applied, busy = _produce(baseline_registry, None, args.devices, args.rate, min(3.0, args.seconds), rng)
+	baseline_ns = busy / applied * 1e9
+
+	registry = DeviceRegistry()
+	for i in range(args.devices):
+		registry.update_status(f"ring-{i}", None, "armed", 100, 13.0, 80.2)
+	feed = LiveFeed(registry, tick_seconds=args.tick, max_buffer=args.max_buffer, stall_seconds=args.stall)
+	feed.start()
+	ready, stop, results = multiprocessing.Event(), multiprocessing.Event(), multiprocessing.Queue()
+	readers = multiprocessing.Process(
+		target=_read_feeds,
+		args=(feed.port, args.subscribers - args.slow, args.slow, args.filtered, args.devices, args.seed, ready, stop, results),
+	)
+	readers.start()
+	ready.wait(30.0)
+	deadline = time.monotonic() + 10.0
+	while len(feed) < args.subscribers and time.monotonic() < deadline:
+		time.sleep(0.05)
+	applied, busy = _produce(registry, feed, args.devices, args.rate, args.seconds, rng)
+	time.sleep(2 * args.tick)
+	stats = feed.stats()
+	stop.set()
+	latencies, frames, received, closed = results.get(timeout=30.0)
+	readers.join(timeout=10.0)
+	feed.stop()
+
+	latencies = sorted(latencies)
+	print(f"{args.subscribers} subscribers ({args.slow} never reading, {args.filtered:.0%} filtered), {args.devices} devices, tick {args.tick}s")
+	print(
+		f"ingestion: {applied / args.seconds:,.0f} heartbeats/s applied (target {args.rate:,.0f}); "
+		f"{busy / applied * 1e9:.0f} ns per heartbeat with the feed vs {baseline_ns:.0f} ns without"
+	)
+	print(
+		f"fan-out: {frames:,} frames, {received / 1e6:.1f} MB to reading subscribers ({closed} closed); "
+		f"tick -> receive p50/p99 = {percentile(latencies, 50) * 1000:.1f}/{percentile(latencies, 99) * 1000:.1f} ms over {len(latencies):,} deltas"
+	)
+	print(f"feed: {stats}")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,261 @@
+import argparse
+import asyncio
+import itertools
+import struct
+import threading
+
+
+# Minimal in-process MQTT 3.1.1 broker for offline benchmarks. Supports
+# CONNECT, PUBLISH (QoS 0/1), SUBSCRIBE/UNSUBSCRIBE with + and # wildcards,
+# $share/<group>/<filter> shared subscriptions (round-robin), PINGREQ and
+# DISCONNECT. No retained messages, QoS 2, auth or session persistence.
+# stop() drops every client connection, so stop() + start() on the same port
+# behaves like a broker restart (clients must reconnect and resubscribe).
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+	f_parts = topic_filter.split("/")
+	t_parts = topic.split("/")
+	for i, part in enumerate(f_parts):
+		if part == "#":
+			return True
+		if i >= len(t_parts):
+			return False
+		if part != "+" and part != t_parts[i]:
+			return False
+	return len(f_parts) == len(t_parts)
+
+
+def _encode_length(length: int) -> bytes:
+	out = bytearray()
+	while True:
+		byte = length % 128
+		length //= 128
+		if length:
+			byte |= 0x80
+		out.append(byte)
+		if not length:
+			return bytes(out)
+
+
+def _utf8(data: bytes, pos: int) -> tuple[str, int]:
+	(size,) = struct.unpack_from("!H", data, pos)
+	pos += 2
+	return data[pos:pos + size].decode("utf-8"), pos + size
+
+
+class _Session:
+	def __init__(self, broker: "LocalBroker", writer: asyncio.StreamWriter):
+		self.broker = broker
+		self.writer = writer
+		self.client_id = ""
+		self.filters: dict[str, int] = {}
+		self._pid = itertools.cycle(range(1, 65536))
+
+	def send(self, packet_type: int, flags: int, body: bytes) -> None:
+		if self.writer.is_closing():
+			return
+		self.writer.write(bytes([(packet_type << 4) | flags]) + _encode_length(len(body)) + body)
+
+	def deliver(self, topic: str, payload: bytes, qos: int) -> None:
+		encoded = topic.encode("utf-8")
+		body = struct.pack("!H", len(encoded)) + encoded
+		if qos:
+			body += struct.pack("!H", next(self._pid))
+		self.send(PUBLISH, qos << 1, body + payload)
+		self.broker.delivered += 1
+
+
+class LocalBroker:
+	def __init__(self, host: str = "127.0.0.1", port: int = 0):
+		self.host = host
+		self.port = port
+		self.sessions: dict[str, _Session] = {}
+		self._connections: set[_Session] = set()
+		# filter -> {session: qos}; exact topics go in their own dict
+		self._exact: dict[str, dict[_Session, int]] = {}
+		self._wild: dict[str, dict[_Session, int]] = {}
+		self._shared: dict[tuple[str, str], list[tuple[_Session, int]]] = {}
+		self._shared_rr: dict[tuple[str, str], int] = {}
+		self.received = 0
+		self.delivered = 0
+		self._loop: asyncio.AbstractEventLoop | None = None
+		self._server: asyncio.AbstractServer | None = None
+		self._thread: threading.Thread | None = None
+		self._ready = threading.Event()
+
+	def start(self) -> "LocalBroker":
+		self._ready.clear()
+		self._thread = threading.Thread(target=self._run, name="local-broker", daemon=True)
+		self._thread.start()
+		self._ready.wait(5.0)
+		return self
+
+	def stop(self) -> None:
+		if self._loop is not None and self._loop.is_running():
+			asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop)
+		if self._thread is not None:
+			self._thread.join(timeout=2.0)
+			self._thread = None
+
+	async def _shutdown(self) -> None:
+		self._server.close()
+		for session in list(self._connections):
+			session.writer.transport.abort()
+		# Let the connection handlers see the reset and clean up
+		await asyncio.sleep(0.05)
+		self._loop.stop()
+
+	def backlog(self, client_id: str) -> int:
+		# Bytes written to a client that its socket has not accepted yet
+		session = self.sessions.get(client_id)
+		if session is None or session.writer.transport is None:
+			return 0
+		return session.writer.transport.get_write_buffer_size()
+
+	def _run(self) -> None:
+		self._loop = asyncio.new_event_loop()
+		asyncio.set_event_loop(self._loop)
+		self._server = self._loop.run_until_complete(asyncio.start_server(self._handle, self.host, self.port))
+		self.port = self._server.sockets[0].getsockname()[1]
+		self._ready.set()
+		try:
+			self._loop.run_forever()
+		finally:
+			self._server.close()
+			self._loop.close()
+
+	async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+		session = _Session(self, writer)
+		self._connections.add(session)
+		try:
+			while True:
+				header = await reader.readexactly(1)
+				multiplier, length = 1, 0
+				while True:
+					byte = (await reader.readexactly(1))[0]
+					length += (byte & 0x7F) * multiplier
+					multiplier *= 128
+					if not byte & 0x80:
+						break
+				body = await reader.readexactly(length) if length else b""
+				if not self._dispatch(session, header[0] >> 4, header[0] & 0x0F, body):
+					break
+				await writer.drain()
+		except (asyncio.IncompleteReadError, ConnectionError):
+			pass
+		finally:
+			self._connections.discard(session)
+			self._drop(session)
+			writer.close()
+
+	def _dispatch(self, session: _Session, packet_type: int, flags: int, body: bytes) -> bool:
+		if packet_type == PUBLISH:
+			qos = (flags >> 1) & 0x03
+			topic, pos = _utf8(body, 0)
+			if qos:
+				session.send(PUBACK, 0, body[pos:pos + 2])
+				pos += 2
+			self.received += 1
+			self.route(topic, body[pos:], qos)
+		elif packet_type == PUBACK:
+			pass
+		elif packet_type == CONNECT:
+			_, pos = _utf8(body, 0)
+			pos += 4  # level, flags, keepalive
+			session.client_id, _ = _utf8(body, pos)
+			old = self.sessions.get(session.client_id)
+			if old is not None:
+				# Same client id: the broker kicks the older connection
+				self._drop(old)
+				old.writer.close()
+			self.sessions[session.client_id] = session
+			session.send(CONNACK, 0, b"\x00\x00")
+		elif packet_type == SUBSCRIBE:
+			pid = body[:2]
+			pos, granted = 2, bytearray()
+			while pos < len(body):
+				topic_filter, pos = _utf8(body, pos)
+				qos = min(body[pos], 1)
+				pos += 1
+				self._subscribe(session, topic_filter, qos)
+				granted.append(qos)
+			session.send(SUBACK, 0, pid + bytes(granted))
+		elif packet_type == UNSUBSCRIBE:
+			pid = body[:2]
+			pos = 2
+			while pos < len(body):
+				topic_filter, pos = _utf8(body, pos)
+				self._unsubscribe(session, topic_filter)
+			session.send(UNSUBACK, 0, pid)
+		elif packet_type == PINGREQ:
+			session.send(PINGRESP, 0, b"")
+		elif packet_type == DISCONNECT:
+			return False
+		return True
+
+	def _subscribe(self, session: _Session, topic_filter: str, qos: int) -> None:
+		session.filters[topic_filter] = qos
+		if topic_filter.startswith("$share/"):
+			_, group, real = topic_filter.split("/", 2)
+			members = self._shared.setdefault((group, real), [])
+			members[:] = [m for m in members if m[0] is not session] + [(session, qos)]
+		elif "+" in topic_filter or "#" in topic_filter:
+			self._wild.setdefault(topic_filter, {})[session] = qos
+		else:
+			self._exact.setdefault(topic_filter, {})[session] = qos
+
+	def _unsubscribe(self, session: _Session, topic_filter: str) -> None:
+		session.filters.pop(topic_filter, None)
+		if topic_filter.startswith("$share/"):
+			_, group, real = topic_filter.split("/", 2)
+			members = self._shared.get((group, real), [])
+			members[:] = [m for m in members if m[0] is not session]
+		else:
+			for table in (self._exact, self._wild):
+				subs = table.get(topic_filter)
+				if subs is not None:
+					subs.pop(session, None)
+					if not subs:
+						del table[topic_filter]
+
+	def _drop(self, session: _Session) -> None:
+		for topic_filter in list(session.filters):
+			self._unsubscribe(session, topic_filter)
+		if self.sessions.get(session.client_id) is session:
+			del self.sessions[session.client_id]
+
+	def route(self, topic: str, payload: bytes, qos: int) -> None:
+		for session, sub_qos in list(self._exact.get(topic, {}).items()):
+			session.deliver(topic, payload, min(qos, sub_qos))
+		for topic_filter, subs in self._wild.items():
+			if topic_matches(topic_filter, topic):
+				for session, sub_qos in list(subs.items()):
+					session.deliver(topic, payload, min(qos, sub_qos))
+		for key, members in self._shared.items():
+			if members and topic_matches(key[1], topic):
+				idx = self._shared_rr.get(key, 0) % len(members)
+				self._shared_rr[key] = idx + 1
+				session, sub_qos = members[idx]
+				session.deliver(topic, payload, min(qos, sub_qos))
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="Minimal local MQTT broker for offline benchmarks")
+	parser.add_argument("--host", default="127.0.0.1")
+	parser.add_argument("--port", type=int, default=1883)
+	args = parser.parse_args()
+	broker = LocalBroker(args.host, args.port).start()
+	print(f"[broker] listening on {broker.host}:{broker.port} (Ctrl+C to stop)")
+	try:
+		threading.Event().wait()
+	except KeyboardInterrupt:
+		broker.stop()
+
+
+if __name__ == "__main__":
+	main()
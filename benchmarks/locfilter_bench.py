@@ -0,0 +1,53 @@
+import argparse
+import random
+import time
+
+from device_sim import jitter_location
+from locfilter import LocationFilter, distance_m
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="Location filter cost per heartbeat and error vs raw fixes")
+	parser.add_argument("--devices", type=int, default=10000)
+	parser.add_argument("--heartbeats", type=int, default=30, help="Heartbeats per device")
+	parser.add_argument("--interval", type=float, default=10.0, help="Seconds between heartbeats")
+	parser.add_argument("--jitter", type=float, default=25.0, help="GPS noise in metres (as in the simulators)")
+	parser.add_argument("--outliers", type=float, default=0.01, help="Share of fixes replaced by a multipath jump")
+	parser.add_argument("--jump", type=float, default=5000.0, help="Size of an outlier jump in metres")
+	parser.add_argument("--seed", type=int, default=1)
+	args = parser.parse_args()
+
+	rng = random.Random(args.seed)
+	random.seed(args.seed)
+	homes = [(13.0827 + rng.uniform(-0.5, 0.5), 80.2707 + rng.uniform(-0.5, 0.5)) for _ in range(args.devices)]
+	fixes = []
+	outliers = 0
+	for step in range(args.heartbeats):
+		now = step * args.interval
+		for i, (lat, lon) in enumerate(homes):
+			if step and rng.random() < args.outliers:
+				outliers += 1
+				fixes.append((f"ring-{i}", now, lat + args.jump * 0.000009, lon, i))
+			else:
+				fixes.append((f"ring-{i}", now, *jitter_location(lat, lon, meters=args.jitter), i))
+
+	locations = LocationFilter(accuracy_m=args.jitter)
+	raw_error = filtered_error = 0.0
+	caught = 0
+	start = time.perf_counter()
+	results = [locations.update(device_id, lat, lon, now) for device_id, now, lat, lon, _ in fixes]
+	elapsed = time.perf_counter() - start
+	settled = len(fixes) - args.devices
+	for (device_id, now, lat, lon, i), fix in zip(fixes[args.devices:], results[args.devices:]):
+		home_lat, home_lon = homes[i]
+		raw_error += distance_m(home_lat, home_lon, lat, lon)
+		filtered_error += distance_m(home_lat, home_lon, fix.lat, fix.lon)
+		caught += fix.rejected
+
+	print(f"update: {len(fixes) / elapsed:,.0f} fixes/s ({elapsed / len(fixes) * 1e9:.0f} ns each) over {args.devices} devices")
+	print(f"mean error: raw {raw_error / settled:.1f} m, filtered {filtered_error / settled:.1f} m")
+	print(f"outliers: {outliers} injected, {caught} rejected; {locations.stats()}")
+
+
+if __name__ == "__main__":
+	main()
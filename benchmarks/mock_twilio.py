@@ -0,0 +1,139 @@
+import asyncio
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Stand-in for twilio.rest.Client: exposes messages.create / calls.create (and
+# the create_async variants used by SERVER_MODE=asyncio) with configurable
+# latency and failure rate, and records when each send finished.
+class _Result:
+	def __init__(self, sid: str):
+		self.sid = sid
+
+
+class _Resource:
+	def __init__(self, owner: "MockTwilio", kind: str):
+		self._owner = owner
+		self._kind = kind
+
+	def create(self, to: str, from_: str = "", body: str = "", twiml: str = "") -> _Result:
+		return self._owner._send(self._kind, to, body or twiml)
+
+	async def create_async(self, to: str, from_: str = "", body: str = "", twiml: str = "") -> _Result:
+		delay = self._owner._delay()
+		if delay > 0:
+			await asyncio.sleep(delay)
+		return self._owner._record(self._kind, to, body or twiml)
+
+
+class MockTwilio:
+	def __init__(self, latency: float = 0.2, jitter: float = 0.0, failure_rate: float = 0.0):
+		self.latency = latency
+		self.jitter = jitter
+		self.failure_rate = failure_rate
+		self.messages = _Resource(self, "sms")
+		self.calls = _Resource(self, "call")
+		self.sent: list[tuple[str, str, str, float]] = []
+		self.failures = 0
+		self._sid = itertools.count(1)
+		self._lock = threading.Lock()
+
+	def _delay(self) -> float:
+		return self.latency + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+
+	def _send(self, kind: str, to: str, body: str) -> _Result:
+		delay = self._delay()
+		if delay > 0:
+			time.sleep(delay)
+		return self._record(kind, to, body)
+
+	def _record(self, kind: str, to: str, body: str) -> _Result:
+		with self._lock:
+			if random.random() < self.failure_rate:
+				self.failures += 1
+				raise RuntimeError("mock provider failure")
+			self.sent.append((kind, to, body, time.monotonic()))
+			return _Result(f"MOCK{next(self._sid):08d}")
+
+
+class _ApiHandler(BaseHTTPRequestHandler):
+	protocol_version = "HTTP/1.1"
+
+	def handle(self) -> None:
+		# Once per connection: stands in for DNS + TCP + TLS to the real API
+		self.server.owner._connected()
+		if self.server.owner.connect_latency > 0:
+			time.sleep(self.server.owner.connect_latency)
+		super().handle()
+
+	def do_HEAD(self) -> None:
+		self._reply(404, b"")
+
+	def do_POST(self) -> None:
+		owner = self.server.owner
+		self.rfile.read(int(self.headers.get("Content-Length") or 0))
+		owner._request(self.path)
+		if owner.latency > 0:
+			time.sleep(owner.latency)
+		prefix = "CA" if self.path.endswith("/Calls.json") else "SM"
+		self._reply(201, json.dumps({"sid": f"{prefix}{next(owner._sid):032d}", "status": "queued"}).encode())
+
+	def _reply(self, status: int, body: bytes) -> None:
+		self.send_response(status)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		if self.command != "HEAD":
+			self.wfile.write(body)
+
+	def log_message(self, format, *args) -> None:
+		pass
+
+
+# Local HTTP stand-in for the Twilio REST API, for benchmarks that exercise
+# the real twilio client and its connection pool (TWILIO_API_URL). Every new
+# connection is held for connect_latency before the first byte is answered,
+# like a handshake to a remote API edge, and each POST takes latency.
+class MockTwilioHttp:
+	def __init__(self, connect_latency: float = 0.25, latency: float = 0.05, host: str = "127.0.0.1", port: int = 0):
+		self.connect_latency = connect_latency
+		self.latency = latency
+		self.connections = 0
+		self.requests: list[tuple[str, float]] = []
+		self._sid = itertools.count(1)
+		self._lock = threading.Lock()
+		self._server = ThreadingHTTPServer((host, port), _ApiHandler)
+		self._server.daemon_threads = True
+		self._server.owner = self
+		self._thread: threading.Thread | None = None
+
+	@property
+	def url(self) -> str:
+		host, port = self._server.server_address[:2]
+		return f"http://{host}:{port}"
+
+	def start(self) -> "MockTwilioHttp":
+		self._thread = threading.Thread(target=self._server.serve_forever, name="mock-twilio-http", daemon=True)
+		self._thread.start()
+		return self
+
+	def stop(self) -> None:
+		self._server.shutdown()
+		self._server.server_close()
+
+	def reset(self) -> None:
+		with self._lock:
+			self.connections = 0
+			self.requests = []
+
+	def _connected(self) -> None:
+		with self._lock:
+			self.connections += 1
+
+	def _request(self, path: str) -> None:
+		with self._lock:
+			self.requests.append((path, time.monotonic()))
@@ -0,0 +1,106 @@
+import argparse
+import contextlib
+import io
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from benchmarks.mock_twilio import MockTwilio
+from device_sim import percentile
+from outbox import OutboxEntry, SosOutbox, idempotency_key
+from server import SosServer, load_config
+
+
+def record_latency(directory: Path, sos: int, recipients: int, channels: int) -> dict:
+	# Cost added to the SOS hot path: one synced transaction per SOS
+	outbox = SosOutbox(directory / "record.db")
+	numbers = [f"+1555000{i:04d}" for i in range(recipients)]
+	kinds = ("sms", "call")[:channels]
+	samples = []
+	for i in range(sos):
+		ts = f"2024-01-01T00:00:{i:06d}"
+		entries = [
+			OutboxEntry(idempotency_key("bench-ring", ts, kind, n), "bench-ring", kind, n, "SOS from bench-ring")
+			for kind in kinds
+			for n in numbers
+		]
+		start = time.perf_counter()
+		outbox.record(entries)
+		samples.append(time.perf_counter() - start)
+	outbox.close()
+	samples.sort()
+	return {f"p{p}": round(percentile(samples, p) * 1000, 3) for p in (50, 95, 99)}
+
+
+def crash_and_replay(directory: Path, pending: int, recipients: int, latency: float, workers: int, timeout: float) -> dict:
+	# Leave rows in flight as a crashed process would, then start a server
+	# on the same directory and time how long the replayer needs to drain them.
+	outbox = SosOutbox(directory / "sos_outbox.db")
+	numbers = [f"+1555000{i:04d}" for i in range(recipients)]
+	per_number = pending // recipients
+	for i in range(per_number):
+		ts = f"2024-01-01T00:00:{i:06d}"
+		outbox.record([OutboxEntry(idempotency_key(f"ring-{i}", ts, "sms", n), f"ring-{i}", "sms", n, f"SOS {i}") for n in numbers])
+	outbox.close()
+	total = per_number * len(numbers)
+
+	config = load_config()
+	config.update({
+		"store_dir": str(directory),
+		"emergency_numbers": numbers,
+		"notify_workers": workers,
+		"notify_queue_size": total + 1,
+		"metrics_port": 0,
+		"metrics_file": "",
+		"offline_grace_multiple": 0,
+		"outbox_replay_seconds": 0.05,
+	})
+	with contextlib.redirect_stdout(io.StringIO()):
+		server = SosServer(config)
+		server.twilio = MockTwilio(latency=latency)
+		server.dispatcher.start()
+		start = time.perf_counter()
+		threading.Thread(target=server._outbox_loop, daemon=True).start()
+		while server.outbox.pending() and time.perf_counter() - start < timeout:
+			time.sleep(0.01)
+		elapsed = time.perf_counter() - start
+		server._stopping.set()
+		server.dispatcher.stop()
+		server.outbox.close()
+		server.store.close()
+	sent = server.twilio.sent
+	unique = len({(to, body) for _, to, body, _ in sent})
+	return {
+		"pending": total,
+		"sent": len(sent),
+		"duplicates": len(sent) - unique,
+		"seconds": round(elapsed, 3),
+		"replays_per_sec": round(len(sent) / elapsed, 1),
+	}
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="Outbox write cost on the SOS path and crash-recovery replay throughput")
+	parser.add_argument("--sos", type=int, default=500, help="SOS intents to record for the latency measurement")
+	parser.add_argument("--recipients", type=int, default=2)
+	parser.add_argument("--calls", action="store_true", help="Also record a call intent per recipient")
+	parser.add_argument("--pending", type=int, default=2000, help="Unsent notifications left behind by the simulated crash")
+	parser.add_argument("--twilio-latency", type=float, default=0.05)
+	parser.add_argument("--workers", type=int, default=8)
+	parser.add_argument("--timeout", type=float, default=120.0)
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as tmp:
+		record = record_latency(Path(tmp), args.sos, args.recipients, 2 if args.calls else 1)
+		print(f"record (synced) per SOS: p50/p95/p99 = {record['p50']}/{record['p95']}/{record['p99']} ms")
+		replay = crash_and_replay(Path(tmp), args.pending, args.recipients, args.twilio_latency, args.workers, args.timeout)
+		print(
+			f"replay: {replay['sent']}/{replay['pending']} sent in {replay['seconds']}s "
+			f"({replay['replays_per_sec']}/s, {args.workers} workers, {args.twilio_latency * 1000:.0f} ms provider), "
+			f"duplicates={replay['duplicates']}"
+		)
+
+
+if __name__ == "__main__":
+	main()
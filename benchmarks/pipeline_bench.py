@@ -0,0 +1,147 @@
+import argparse
+import contextlib
+import io
+import json
+import sys
+import tempfile
+import time
+
+from device_sim import percentile
+from server import SosServer, load_config
+
+
+# Checks the status pipeline's claim that a heartbeat flood delays an SOS ACK
+# by at most about one apply chunk. One thread plays the MQTT thread: it
+# feeds status payloads through _on_message at a fixed rate and, every
+# --sos-interval, handles an SOS and times it up to the ACK publish. The
+# applier thread competes with it for the GIL meanwhile. ACK p99 under the
+# flood is compared with the idle ACK p99 plus the p99 CPU time to apply one
+# chunk (measured on the applier itself); the run fails when it is above.
+
+
+def _status(i: int, devices: int) -> bytes:
+	device_id = f"bench-ring-{i % devices:06d}"
+	return json.dumps({
+		"deviceId": device_id,
+		"ts": "2024-01-01T00:00:00+00:00",
+		"state": "armed",
+		"batteryPercent": 80,
+		"lat": 13.08 + (i % 100) * 1e-5,
+		"lon": 80.27,
+	}).encode()
+
+
+class _Message:
+	__slots__ = ("topic", "payload", "retain", "dup", "mid")
+
+	def __init__(self, topic: str, payload: bytes):
+		self.topic = topic
+		self.payload = payload
+		self.retain = False
+		self.dup = False
+		self.mid = 0
+
+
+def run(mode: str, rate: float, args: argparse.Namespace) -> dict:
+	with tempfile.TemporaryDirectory() as tmp:
+		config = load_config()
+		config.update({
+			"store_dir": tmp,
+			"emergency_numbers": ["+15550000001"],
+			"twilio_sid": "",
+			"metrics_port": 0,
+			"metrics_file": "",
+			"offline_grace_multiple": 0,
+			"status_pipeline": mode,
+			"status_apply_chunk": args.chunk,
+		})
+		with contextlib.redirect_stdout(io.StringIO()):
+			server = SosServer(config)
+		acked: list[float] = []
+		server.client.publish = lambda topic, payload, qos=0, retain=False: acked.append(time.perf_counter())
+		# CPU time per applied row on the applier (or the MQTT thread when
+		# inline), so time spent waiting for the GIL is not counted
+		apply_times: list[float] = []
+		apply = server._apply_status
+
+		def timed_apply(row: tuple) -> None:
+			start = time.thread_time()
+			apply(row)
+			apply_times.append(time.thread_time() - start)
+
+		server._apply_status = timed_apply
+		if server.status_pipeline is not None:
+			server.status_pipeline._apply = timed_apply
+		statuses = [_Message(f"wearable/bench-ring-{i % args.devices:06d}/status", _status(i, args.devices)) for i in range(50000)]
+		latencies: list[float] = []
+		with contextlib.redirect_stdout(io.StringIO()):
+			server._start_services()
+			try:
+				start = time.perf_counter()
+				next_sos = start + args.warmup
+				sent = 0
+				sos_id = 0
+				while time.perf_counter() - start < args.warmup + args.duration:
+					now = time.perf_counter()
+					# Heartbeats due by now, in one go as they would sit in the socket buffer
+					due = int((now - start) * rate) - sent
+					for _ in range(max(0, due)):
+						server._on_message(server.client, None, statuses[sent % len(statuses)])
+						sent += 1
+					if now >= next_sos:
+						sos_id += 1
+						sos = _Message("wearable/bench-probe/sos", json.dumps({"deviceId": "bench-probe", "ts": f"2024-01-01T00:00:{sos_id:06d}", "msgId": sos_id, "reason": "bench"}).encode())
+						t0 = time.perf_counter()
+						server._on_message(server.client, None, sos)
+						if now - start >= args.warmup and acked:
+							latencies.append(acked[-1] - t0)
+						next_sos += args.sos_interval
+					time.sleep(0.0005)
+				shed = server.status_pipeline.shed if server.status_pipeline is not None else 0
+			finally:
+				server.stop()
+	chunk_times = [sum(apply_times[i:i + args.chunk]) for i in range(0, len(apply_times) - args.chunk + 1, args.chunk)]
+	latencies.sort()
+	chunk_times.sort()
+	return {
+		"mode": mode,
+		"rate": rate,
+		"heartbeats": sent,
+		"shed": shed,
+		"ack_p50_ms": percentile(latencies, 50) * 1000,
+		"ack_p99_ms": percentile(latencies, 99) * 1000,
+		"ack_max_ms": latencies[-1] * 1000 if latencies else 0.0,
+		"chunk_p99_ms": percentile(chunk_times, 99) * 1000 if chunk_times else 0.0,
+	}
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="SOS ACK latency on the MQTT thread under a heartbeat flood through the status pipeline")
+	parser.add_argument("--rate", type=float, default=20000.0, help="Heartbeats/s offered during the flood")
+	parser.add_argument("--devices", type=int, default=5000)
+	parser.add_argument("--chunk", type=int, default=100, help="STATUS_APPLY_CHUNK")
+	parser.add_argument("--modes", default="thread,process")
+	parser.add_argument("--sos-interval", type=float, default=0.02)
+	parser.add_argument("--duration", type=float, default=8.0)
+	parser.add_argument("--warmup", type=float, default=1.0)
+	args = parser.parse_args()
+
+	idle = run("off", 0.0, args)
+	print(f"idle:             SOS -> ACK p50/p99/max = {idle['ack_p50_ms']:.2f}/{idle['ack_p99_ms']:.2f}/{idle['ack_max_ms']:.2f} ms")
+	failed = False
+	for mode in args.modes.split(","):
+		loaded = run(mode, args.rate, args)
+		bound = idle["ack_p99_ms"] + loaded["chunk_p99_ms"]
+		ok = loaded["ack_p99_ms"] <= bound
+		failed |= not ok
+		print(
+			f"{mode:<7} {args.rate:>6.0f}/s: SOS -> ACK p50/p99/max = {loaded['ack_p50_ms']:.2f}/{loaded['ack_p99_ms']:.2f}/{loaded['ack_max_ms']:.2f} ms; "
+			f"one chunk of {args.chunk} rows p99 {loaded['chunk_p99_ms']:.2f} ms; {loaded['heartbeats']} heartbeats, {loaded['shed']} shed; "
+			f"p99 <= idle p99 + one chunk ({bound:.2f} ms): {'yes' if ok else 'NO'}"
+		)
+	if failed:
+		sys.exit(1)
+
+
+if __name__ == "__main__":
+	main()
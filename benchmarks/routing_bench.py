@@ -0,0 +1,137 @@
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from device_sim import percentile
+from routing import RoutingTable
+
+
+# Routing lookups on the SOS path for a large fleet, and hot reloads of the
+# routes file while reader threads keep looking devices up. Every route file
+# version gives each device a contact tagged with that version, so a reader
+# can tell whether a lookup ever saw a mix of two versions.
+
+
+def _routes(devices: int, groups: int, prefixes: int, version: int, rng: random.Random) -> dict:
+	tag = f"+1999{version:06d}"
+	routes = []
+	for i in range(devices):
+		if i % 2 == 0:
+			routes.append({"device": f"ring-{i}", "contacts": [tag, f"+1555{i:07d}"], "channels": ["sms", "call"]})
+	for g in range(groups):
+		members = [f"ring-{rng.randrange(devices)}" for _ in range(devices // max(1, groups))]
+		routes.append({"group": f"group-{g}", "devices": members, "contacts": [tag, f"+1666{g:07d}"]})
+	for p in range(prefixes):
+		routes.append({"prefix": f"site{p}-", "contacts": [tag, f"+1777{p:07d}"], "channels": ["call"]})
+	return {"default": {"contacts": [tag]}, "routes": routes}
+
+
+def _write(path: Path, text: str) -> None:
+	# Atomic replace, as an editor or config management tool would
+	tmp = path.with_suffix(".tmp")
+	tmp.write_text(text, encoding="utf-8")
+	os.replace(tmp, path)
+
+
+def _time_lookups(table: RoutingTable, ids: list[str]) -> float:
+	start = time.perf_counter()
+	for device_id in ids:
+		table.lookup(device_id)
+	return (time.perf_counter() - start) / len(ids) * 1e9
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="Routing table lookup cost and hot reload under load")
+	parser.add_argument("--devices", type=int, default=100000)
+	parser.add_argument("--groups", type=int, default=100)
+	parser.add_argument("--prefixes", type=int, default=50)
+	parser.add_argument("--reloads", type=int, default=5)
+	parser.add_argument("--readers", type=int, default=1, help="Threads looking devices up during reloads (on one core more threads mostly measure GIL hand-offs)")
+	parser.add_argument("--seed", type=int, default=1)
+	args = parser.parse_args()
+
+	rng = random.Random(args.seed)
+	with tempfile.TemporaryDirectory() as tmp:
+		path = Path(tmp) / "routes.json"
+		# Generated up front so the readers only compete with the reload itself
+		versions = [json.dumps(_routes(args.devices, args.groups, args.prefixes, v, rng)) for v in range(args.reloads + 1)]
+		_write(path, versions[0])
+		table = RoutingTable(path, [], reload_seconds=0.05)
+		start = time.perf_counter()
+		table.load()
+		load_ms = (time.perf_counter() - start) * 1000
+
+		named = [f"ring-{rng.randrange(args.devices)}" for _ in range(200000)]
+		prefixed = [f"site{rng.randrange(args.prefixes)}-{rng.randrange(args.devices)}" for _ in range(200000)]
+		unknown = [f"watch-{rng.randrange(args.devices)}" for _ in range(200000)]
+		named_ns = _time_lookups(table, named)
+		prefixed_ns = _time_lookups(table, prefixed)
+		unknown_ns = _time_lookups(table, unknown)
+
+		stop = threading.Event()
+		latencies: list[float] = []
+		counts = {"lookups": 0, "mixed": 0, "worst": 0.0}
+		lock = threading.Lock()
+
+		def read() -> None:
+			local = []
+			lookups = mixed = 0
+			worst = 0.0
+			ids = named + prefixed
+			i = 0
+			while not stop.is_set():
+				device_id = ids[i % len(ids)]
+				i += 1
+				t0 = time.perf_counter()
+				recipients = table.lookup(device_id)
+				elapsed = time.perf_counter() - t0
+				lookups += 1
+				# A sample for the percentiles, so list growth does not stall the other threads
+				if lookups % 64 == 0:
+					local.append(elapsed)
+				worst = max(worst, elapsed)
+				tags = {number for number, _ in recipients.contacts if number.startswith("+1999")}
+				if len(tags) != 1:
+					mixed += 1
+			with lock:
+				latencies.extend(local)
+				counts["lookups"] += lookups
+				counts["mixed"] += mixed
+				counts["worst"] = max(counts["worst"], worst)
+
+		table.start()
+		readers = [threading.Thread(target=read) for _ in range(args.readers)]
+		for thread in readers:
+			thread.start()
+		swaps = []
+		for version in range(1, args.reloads + 1):
+			written = time.perf_counter()
+			_write(path, versions[version])
+			while table.version < version + 1:
+				time.sleep(0.001)
+			swaps.append(time.perf_counter() - written)
+		stop.set()
+		for thread in readers:
+			thread.join()
+		table.stop()
+
+	latencies.sort()
+	print(f"{args.devices} devices ({args.devices // 2} by id), {args.groups} groups, {args.prefixes} prefixes: load + index {load_ms:.0f} ms")
+	print(
+		f"lookup: {named_ns:.0f} ns by id/group, {prefixed_ns:.0f} ns by prefix, {unknown_ns:.0f} ns default"
+	)
+	print(
+		f"hot reload: {args.reloads} reloads, write -> live {percentile(sorted(swaps), 50) * 1000:.0f} ms median (incl. {table.reload_seconds * 1000:.0f} ms poll); "
+		f"{counts['lookups']:,} lookups from {args.readers} threads meanwhile, p99 {percentile(latencies, 99) * 1e9:.0f} ns, "
+		f"max {counts['worst'] * 1e6:.0f} us, {counts['mixed']} saw a mix of versions"
+	)
+	print(f"routes: {table.stats()}")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,190 @@
+import argparse
+import contextlib
+import io
+import json
+import platform
+import re
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from benchmarks.local_broker import LocalBroker
+from benchmarks.mock_twilio import MockTwilio
+from device_sim import FleetSimulator, WearableSimulator, percentile
+from server import SosServer, load_config
+
+
+SOS_BODY = re.compile(r"^SOS from (\S+) at (\S+?)\. ")
+
+
+class _Probe(WearableSimulator):
+	# A WearableSimulator that timestamps its SOS publishes and the ACKs
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		self.pending: list[float] = []
+		self.rtts: list[float] = []
+		self._lock = threading.Lock()
+
+	def _on_message(self, client, userdata, msg):
+		if msg.topic == self.ack_topic:
+			now = time.monotonic()
+			with self._lock:
+				if self.pending:
+					self.rtts.append(now - self.pending.pop(0))
+
+	def timed_sos(self) -> tuple[str, float]:
+		with self._lock:
+			sent = time.monotonic()
+			self.pending.append(sent)
+		payload = self.send_sos(reason="bench")
+		return payload["ts"], sent
+
+
+def _git_version() -> str:
+	try:
+		out = subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True, timeout=5)
+		return out.stdout.strip() or "unknown"
+	except Exception:
+		return "unknown"
+
+
+def _wait_subscribed(broker: LocalBroker, client_id: str, timeout: float = 10.0) -> None:
+	deadline = time.monotonic() + timeout
+	while time.monotonic() < deadline:
+		session = broker.sessions.get(client_id)
+		if session is not None and len(session.filters) >= 3:
+			return
+		time.sleep(0.01)
+	raise RuntimeError(f"{client_id} did not subscribe within {timeout}s")
+
+
+def _pcts(values: list[float]) -> dict:
+	values = sorted(values)
+	return {f"p{p}": round(percentile(values, p) * 1000, 2) for p in (50, 95, 99)}
+
+
+def run_once(broker: LocalBroker, args: argparse.Namespace, devices: int, hb: float) -> dict:
+	with tempfile.TemporaryDirectory() as tmp:
+		config = load_config()
+		config.update({
+			"broker_host": "127.0.0.1",
+			"broker_port": broker.port,
+			"emergency_numbers": [f"+1555000{i:04d}" for i in range(args.recipients)],
+			"rate_limit_seconds": 0,
+			"notify_coalesce_seconds": args.coalesce_seconds,
+			"status_pipeline": args.status_pipeline,
+			"store_dir": tmp,
+		})
+		mock = MockTwilio(latency=args.twilio_latency, jitter=args.twilio_jitter, failure_rate=args.twilio_failure_rate)
+		server = SosServer(config)
+		server.twilio = mock
+		server_thread = threading.Thread(target=server.run, name="sos-server", daemon=True)
+		server_thread.start()
+		_wait_subscribed(broker, server.client_id)
+
+		fleet = FleetSimulator("127.0.0.1", broker.port, devices, 13.0827, 80.2707, heartbeat_seconds=hb, connections=args.connections)
+		fleet.start()
+		probes = [
+			_Probe("127.0.0.1", broker.port, f"bench-probe-{i:03d}", 13.0827, 80.2707, heartbeat_seconds=hb)
+			for i in range(args.probes)
+		]
+		for probe in probes:
+			probe.connect()
+		time.sleep(args.warmup)
+
+		sent: dict[tuple[str, str], float] = {}
+		end = time.monotonic() + args.duration
+		i = 0
+		while time.monotonic() < end:
+			probe = probes[i % len(probes)]
+			ts, at = probe.timed_sos()
+			sent[(probe.device_id, ts)] = at
+			i += 1
+			time.sleep(args.sos_interval)
+
+		# Let in-flight ACKs and notifications (including retries) finish
+		drain_deadline = time.monotonic() + args.drain
+		expected = len(sent) * args.recipients
+		while time.monotonic() < drain_deadline:
+			if sum(len(p.pending) for p in probes) == 0 and len(mock.sent) >= expected:
+				break
+			time.sleep(0.05)
+
+		fleet.stop()
+		fleet_report = fleet.report(top=0)
+		for probe in probes:
+			probe.disconnect()
+		server.stop()
+		server_thread.join(timeout=5.0)
+
+	ack_rtts = [rtt for p in probes for rtt in p.rtts]
+	notify = []
+	for kind, _, body, done in mock.sent:
+		match = SOS_BODY.match(body) if kind == "sms" else None
+		if match and (match.group(1), match.group(2)) in sent:
+			notify.append(done - sent[(match.group(1), match.group(2))])
+	return {
+		"devices": devices,
+		"heartbeat_s": hb,
+		"status_rate": fleet_report["publish_rate"],
+		"sos_sent": len(sent),
+		"acks": len(ack_rtts),
+		"ack_ms": _pcts(ack_rtts),
+		"notifications": len(notify),
+		"notify_failures": mock.failures,
+		"notify_ms": _pcts(notify),
+		"dispatcher": server.dispatcher.stats(),
+	}
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="End-to-end SOS → ACK / notification latency, fully offline")
+	parser.add_argument("--devices", default="100,1000", help="Comma-separated background fleet sizes")
+	parser.add_argument("--hb", default="10,1", help="Comma-separated heartbeat intervals (seconds)")
+	parser.add_argument("--probes", type=int, default=10, help="Devices that send the measured SOS messages")
+	parser.add_argument("--connections", type=int, default=2, help="MQTT connections used by the background fleet")
+	parser.add_argument("--recipients", type=int, default=2, help="Emergency numbers per SOS")
+	parser.add_argument("--sos-interval", type=float, default=0.1, help="Seconds between measured SOS messages")
+	parser.add_argument("--duration", type=float, default=5.0, help="Seconds of SOS traffic per run")
+	parser.add_argument("--warmup", type=float, default=1.0)
+	parser.add_argument("--drain", type=float, default=15.0, help="Max seconds to wait for outstanding ACKs/notifications")
+	parser.add_argument("--twilio-latency", type=float, default=0.2, help="Mock provider latency per request (s)")
+	parser.add_argument("--twilio-jitter", type=float, default=0.05)
+	parser.add_argument("--twilio-failure-rate", type=float, default=0.0)
+	parser.add_argument("--coalesce-seconds", type=float, default=0.0, help="Server merge window (0 = every SOS notifies)")
+	parser.add_argument("--status-pipeline", default="off", choices=("off", "thread", "process"), help="Server status lane (see pipeline.py)")
+	parser.add_argument("--json", default="sos_latency.json", help="Machine-readable results file")
+	parser.add_argument("--verbose", action="store_true", help="Show server/device console output")
+	args = parser.parse_args()
+
+	broker = LocalBroker().start()
+	results = {
+		"version": _git_version(),
+		"started": datetime.now(timezone.utc).isoformat(),
+		"python": platform.python_version(),
+		"params": {k: v for k, v in vars(args).items() if k not in ("json", "verbose")},
+		"runs": [],
+	}
+	try:
+		for devices in (int(d) for d in args.devices.split(",")):
+			for hb in (float(h) for h in args.hb.split(",")):
+				sink = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+				with sink:
+					run = run_once(broker, args, devices, hb)
+				results["runs"].append(run)
+				print(
+					f"devices={devices:<6} hb={hb:<5} status/s={run['status_rate']:<8} sos={run['sos_sent']:<4} "
+					f"ack p50/p95/p99={run['ack_ms']['p50']}/{run['ack_ms']['p95']}/{run['ack_ms']['p99']} ms  "
+					f"notify p50/p95/p99={run['notify_ms']['p50']}/{run['notify_ms']['p95']}/{run['notify_ms']['p99']} ms"
+				)
+	finally:
+		broker.stop()
+	Path(args.json).write_text(json.dumps(results, indent=2), encoding="utf-8")
+	print(f"results written to {args.json}")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,168 @@
+import argparse
+import json
+import os
+import re
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import paho.mqtt.client as mqtt
+
+from benchmarks.local_broker import LocalBroker
+from benchmarks.mock_twilio import MockTwilioHttp
+
+
+# How quickly a freshly started server is useful: `import server` time (and
+# which heavy modules it pulls in), process start -> subscribed on the broker,
+# and the latency of the first SOS notification against a local HTTP stand-in
+# for the Twilio API that charges connect_latency per new connection, with and
+# without the warm connection pool (TWILIO_WARM_CONNECTIONS).
+
+ROOT = Path(__file__).resolve().parent.parent
+HEAVY = ("twilio", "requests", "urllib3", "aiohttp", "asyncio")
+
+
+def _import_ms(module: str) -> tuple[float, list[str]]:
+	# -X importtime cumulative milliseconds of one top-level import in a fresh process
+	out = subprocess.run(
+		[sys.executable, "-X", "importtime", "-c", f"import {module}, sys; print(' '.join(sys.modules))"],
+		cwd=ROOT, capture_output=True, text=True, check=True,
+	)
+	for line in out.stderr.splitlines():
+		match = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\S+)$", line)
+		if match and match.group(2) == module:
+			return int(match.group(1)) / 1000, out.stdout.split()
+	raise RuntimeError(f"no import time reported for {module}")
+
+
+def import_time(runs: int) -> tuple[float, float, list[str]]:
+	# Median `import server` and, interleaved with it so both see the same
+	# host load, median `import paho.mqtt.client`: the one dependency the
+	# server cannot defer, used as the yardstick for the budget
+	server_ms, paho_ms = [], []
+	loaded: list[str] = []
+	for _ in range(runs):
+		elapsed, modules = _import_ms("server")
+		server_ms.append(elapsed)
+		paho_ms.append(_import_ms("paho.mqtt.client")[0])
+		loaded = sorted({name for name in modules if name.split(".")[0] in HEAVY and "." not in name})
+	return statistics.median(server_ms), statistics.median(paho_ms), loaded
+
+
+def _sos(port: int, device_id: str) -> None:
+	client = mqtt.Client(client_id=f"startup-bench-{uuid.uuid4().hex[:8]}")
+	client.connect("127.0.0.1", port, keepalive=60)
+	client.loop_start()
+	body = {"deviceId": device_id, "ts": time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime()), "msgId": 1, "reason": "button", "lat": 13.08, "lon": 80.27}
+	client.publish(f"wearable/{device_id}/sos", json.dumps(body), qos=1).wait_for_publish(5)
+	client.loop_stop()
+	client.disconnect()
+
+
+def cold_start(broker: LocalBroker, api: MockTwilioHttp, mode: str, warm: int, settle: float, timeout: float) -> dict:
+	client_id = f"startup-bench-{uuid.uuid4().hex[:8]}"
+	api.reset()
+	with tempfile.TemporaryDirectory() as tmp:
+		env = dict(
+			os.environ,
+			BROKER_HOST="127.0.0.1",
+			BROKER_PORT=str(broker.port),
+			CLIENT_ID=client_id,
+			STORE_DIR=tmp,
+			METRICS_PORT="0",
+			OFFLINE_GRACE_MULTIPLE="0",
+			OUTBOX_ENABLED="false",
+			TWILIO_SID="AC" + "0" * 32,
+			TWILIO_TOKEN="bench",
+			TWILIO_FROM="+15005550006",
+			EMERGENCY_NUMBERS="+15550000001",
+			TWILIO_API_URL=api.url,
+			TWILIO_WARM_CONNECTIONS=str(warm),
+			SERVER_MODE=mode,
+			PYTHONUNBUFFERED="1",
+		)
+		start = time.perf_counter()
+		proc = subprocess.Popen([sys.executable, "server.py"], cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+		try:
+			subscribed = None
+			while time.perf_counter() - start < timeout:
+				session = broker.sessions.get(client_id)
+				if session is not None and len(session.filters) >= 3:
+					subscribed = time.perf_counter() - start
+					break
+				time.sleep(0.002)
+			if subscribed is None:
+				raise RuntimeError("server did not subscribe in time")
+			# The first SOS usually comes long after startup; give the warm-up its chance
+			time.sleep(settle)
+			connections_before = api.connections
+			sent = time.monotonic()
+			_sos(broker.port, "startup-ring-1")
+			while not api.requests and time.monotonic() - sent < timeout:
+				time.sleep(0.001)
+			if not api.requests:
+				raise RuntimeError("no notification reached the mock API")
+			first = api.requests[0][1] - sent
+		finally:
+			proc.send_signal(signal.SIGINT)
+			try:
+				proc.wait(10)
+			except subprocess.TimeoutExpired:
+				proc.kill()
+	return {
+		"warm": warm,
+		"subscribed_ms": subscribed * 1000,
+		"first_sos_ms": first * 1000,
+		"warmed_connections": connections_before,
+	}
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="Server import time, cold start and first-SOS latency")
+	parser.add_argument("--import-runs", type=int, default=7)
+	parser.add_argument(
+		"--import-budget", type=float, default=3.0,
+		help="Fail when the median `import server` takes longer than this many times the median `import paho.mqtt.client` (0 = report only)",
+	)
+	parser.add_argument("--starts", type=int, default=3, help="Cold starts per configuration")
+	parser.add_argument("--connect-latency", type=float, default=0.25, help="Seconds the mock API holds each new connection (DNS + TCP + TLS)")
+	parser.add_argument("--twilio-latency", type=float, default=0.05)
+	parser.add_argument("--settle", type=float, default=1.0, help="Seconds between subscribed and the first SOS")
+	parser.add_argument("--mode", choices=("sync", "asyncio"), default="sync", help="SERVER_MODE of the started server")
+	parser.add_argument("--timeout", type=float, default=15.0)
+	args = parser.parse_args()
+
+	median_ms, paho_ms, loaded = import_time(args.import_runs)
+	ratio = median_ms / paho_ms
+	over = args.import_budget > 0 and ratio > args.import_budget
+	budget = f"budget {args.import_budget:.1f}x, {'OVER BUDGET' if over else 'ok'}" if args.import_budget > 0 else "no budget"
+	print(f"import server: {median_ms:.1f} ms median of {args.import_runs}, {ratio:.2f}x import paho.mqtt.client ({paho_ms:.1f} ms; {budget})")
+	print(f"heavy modules loaded at import: {', '.join(loaded) or 'none'}")
+
+	broker = LocalBroker().start()
+	api = MockTwilioHttp(connect_latency=args.connect_latency, latency=args.twilio_latency).start()
+	try:
+		for warm in (0, 2):
+			runs = [cold_start(broker, api, args.mode, warm, args.settle, args.timeout) for _ in range(args.starts)]
+			subscribed = statistics.median(run["subscribed_ms"] for run in runs)
+			first = statistics.median(run["first_sos_ms"] for run in runs)
+			pooled = max(run["warmed_connections"] for run in runs)
+			print(
+				f"{args.mode}, TWILIO_WARM_CONNECTIONS={warm}: start -> subscribed {subscribed:.0f} ms, "
+				f"first SOS -> API {first:.0f} ms ({pooled} connection(s) open before it; "
+				f"mock connect {args.connect_latency * 1000:.0f} ms + request {args.twilio_latency * 1000:.0f} ms)"
+			)
+	finally:
+		api.stop()
+		broker.stop()
+	if over:
+		sys.exit(1)
+
+
+if __name__ == "__main__":
+	main()
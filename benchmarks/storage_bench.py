@@ -0,0 +1,87 @@
+import argparse
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from device_sim import percentile
+from storage import BufferedCsvStore, CsvStore, SegmentedCsvStore, SqliteStore
+
+
+def make_rows(count: int, devices: int) -> list[list]:
+	rows = []
+	for i in range(count):
+		rows.append([
+			f"2024-01-01T00:00:{i % 60:02d}+00:00",
+			f"bench-ring-{i % devices:05d}",
+			"armed",
+			random.randint(5, 100),
+			round(13.0827 + random.uniform(-0.001, 0.001), 6),
+			round(80.2707 + random.uniform(-0.001, 0.001), 6),
+		])
+	return rows
+
+
+def run_backend(name: str, rows: list[list], sos_every: int, flush_rows: int, flush_seconds: float, segment_bytes: int) -> dict:
+	with tempfile.TemporaryDirectory() as tmp:
+		directory = Path(tmp)
+		if name == "csv":
+			store = CsvStore(directory)
+		elif name == "buffered":
+			store = BufferedCsvStore(directory, flush_rows, flush_seconds)
+		elif name == "segmented":
+			store = SegmentedCsvStore(directory, flush_rows, flush_seconds, segment_bytes=segment_bytes, maintainer={"interval": 1.0})
+		else:
+			store = SqliteStore(directory / "events.db", flush_rows, flush_seconds)
+		latencies = []
+		start = time.perf_counter()
+		for i, row in enumerate(rows, 1):
+			t0 = time.perf_counter()
+			if sos_every and i % sos_every == 0:
+				store.append("sos", [row[0], row[1], row[4], row[5], "bench", ""], durable=True)
+			else:
+				store.append("status", row)
+			latencies.append(time.perf_counter() - t0)
+		store.close()
+		elapsed = time.perf_counter() - start
+	# Append latency early vs late in the run shows whether it grows with history
+	tenth = max(1, len(latencies) // 10)
+	first, last = sorted(latencies[:tenth]), sorted(latencies[-tenth:])
+	return {
+		"backend": name,
+		"rows": len(rows),
+		"seconds": round(elapsed, 4),
+		"rows_per_sec": round(len(rows) / elapsed),
+		"p99_us_first_10pct": round(percentile(first, 99) * 1e6, 1),
+		"p99_us_last_10pct": round(percentile(last, 99) * 1e6, 1),
+	}
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="Compare event store backends (rows/sec)")
+	parser.add_argument("--rows", type=int, default=50000, help="Rows to append per backend")
+	parser.add_argument("--devices", type=int, default=1000, help="Distinct device ids")
+	parser.add_argument("--sos-every", type=int, default=0, help="Make every Nth row a durable SOS row (0 = none)")
+	parser.add_argument("--flush-rows", type=int, default=500)
+	parser.add_argument("--flush-seconds", type=float, default=1.0)
+	parser.add_argument("--backends", default="csv,buffered,sqlite,segmented")
+	parser.add_argument("--segment-bytes", type=int, default=8 * 1024 * 1024, help="Roll size for the segmented backend")
+	parser.add_argument("--json", help="Write results to this file")
+	args = parser.parse_args()
+
+	rows = make_rows(args.rows, args.devices)
+	results = []
+	for name in args.backends.split(","):
+		result = run_backend(name.strip(), rows, args.sos_every, args.flush_rows, args.flush_seconds, args.segment_bytes)
+		results.append(result)
+		print(
+			f"{result['backend']:>9}: {result['rows_per_sec']:>9} rows/s ({result['seconds']}s for {result['rows']} rows), "
+			f"append p99 {result['p99_us_first_10pct']} us first 10% / {result['p99_us_last_10pct']} us last 10%"
+		)
+	if args.json:
+		Path(args.json).write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,315 @@
+import argparse
+import contextlib
+import io
+import json
+import tempfile
+import threading
+import time
+
+from benchmarks.local_broker import LocalBroker
+from benchmarks.mock_twilio import MockTwilio
+from benchmarks.sos_latency import _git_version, _pcts, _wait_subscribed
+from codec import encode
+from device_sim import FleetSimulator, ReplaySimulator, WearableSimulator, load_recorded
+from server import SosServer, load_config
+
+
+# Broker restarts against a live server: the fleet (synthetic or a replayed
+# recording) keeps publishing into its offline buffers while the broker is
+# down, then every connection reconnects within the backoff window and
+# flushes its backlog at once. Probes press SOS throughout, so ACK latency
+# can be compared between steady state and the storm. Like a ring, a probe
+# resends an unanswered SOS (same payload) every sos_retry seconds; those
+# copies, and any in-flight QoS 1 publish resent on reconnect, are counted by
+# the server's dedup cache and come back to the devices as re-ACKs.
+
+
+class _StormProbe(WearableSimulator):
+	# Keeps at most one SOS outstanding, matched to its ACK by msgId; one
+	# unanswered for ack_timeout seconds is counted as lost. ACKs for an SOS
+	# already answered are re-ACKs of a duplicate copy.
+	def __init__(self, *args, ack_timeout: float = 15.0, sos_retry: float = 2.0, **kwargs):
+		super().__init__(*args, **kwargs)
+		self.ack_timeout = ack_timeout
+		self.sos_retry = sos_retry
+		# msgId -> [first sent, last sent, encoded payload]
+		self.pending: dict[int, list] = {}
+		self.acked: list[tuple[float, float]] = []
+		self.lost: list[float] = []
+		self.retries = 0
+		self.reacks = 0
+		self._lock = threading.Lock()
+
+	def _on_message(self, client, userdata, msg):
+		if msg.topic == self.ack_topic:
+			now = time.monotonic()
+			msg_id = json.loads(msg.payload).get("msgId")
+			with self._lock:
+				entry = self.pending.pop(msg_id, None)
+				if entry is not None:
+					self.acked.append((entry[0], now - entry[0]))
+				else:
+					self.reacks += 1
+
+	def press(self) -> bool:
+		now = time.monotonic()
+		with self._lock:
+			for msg_id, entry in list(self.pending.items()):
+				if now - entry[0] > self.ack_timeout:
+					self.lost.append(self.pending.pop(msg_id)[0])
+				elif self.sos_retry > 0 and now - entry[1] >= self.sos_retry:
+					entry[1] = now
+					self.retries += 1
+					self.link.publish("sos", self.sos_topic, entry[2], qos=1)
+			if self.pending:
+				return False
+			# Held while publishing so the ACK cannot arrive before the entry
+			payload = self.send_sos(reason="storm")
+			if payload is not None:
+				self.pending[payload["msgId"]] = [now, now, encode("sos", payload, self.wire)]
+		return True
+
+
+class _Sampler:
+	# Polls queue depths along the ingest path every interval seconds
+	def __init__(self, server: SosServer, broker: LocalBroker, links: list, interval: float = 0.05):
+		self.server = server
+		self.broker = broker
+		self.links = links
+		self.interval = interval
+		self.samples: list[dict] = []
+		self._stop = threading.Event()
+		self._thread = threading.Thread(target=self._run, name="storm-sampler", daemon=True)
+
+	def start(self) -> None:
+		self._thread.start()
+
+	def stop(self) -> None:
+		self._stop.set()
+		self._thread.join(timeout=2.0)
+
+	def snapshot(self) -> dict:
+		server = self.server
+		return {
+			"t": time.monotonic(),
+			"handled": sum(child.value for child in server._m_messages.values()),
+			"sent": sum(link.published + link.replayed for link in self.links),
+			"device_queued": sum(len(link.buffer) for link in self.links),
+			"connected": sum(link.connected for link in self.links),
+			"broker_backlog": self.broker.backlog(server.client_id),
+			"notify_queue": server.dispatcher.queue_depth,
+			"pipeline_pending": server.status_pipeline.pending if server.status_pipeline is not None else 0,
+		}
+
+	def _run(self) -> None:
+		while not self._stop.wait(self.interval):
+			self.samples.append(self.snapshot())
+
+	def window(self, start: float, end: float) -> list[dict]:
+		return [s for s in self.samples if start <= s["t"] <= end]
+
+
+def _drained(snap: dict, links: int) -> bool:
+	return (
+		snap["connected"] == links
+		and snap["device_queued"] == 0
+		and snap["broker_backlog"] == 0
+		and snap["notify_queue"] == 0
+		and snap["pipeline_pending"] == 0
+	)
+
+
+def run_storm(broker: LocalBroker, sampler: _Sampler, server: SosServer, links: list, args: argparse.Namespace) -> dict:
+	server_connects = server._m_connects.value
+	down = time.monotonic()
+	broker.stop()
+	time.sleep(args.outage)
+	broker.start()
+	up = time.monotonic()
+	reconnected = server_reconnected = drained = None
+	deadline = up + args.drain
+	while time.monotonic() < deadline:
+		snap = sampler.snapshot()
+		if reconnected is None and snap["connected"] == len(links):
+			reconnected = snap["t"]
+		if server_reconnected is None and server._m_connects.value > server_connects:
+			server_reconnected = snap["t"]
+		if reconnected is not None and server_reconnected is not None and _drained(snap, len(links)):
+			drained = snap["t"]
+			break
+		time.sleep(0.02)
+	end = drained or time.monotonic()
+	window = sampler.window(up, end)
+	return {
+		"down": down,
+		"up": up,
+		"end": end,
+		"outage_s": round(up - down, 2),
+		"devices_reconnected_s": round(reconnected - up, 2) if reconnected else None,
+		"server_reconnected_s": round(server_reconnected - up, 2) if server_reconnected else None,
+		"drain_s": round(drained - up, 2) if drained else None,
+		"peak_device_queued": max((s["device_queued"] for s in sampler.window(down, end)), default=0),
+		"peak_broker_backlog_bytes": max((s["broker_backlog"] for s in window), default=0),
+		"peak_notify_queue": max((s["notify_queue"] for s in window), default=0),
+		"peak_pipeline_pending": max((s["pipeline_pending"] for s in window), default=0),
+	}
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="Broker restart / reconnect storm against SosServer, fully offline")
+	parser.add_argument("--devices", type=int, default=2000, help="Synthetic fleet size (ignored with --replay)")
+	parser.add_argument("--hb", type=float, default=1.0, help="Synthetic heartbeat interval (seconds)")
+	parser.add_argument("--replay", help="Replay this log directory or CSV instead of a synthetic fleet")
+	parser.add_argument("--speed", type=float, default=10.0, help="Replay speed multiplier")
+	parser.add_argument("--connections", type=int, default=50, help="Fleet MQTT connections (each reconnects and flushes on its own)")
+	parser.add_argument("--buffer-size", type=int, default=10000, help="Offline buffer per connection")
+	parser.add_argument("--min-backoff", type=float, default=0.5, help="Reconnect backoff base; small values synchronise the storm")
+	parser.add_argument("--max-backoff", type=float, default=2.0)
+	parser.add_argument("--server-backoff", type=float, default=0.1, help="Server's first reconnect delay (MQTT_RECONNECT_MIN_SECONDS, default 1 s)")
+	parser.add_argument("--storms", type=int, default=2)
+	parser.add_argument("--outage", type=float, default=5.0, help="Seconds the broker stays down")
+	parser.add_argument("--between", type=float, default=3.0, help="Seconds of steady traffic before and between storms")
+	parser.add_argument("--drain", type=float, default=60.0, help="Max seconds to wait for a storm to drain")
+	parser.add_argument("--probes", type=int, default=5, help="Devices pressing SOS throughout (one outstanding SOS each)")
+	parser.add_argument("--ack-timeout", type=float, default=15.0, help="Seconds after which an unanswered probe SOS counts as lost")
+	parser.add_argument("--sos-retry", type=float, default=2.0, help="Seconds before a probe resends an unanswered SOS (0 = never)")
+	parser.add_argument("--sos-interval", type=float, default=0.2)
+	parser.add_argument("--recipients", type=int, default=2)
+	parser.add_argument("--twilio-latency", type=float, default=0.2)
+	parser.add_argument("--status-pipeline", default="off", choices=("off", "thread", "process"))
+	parser.add_argument("--json", help="Write results to this file")
+	parser.add_argument("--verbose", action="store_true", help="Show server/device console output")
+	args = parser.parse_args()
+
+	events = load_recorded(args.replay) if args.replay else None
+	broker = LocalBroker().start()
+	sink = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+	storms = []
+	with tempfile.TemporaryDirectory() as tmp, sink:
+		config = load_config()
+		config.update({
+			"broker_host": "127.0.0.1",
+			"broker_port": broker.port,
+			"emergency_numbers": [f"+1555000{i:04d}" for i in range(args.recipients)],
+			"rate_limit_seconds": 0,
+			"notify_coalesce_seconds": 0.0,
+			"status_pipeline": args.status_pipeline,
+			"store_dir": tmp,
+			"metrics_port": 0,
+			"metrics_file": "",
+			"mqtt_reconnect_min_seconds": args.server_backoff,
+			"mqtt_reconnect_max_seconds": max(args.server_backoff, args.max_backoff),
+		})
+		server = SosServer(config)
+		server.twilio = MockTwilio(latency=args.twilio_latency)
+		server_thread = threading.Thread(target=server.run, name="sos-server", daemon=True)
+		server_thread.start()
+		_wait_subscribed(broker, server.client_id)
+
+		link_options = {"buffer_size": args.buffer_size, "min_backoff": args.min_backoff, "max_backoff": args.max_backoff}
+		if events is not None:
+			fleet: FleetSimulator = ReplaySimulator(
+				"127.0.0.1", broker.port, events, speed=args.speed, loop=True, connections=args.connections, **link_options
+			)
+		else:
+			fleet = FleetSimulator(
+				"127.0.0.1", broker.port, args.devices, 13.0827, 80.2707, heartbeat_seconds=args.hb, connections=args.connections, **link_options
+			)
+		probes = [
+			_StormProbe("127.0.0.1", broker.port, f"storm-probe-{i:03d}", 13.0827, 80.2707, ack_timeout=args.ack_timeout, sos_retry=args.sos_retry, **link_options)
+			for i in range(args.probes)
+		]
+		links = fleet.links + [p.link for p in probes]
+		fleet.start()
+		for probe in probes:
+			probe.connect()
+		sampler = _Sampler(server, broker, links)
+		sampler.start()
+
+		pressing = threading.Event()
+		pressing.set()
+
+		def press_loop() -> None:
+			i = 0
+			while pressing.is_set():
+				probes[i % len(probes)].press()
+				i += 1
+				time.sleep(args.sos_interval)
+
+		presser = threading.Thread(target=press_loop, name="storm-probes", daemon=True)
+		time.sleep(1.0)
+		started = time.monotonic()
+		if probes:
+			presser.start()
+		time.sleep(args.between)
+		for _ in range(args.storms):
+			storms.append(run_storm(broker, sampler, server, links, args))
+			time.sleep(args.between)
+		pressing.clear()
+		if probes:
+			presser.join()
+		# Let the last ACKs and notifications arrive
+		time.sleep(min(2.0, args.drain))
+		final = sampler.snapshot()
+		dedup = server.sos_dedup.stats() if server.sos_dedup is not None else None
+		sampler.stop()
+		fleet.stop()
+		fleet_report = fleet.report(top=0)
+		for probe in probes:
+			probe.disconnect()
+		server.stop()
+		server_thread.join(timeout=5.0)
+	broker.stop()
+
+	acked = [a for p in probes for a in p.acked]
+	lost_sos = sum(len(p.lost) for p in probes)
+	unacked = sum(len(p.pending) for p in probes)
+	in_storm = [rtt for sent, rtt in acked if any(s["down"] <= sent <= s["end"] for s in storms)]
+	steady = [rtt for sent, rtt in acked if sent >= started and not any(s["down"] <= sent <= s["end"] for s in storms)]
+	results = {
+		"version": _git_version(),
+		"params": {k: v for k, v in vars(args).items() if k not in ("json", "verbose")},
+		"source": f"replay of {len(events)} events" if events is not None else f"{args.devices} synthetic devices",
+		"storms": [{k: v for k, v in s.items() if k not in ("down", "up", "end")} for s in storms],
+		"messages_sent": final["sent"],
+		"messages_handled": final["handled"],
+		"messages_lost": final["sent"] - final["handled"],
+		"offline_buffer": fleet_report["offline_buffer"],
+		"sos_acked": len(acked),
+		"sos_lost": lost_sos,
+		"sos_unacked": unacked,
+		"ack_ms_steady": _pcts(steady),
+		"ack_ms_storm": _pcts(in_storm),
+		"sos_dedup": dedup,
+		"sos_retries": sum(p.retries for p in probes),
+		"reacks": fleet_report["reacks"] + sum(p.reacks for p in probes),
+	}
+	print(f"source: {results['source']} over {args.connections} connections, {args.probes} SOS probes")
+	for i, storm in enumerate(results["storms"], 1):
+		print(
+			f"storm {i}: outage {storm['outage_s']}s, devices back in {storm['devices_reconnected_s']}s, "
+			f"server back in {storm['server_reconnected_s']}s, drained in {storm['drain_s']}s; peak queued on devices "
+			f"{storm['peak_device_queued']}, broker->server backlog {storm['peak_broker_backlog_bytes']} B, "
+			f"notify queue {storm['peak_notify_queue']}, pipeline {storm['peak_pipeline_pending']}"
+		)
+	print(
+		f"messages: {results['messages_sent']} sent, {results['messages_handled']} handled, {results['messages_lost']} lost "
+		f"(published while the server was not subscribed); dropped on devices {results['offline_buffer']['dropped']}"
+	)
+	print(
+		f"SOS ACK steady p50/p95/p99 = {results['ack_ms_steady']['p50']}/{results['ack_ms_steady']['p95']}/{results['ack_ms_steady']['p99']} ms, "
+		f"during storms = {results['ack_ms_storm']['p50']}/{results['ack_ms_storm']['p95']}/{results['ack_ms_storm']['p99']} ms "
+		f"({len(acked)} acked, {lost_sos} lost, {unacked} still pending)"
+	)
+	if dedup is not None:
+		print(
+			f"SOS dedup: {dedup['hits']} of {dedup['hits'] + dedup['misses']} SOS deliveries were redelivered copies "
+			f"(hit rate {dedup['hit_rate']:.2%}), answered with a re-ACK only; probes resent {results['sos_retries']} unanswered SOS, devices saw {results['reacks']} re-ACKs"
+		)
+	if args.json:
+		with open(args.json, "w", encoding="utf-8") as f:
+			json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+	main()
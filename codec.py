@@ -0,0 +1,203 @@
+import json
+import struct
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+try:
+	import orjson  # type: ignore
+except Exception:  # pragma: no cover - optional speedup
+	orjson = None  # type: ignore
+
+
+# Wire codecs for device messages. JSON stays the default (ESP32 sketches and
+# older simulators send it); a compact fixed-layout binary frame is opt-in for
+# simulators and is recognised by its first byte, which can never start a
+# JSON object. Both decode to the same dict, so handlers do not care which
+# format a device used.
+
+
+class CodecError(ValueError):
+	pass
+
+
+_NUMBER = (int, float)
+_SCHEMAS: dict[str, tuple[tuple[str, tuple[type, ...], bool], ...]] = {
+	# (field, accepted types, required); unknown fields pass through
+	"sos": (
+		("deviceId", (str,), True),
+		("ts", (str,), False),
+		("reason", (str,), False),
+		("batteryPercent", _NUMBER, False),
+		("lat", _NUMBER, False),
+		("lon", _NUMBER, False),
+		("mapsUrl", (str,), False),
+		("msgId", (int,), False),
+	),
+	"status": (
+		("deviceId", (str,), True),
+		("ts", (str,), False),
+		("state", (str,), False),
+		("batteryPercent", _NUMBER, False),
+		("lat", _NUMBER, False),
+		("lon", _NUMBER, False),
+	),
+	"tamper": (
+		("deviceId", (str,), True),
+		("ts", (str,), False),
+		("reason", (str,), False),
+		("batteryPercent", _NUMBER, False),
+	),
+}
+
+
+def _compile(kind: str, fields: tuple[tuple[str, tuple[type, ...], bool], ...]) -> Callable[[dict], dict]:
+	# Resolve the field table once; the returned closure is one flat loop of
+	# exact type checks (JSON decoders only produce exact types, and this
+	# keeps bool out of the numeric fields). None counts as absent.
+	table = tuple((name, frozenset(types), required) for name, types, required in fields)
+
+	def validate(data: dict) -> dict:
+		if type(data) is not dict:
+			raise CodecError(f"{kind}: expected an object")
+		get = data.get
+		for name, types, required in table:
+			value = get(name)
+			if value is None:
+				if required:
+					raise CodecError(f"{kind}: missing {name}")
+			elif type(value) not in types:
+				raise CodecError(f"{kind}: bad {name} {value!r}")
+		return data
+
+	return validate
+
+
+VALIDATORS: dict[str, Callable[[dict], dict]] = {kind: _compile(kind, fields) for kind, fields in _SCHEMAS.items()}
+
+
+def _loads_stdlib(payload: bytes):
+	return json.loads(payload)
+
+
+def _loads_orjson(payload: bytes):
+	return orjson.loads(payload)
+
+
+_loads = _loads_orjson if orjson is not None else _loads_stdlib
+
+
+def use_json_backend(name: str) -> str:
+	# "auto" picks orjson when installed; returns the backend now in use
+	global _loads
+	if name == "json" or (name == "auto" and orjson is None):
+		_loads = _loads_stdlib
+	elif name in ("orjson", "auto"):
+		if orjson is None:
+			raise ValueError("JSON_BACKEND=orjson but orjson is not installed")
+		_loads = _loads_orjson
+	else:
+		raise ValueError(f"unknown JSON_BACKEND '{name}' (expected auto, json or orjson)")
+	return "orjson" if _loads is _loads_orjson else "json"
+
+
+# Binary frame (little endian, 20 bytes + strings):
+#   magic u8 | kind u8 | ts f64 epoch seconds | battery i8 (-1 absent) |
+#   flags u8 (bit0 fix present, bits1-2 state) | lat i32 1e-7 deg | lon i32 1e-7 deg |
+#   deviceId u8 len + utf-8 | reason u8 len + utf-8 [| msgId u32]
+# msgId (the device's message counter) is optional and only sent when set;
+# frames from older simulators simply end after reason.
+MAGIC = 0xB7
+_MAGIC_BYTE = bytes((MAGIC,))
+_HEADER = struct.Struct("<BBdbBii")
+_MSG_ID = struct.Struct("<I")
+_KINDS = {"sos": 1, "status": 2, "tamper": 3}
+_KIND_NAMES = {v: k for k, v in _KINDS.items()}
+_STATES = {"armed": 1, "disarmed": 2}
+_STATE_NAMES = {v: k for k, v in _STATES.items()}
+_E7 = 10_000_000
+
+
+def _ts_epoch(ts: Optional[str]) -> float:
+	if not ts:
+		return 0.0
+	try:
+		return datetime.fromisoformat(ts).timestamp()
+	except ValueError:
+		return 0.0
+
+
+def encode_binary(kind: str, data: dict) -> bytes:
+	device_id = data["deviceId"].encode("utf-8")
+	reason = (data.get("reason") or "").encode("utf-8")
+	if len(device_id) > 255 or len(reason) > 255:
+		raise CodecError("deviceId/reason longer than 255 bytes")
+	batt = data.get("batteryPercent")
+	lat, lon = data.get("lat"), data.get("lon")
+	has_fix = lat is not None and lon is not None
+	flags = (1 if has_fix else 0) | (_STATES.get(data.get("state") or "", 0) << 1)
+	header = _HEADER.pack(
+		MAGIC,
+		_KINDS[kind],
+		_ts_epoch(data.get("ts")),
+		-1 if batt is None else max(0, min(127, int(batt))),
+		flags,
+		round(lat * _E7) if has_fix else 0,
+		round(lon * _E7) if has_fix else 0,
+	)
+	parts = [header, bytes((len(device_id),)), device_id, bytes((len(reason),)), reason]
+	msg_id = data.get("msgId")
+	if msg_id is not None:
+		parts.append(_MSG_ID.pack(msg_id & 0xFFFFFFFF))
+	return b"".join(parts)
+
+
+def decode_binary(payload: bytes) -> dict:
+	try:
+		_, kind, ts, batt, flags, lat, lon = _HEADER.unpack_from(payload)
+		pos = _HEADER.size
+		n = payload[pos]
+		device_id = payload[pos + 1:pos + 1 + n].decode("utf-8")
+		pos += 1 + n
+		n = payload[pos]
+		reason = payload[pos + 1:pos + 1 + n].decode("utf-8")
+		pos += 1 + n
+		msg_id = _MSG_ID.unpack_from(payload, pos)[0] if len(payload) >= pos + _MSG_ID.size else None
+	except (struct.error, IndexError, UnicodeDecodeError) as exc:
+		raise CodecError(f"bad binary frame: {exc}") from None
+	data: dict = {"deviceId": device_id}
+	if ts:
+		data["ts"] = datetime.fromtimestamp(ts, timezone.utc).isoformat()
+	if batt >= 0:
+		data["batteryPercent"] = batt
+	if flags & 1:
+		data["lat"] = lat / _E7
+		data["lon"] = lon / _E7
+	state = _STATE_NAMES.get((flags >> 1) & 3)
+	if state:
+		data["state"] = state
+	if reason:
+		data["reason"] = reason
+	if msg_id is not None:
+		data["msgId"] = msg_id
+	if kind != _KINDS["status"]:
+		data["type"] = _KIND_NAMES.get(kind, "").upper()
+	return data
+
+
+def encode(kind: str, data: dict, wire: str = "json") -> bytes:
+	if wire == "binary":
+		return encode_binary(kind, data)
+	return json.dumps(data).encode("utf-8")
+
+
+def decode(kind: str, payload: bytes) -> dict:
+	# kind comes from the topic; messages of other kinds are decoded but not validated
+	if payload[:1] == _MAGIC_BYTE:
+		data = decode_binary(payload)
+	else:
+		try:
+			data = _loads(payload)
+		except ValueError as exc:
+			raise CodecError(f"bad JSON: {exc}") from None
+	validate = VALIDATORS.get(kind)
+	return validate(data) if validate is not None else data
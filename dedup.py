@@ -0,0 +1,98 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from outbox import payload_digest
+
+
+# Recently handled SOS by (deviceId, msgId, ts). SOS is published with QoS 1,
+# so the broker may deliver it more than once (lost PUBACK, device reconnect
+# resending its in-flight window, offline buffer replay); every copy carries
+# the same payload. The first copy is handled and its ACK remembered; later
+# copies only get that ACK again. Both ids are part of the key, so a device
+# whose message counter restarts after a reboot is not mistaken for a
+# duplicate (its ts differs), and two presses within one ts tick are told
+# apart by msgId. Firmware that sends neither (the ESP32 sketches) is keyed
+# on a digest of the whole payload instead. Two presses can send the same
+# bytes (battery clamped, no fix, same reason), so such a copy only counts as
+# a duplicate within a short window, or when the broker flags it as a
+# redelivery (dup).
+#
+# Entries expire after ttl_seconds (past any redelivery window) in insertion
+# order, and max_entries caps memory; both are evicted on each call as in
+# the rate limiter. This is per process: with CLUSTER_MODE=partition a
+# device always lands on the same worker, with shared subscriptions a
+# redelivery may not, and the outbox still keeps guardians from being
+# notified twice.
+
+
+def sos_key(data: dict) -> tuple:
+	msg_id = data.get("msgId")
+	ts = data.get("ts")
+	if msg_id is None and ts is None:
+		return (data.get("deviceId"), None, payload_digest(data))
+	return (data.get("deviceId"), msg_id, ts)
+
+
+class DedupCache:
+	def __init__(self, ttl_seconds: float = 600.0, max_entries: int = 100_000):
+		self.ttl_seconds = ttl_seconds
+		self.max_entries = max(1, max_entries)
+		self._entries: "OrderedDict[tuple, tuple[float, str, float]]" = OrderedDict()
+		self._lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+		self.evicted = 0
+
+	def check(self, key: tuple, ack: str, redelivery: bool = False, window: Optional[float] = None) -> Optional[str]:
+		# Returns the remembered ACK for a duplicate, or None after recording
+		# this one (with the ACK it will be answered with) as handled. window
+		# limits how long a copy not flagged as a redelivery still matches
+		# (default: the whole ttl)
+		now = time.monotonic()
+		with self._lock:
+			self._evict(now)
+			entry = self._entries.get(key)
+			if entry is not None:
+				if redelivery or now < entry[2]:
+					self.hits += 1
+					return entry[1]
+				# A new SOS with the same key: it starts over at the back
+				del self._entries[key]
+			self._entries[key] = (now + self.ttl_seconds, ack, now + (self.ttl_seconds if window is None else window))
+			self.misses += 1
+			return None
+
+	def forget(self, key: tuple) -> None:
+		# The first copy was not handled after all; let a redelivery through
+		with self._lock:
+			self._entries.pop(key, None)
+
+	def _evict(self, now: float) -> None:
+		entries = self._entries
+		while entries:
+			expires = next(iter(entries.values()))[0]
+			if len(entries) >= self.max_entries or expires <= now:
+				entries.popitem(last=False)
+				self.evicted += 1
+			else:
+				break
+
+	def __len__(self) -> int:
+		return len(self._entries)
+
+	@property
+	def hit_rate(self) -> float:
+		total = self.hits + self.misses
+		return self.hits / total if total else 0.0
+
+	def stats(self) -> dict:
+		with self._lock:
+			return {
+				"entries": len(self._entries),
+				"hits": self.hits,
+				"misses": self.misses,
+				"hit_rate": round(self.hit_rate, 4),
+				"evicted": self.evicted,
+			}
@@ -1,14 +1,23 @@
 import argparse
+import csv
+import gzip
+import heapq
 import json
 import random
 import threading
 import time
 import uuid
+import zlib
 from datetime import datetime, timezone
+from pathlib import Path
 from typing import Optional
 
 import paho.mqtt.client as mqtt
 
+from codec import encode
+from devlink import DeviceLink
+from storage import CSV_FILES, SCHEMAS
+
 try:
 	import msvcrt  # Windows-only, for non-blocking key checks during countdown
 	_HAS_MSVCRT = True
@@ -43,6 +52,10 @@ class WearableSimulator:
 		center_lat: float,
 		center_lon: float,
 		heartbeat_seconds: int = 10,
+		wire: str = "json",
+		buffer_size: int = 1000,
+		min_backoff: float = 1.0,
+		max_backoff: float = 60.0,
 	):
 		self.broker_host = broker_host
 		self.broker_port = broker_port
@@ -50,6 +63,7 @@ class WearableSimulator:
 		self.center_lat = center_lat
 		self.center_lon = center_lon
 		self.heartbeat_seconds = heartbeat_seconds
+		self.wire = wire
 
 		self.topic_base = f"wearable/{self.device_id}"
 		self.status_topic = f"{self.topic_base}/status"
@@ -57,24 +71,32 @@ class WearableSimulator:
 		self.ack_topic = f"{self.topic_base}/ack"
 		self.tamper_topic = f"{self.topic_base}/tamper"
 
-		self.client = mqtt.Client(client_id=f"{self.device_id}-pubsub")
-		self.client.on_connect = self._on_connect
-		self.client.on_disconnect = self._on_disconnect
-		self.client.on_message = self._on_message
+		# Reconnects with backoff and buffers publishes while offline (see devlink.py)
+		self.link = DeviceLink(
+			f"{self.device_id}-pubsub",
+			broker_host,
+			broker_port,
+			on_connect=self._on_connect,
+			on_message=self._on_message,
+			buffer_size=buffer_size,
+			min_backoff=min_backoff,
+			max_backoff=max_backoff,
+		)
+		self.client = self.link.client
 
 		self._running = False
 		self._battery_percent = 98
 		self._armed = True
 		self._last_ack: Optional[str] = None
+		# Monotonic per-device message id, so the server can recognise redeliveries
+		self._msg_id = 0
 		self._heartbeat_thread: threading.Thread | None = None
 
-	def _on_connect(self, client, userdata, flags, rc):
-		print(f"[device] MQTT connected (rc={rc}) as {self.device_id}")
+	def _on_connect(self, client):
+		queued = len(self.link.buffer)
+		print(f"[device] MQTT connected as {self.device_id}" + (f"; replaying {queued} buffered messages" if queued else ""))
 		client.subscribe(self.ack_topic, qos=1)
 
-	def _on_disconnect(self, client, userdata, rc):
-		print(f"[device] MQTT disconnected (rc={rc})")
-
 	def _on_message(self, client, userdata, msg):
 		if msg.topic == self.ack_topic:
 			try:
@@ -85,12 +107,17 @@ class WearableSimulator:
 			print(f"[device] ACK received: {data}")
 
 	def connect(self) -> None:
-		self.client.connect(self.broker_host, self.broker_port, keepalive=60)
-		self.client.loop_start()
+		self.link.start()
 
 	def disconnect(self) -> None:
-		self.client.loop_stop()
-		self.client.disconnect()
+		self.link.stop()
+		print(f"[device] link: {self.link.stats()}")
+
+	def _publish(self, kind: str, topic: str, payload: dict, qos: int) -> bool:
+		sent = self.link.publish(kind, topic, encode(kind, payload, self.wire), qos)
+		if not sent:
+			print(f"[device] offline; {kind} buffered ({len(self.link.buffer)} queued)")
+		return sent
 
 	def start(self) -> None:
 		if self._running:
@@ -119,8 +146,8 @@ class WearableSimulator:
 				"lat": round(lat, 6),
 				"lon": round(lon, 6),
 			}
-			self.client.publish(self.status_topic, json.dumps(payload), qos=0, retain=False)
-			print(f"[device] status → {payload}")
+			if self._publish("status", self.status_topic, payload, qos=0):
+				print(f"[device] status → {payload}")
 			self._battery_percent = max(5, self._battery_percent - random.choice([0, 0, 1]))
 			time.sleep(self.heartbeat_seconds)
 
@@ -134,26 +161,32 @@ class WearableSimulator:
 			"lat": round(lat, 6),
 			"lon": round(lon, 6),
 		}
-		self.client.publish(self.status_topic, json.dumps(payload), qos=0, retain=False)
-		print(f"[device] status → {payload}")
+		if self._publish("status", self.status_topic, payload, qos=0):
+			print(f"[device] status → {payload}")
+
+	def _next_msg_id(self) -> int:
+		self._msg_id += 1
+		return self._msg_id
 
-	def send_sos(self, reason: str = "double_tap") -> None:
+	def send_sos(self, reason: str = "double_tap") -> Optional[dict]:
 		if not self._armed:
 			print("[device] Ignored SOS: device is disarmed. Press 'a' to arm.")
-			return
+			return None
 		lat, lon = jitter_location(self.center_lat, self.center_lon, meters=10)
 		payload = {
 			"deviceId": self.device_id,
 			"ts": get_timestamp_iso8601(),
 			"type": "SOS",
 			"reason": reason,
+			"msgId": self._next_msg_id(),
 			"batteryPercent": self._battery_percent,
 			"lat": round(lat, 6),
 			"lon": round(lon, 6),
 			"mapsUrl": f"https://maps.google.com/?q={lat},{lon}",
 		}
-		self.client.publish(self.sos_topic, json.dumps(payload), qos=1, retain=False)
-		print(f"[device] SOS sent → {payload}")
+		if self._publish("sos", self.sos_topic, payload, qos=1):
+			print(f"[device] SOS sent → {payload}")
+		return payload
 
 	def send_tamper(self) -> None:
 		payload = {
@@ -163,8 +196,8 @@ class WearableSimulator:
 			"reason": "case_open",
 			"batteryPercent": self._battery_percent,
 		}
-		self.client.publish(self.tamper_topic, json.dumps(payload), qos=1, retain=False)
-		print(f"[device] Tamper event → {payload}")
+		if self._publish("tamper", self.tamper_topic, payload, qos=1):
+			print(f"[device] Tamper event → {payload}")
 
 	def set_low_battery(self) -> None:
 		self._battery_percent = 5
@@ -200,6 +233,335 @@ class WearableSimulator:
 		self.send_sos(reason="countdown_confirmed")
 
 
+def percentile(sorted_values: list[float], pct: float) -> float:
+	if not sorted_values:
+		return 0.0
+	k = (len(sorted_values) - 1) * pct / 100.0
+	lo = int(k)
+	hi = min(lo + 1, len(sorted_values) - 1)
+	return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+class VirtualDevice:
+	__slots__ = (
+		"device_id", "status_topic", "sos_topic", "tamper_topic", "center_lat", "center_lon",
+		"battery_percent", "client_index", "pending_sos", "ack_rtts", "msg_id",
+	)
+
+	def __init__(self, device_id: str, center_lat: float, center_lon: float, client_index: int):
+		self.device_id = device_id
+		topic_base = f"wearable/{device_id}"
+		self.status_topic = f"{topic_base}/status"
+		self.sos_topic = f"{topic_base}/sos"
+		self.tamper_topic = f"{topic_base}/tamper"
+		self.center_lat = center_lat
+		self.center_lon = center_lon
+		self.battery_percent = random.randint(40, 100)
+		self.client_index = client_index
+		# Send time by msgId; ACKs echo the msgId, so a re-ACK for a
+		# redelivered SOS is not mistaken for the answer to a newer one
+		self.pending_sos: dict[int, float] = {}
+		self.ack_rtts: list[float] = []
+		self.msg_id = 0
+
+
+class FleetSimulator:
+	# Many virtual devices share a small pool of MQTT connections and a single
+	# scheduler thread (a deadline heap), instead of one client + two threads
+	# per device. Event mix rates are per-heartbeat probabilities.
+	def __init__(
+		self,
+		broker_host: str,
+		broker_port: int,
+		count: int,
+		center_lat: float,
+		center_lon: float,
+		heartbeat_seconds: float = 10,
+		connections: int = 1,
+		sos_rate: float = 0.0,
+		tamper_rate: float = 0.0,
+		lowbatt_rate: float = 0.0,
+		prefix: str = "fleet-ring",
+		wire: str = "json",
+		buffer_size: int = 10000,
+		min_backoff: float = 1.0,
+		max_backoff: float = 60.0,
+	):
+		self.broker_host = broker_host
+		self.broker_port = broker_port
+		self.heartbeat_seconds = heartbeat_seconds
+		self.sos_rate = sos_rate
+		self.tamper_rate = tamper_rate
+		self.lowbatt_rate = lowbatt_rate
+		self.wire = wire
+
+		# Each pooled connection is a DeviceLink with its own offline buffer
+		run_id = uuid.uuid4().hex[:4]
+		self.links: list[DeviceLink] = []
+		for i in range(max(1, connections)):
+			link = DeviceLink(
+				f"{prefix}-{run_id}-pool{i}",
+				broker_host,
+				broker_port,
+				on_connect=self._on_connect,
+				on_message=self._on_message,
+				buffer_size=buffer_size,
+				min_backoff=min_backoff,
+				max_backoff=max_backoff,
+				name=f"fleet-pool{i}",
+			)
+			link.client.max_inflight_messages_set(1000)
+			self.links.append(link)
+		self.clients: list[mqtt.Client] = [link.client for link in self.links]
+		self.devices: dict[str, VirtualDevice] = {}
+		for i in range(count):
+			device_id = f"{prefix}-{run_id}-{i:05d}"
+			self.devices[device_id] = VirtualDevice(device_id, center_lat, center_lon, i % len(self.clients))
+
+		self._lock = threading.Lock()
+		self._running = False
+		self._thread: threading.Thread | None = None
+		self._started = 0.0
+		self._stopped = 0.0
+		self.published = 0
+		self.reacks = 0
+		self.max_lag = 0.0
+
+	def _on_connect(self, client):
+		# One wildcard ACK subscription on the first connection is enough
+		if client is self.clients[0]:
+			client.subscribe("wearable/+/ack", qos=1)
+
+	def _on_message(self, client, userdata, msg):
+		device_id = msg.topic.split("/")[1]
+		device = self.devices.get(device_id)
+		if device is None:
+			return
+		now = time.monotonic()
+		try:
+			msg_id = json.loads(msg.payload).get("msgId")
+		except (ValueError, AttributeError):
+			msg_id = None
+		with self._lock:
+			if msg_id is None and device.pending_sos:
+				# A server that does not echo msgId: oldest first
+				msg_id = next(iter(device.pending_sos))
+			sent = device.pending_sos.pop(msg_id, None)
+			if sent is not None:
+				device.ack_rtts.append(now - sent)
+			else:
+				self.reacks += 1
+
+	def start(self) -> None:
+		for link in self.links:
+			link.start()
+		self._running = True
+		self._started = time.monotonic()
+		self._thread = threading.Thread(target=self._run_loop, name="fleet-scheduler", daemon=True)
+		self._thread.start()
+		print(f"[fleet] {len(self.devices)} devices over {len(self.clients)} connection(s), hb={self.heartbeat_seconds}s")
+
+	def stop(self) -> None:
+		self._running = False
+		self._stopped = time.monotonic()
+		if self._thread is not None:
+			self._thread.join(timeout=2.0)
+		for link in self.links:
+			link.stop()
+
+	def _run_loop(self) -> None:
+		# Stagger first heartbeats evenly across one interval so the fleet does
+		# not publish in lockstep.
+		devices = list(self.devices.values())
+		count = len(devices) or 1
+		heap = [(self._started + self.heartbeat_seconds * i / count, i) for i in range(len(devices))]
+		heapq.heapify(heap)
+		while self._running and heap:
+			due, idx = heap[0]
+			now = time.monotonic()
+			if due > now:
+				time.sleep(min(due - now, 0.05))
+				continue
+			heapq.heapreplace(heap, (due + self.heartbeat_seconds, idx))
+			self.max_lag = max(self.max_lag, now - due)
+			self._tick(devices[idx])
+
+	def _tick(self, device: VirtualDevice) -> None:
+		link = self.links[device.client_index]
+		roll = random.random()
+		if roll < self.lowbatt_rate:
+			device.battery_percent = 5
+		lat, lon = jitter_location(device.center_lat, device.center_lon, meters=25)
+		payload = {
+			"deviceId": device.device_id,
+			"ts": get_timestamp_iso8601(),
+			"state": "armed",
+			"batteryPercent": device.battery_percent,
+			"lat": round(lat, 6),
+			"lon": round(lon, 6),
+		}
+		link.publish("status", device.status_topic, encode("status", payload, self.wire), qos=0)
+		self.published += 1
+		device.battery_percent = max(5, device.battery_percent - random.choice([0, 0, 1]))
+		roll = random.random()
+		if roll < self.sos_rate:
+			payload.update({"type": "SOS", "reason": "fleet_load", "mapsUrl": f"https://maps.google.com/?q={lat},{lon}"})
+			payload.pop("state")
+			with self._lock:
+				device.msg_id += 1
+				payload["msgId"] = device.msg_id
+				device.pending_sos[device.msg_id] = time.monotonic()
+			link.publish("sos", device.sos_topic, encode("sos", payload, self.wire), qos=1)
+			self.published += 1
+		elif roll < self.sos_rate + self.tamper_rate:
+			tamper = {
+				"deviceId": device.device_id,
+				"ts": payload["ts"],
+				"type": "TAMPER",
+				"reason": "case_open",
+				"batteryPercent": device.battery_percent,
+			}
+			link.publish("tamper", device.tamper_topic, encode("tamper", tamper, self.wire), qos=1)
+			self.published += 1
+
+	def report(self, top: int = 10) -> dict:
+		elapsed = max((self._stopped or time.monotonic()) - self._started, 1e-9)
+		with self._lock:
+			per_device = {d.device_id: sorted(d.ack_rtts) for d in self.devices.values() if d.ack_rtts}
+			unacked = sum(len(d.pending_sos) for d in self.devices.values())
+		all_rtts = sorted(rtt for rtts in per_device.values() for rtt in rtts)
+		links = [link.stats() for link in self.links]
+		buffering = {
+			"disconnects": sum(s["disconnects"] for s in links),
+			"queued": sum(s["queued"] for s in links),
+			"buffered": {k: sum(s["buffered"][k] for s in links) for k in links[0]["buffered"]},
+			"dropped": {k: sum(s["dropped"][k] for s in links) for k in links[0]["dropped"]},
+			"replayed": sum(s["replayed"] for s in links),
+			"last_outage_s": max(s["last_outage_s"] for s in links),
+			"last_drain_s": max(s["last_drain_s"] for s in links),
+		}
+		summary = {
+			"devices": len(self.devices),
+			"connections": len(self.clients),
+			"elapsed_s": round(elapsed, 2),
+			"published": self.published,
+			"publish_rate": round(self.published / elapsed, 1),
+			"max_scheduler_lag_ms": round(self.max_lag * 1000, 1),
+			"acks": len(all_rtts),
+			"reacks": self.reacks,
+			"unacked_sos": unacked,
+			"offline_buffer": buffering,
+			"ack_ms": {f"p{p}": round(percentile(all_rtts, p) * 1000, 1) for p in (50, 95, 99)},
+			"per_device_ack_ms": {
+				device_id: {f"p{p}": round(percentile(rtts, p) * 1000, 1) for p in (50, 95, 99)}
+				for device_id, rtts in per_device.items()
+			},
+		}
+		print(
+			f"[fleet] {summary['published']} publishes in {summary['elapsed_s']}s "
+			f"({summary['publish_rate']}/s, max lag {summary['max_scheduler_lag_ms']}ms); "
+			f"ACKs={summary['acks']} re-ACKs={summary['reacks']} unacked={unacked} ack p50/p95/p99="
+			f"{summary['ack_ms']['p50']}/{summary['ack_ms']['p95']}/{summary['ack_ms']['p99']} ms"
+		)
+		if buffering["disconnects"]:
+			print(
+				f"[fleet] offline buffer: {buffering['disconnects']} disconnects, buffered={buffering['buffered']} "
+				f"dropped={buffering['dropped']} replayed={buffering['replayed']} queued={buffering['queued']}; "
+				f"last outage {buffering['last_outage_s']}s, drained in {buffering['last_drain_s']}s"
+			)
+		slowest = sorted(summary["per_device_ack_ms"].items(), key=lambda kv: kv[1]["p99"], reverse=True)[:top]
+		for device_id, pcts in slowest:
+			print(f"[fleet]   {device_id}: p50={pcts['p50']} p95={pcts['p95']} p99={pcts['p99']} ms")
+		return summary
+
+
+_NUMERIC = {"batteryPercent": int, "lat": float, "lon": float}
+
+
+def load_recorded(path: str, limit: int = 0) -> list[tuple[float, str, str, dict]]:
+	# (seconds since the first event, kind, deviceId, payload) from event logs:
+	# a directory (its sos/status/tamper CSVs) or single files, plain or
+	# gzipped segments. The kind is recognised from the header row.
+	root = Path(path)
+	files = [root / name for name in CSV_FILES.values() if (root / name).exists()] if root.is_dir() else [root]
+	events = []
+	for file in files:
+		opener = gzip.open if file.suffix == ".gz" else open
+		with opener(file, "rt", newline="", encoding="utf-8") as f:
+			reader = csv.reader(f)
+			header = next(reader, [])
+			kind = next((k for k, columns in SCHEMAS.items() if columns == header), None)
+			if kind is None:
+				raise ValueError(f"{file}: not a sos/status/tamper log (header {header})")
+			for row in reader:
+				payload = {}
+				for column, value in zip(header, row):
+					if value == "" or column == "ts":
+						continue
+					convert = _NUMERIC.get(column)
+					payload[column] = convert(float(value)) if convert is not None else value
+				try:
+					at = datetime.fromisoformat(row[0]).timestamp()
+				except (ValueError, IndexError):
+					continue
+				events.append((at, kind, payload.get("deviceId", "unknown"), payload))
+	events.sort(key=lambda e: e[0])
+	if limit:
+		events = events[:limit]
+	first = events[0][0] if events else 0.0
+	return [(at - first, kind, device_id, payload) for at, kind, device_id, payload in events]
+
+
+class ReplaySimulator(FleetSimulator):
+	# Replays recorded traffic (see load_recorded) through the fleet's pooled
+	# DeviceLinks, keeping the recorded spacing divided by speed. Payloads are
+	# re-stamped with the current time; ACKs for replayed SOS are tracked per
+	# device as in fleet mode.
+	def __init__(
+		self,
+		broker_host: str,
+		broker_port: int,
+		events: list[tuple[float, str, str, dict]],
+		speed: float = 1.0,
+		loop: bool = False,
+		connections: int = 1,
+		**kwargs,
+	):
+		super().__init__(broker_host, broker_port, 0, 0.0, 0.0, connections=connections, **kwargs)
+		self.events = events
+		self.speed = max(speed, 1e-6)
+		self.loop = loop
+		for _, _, device_id, _ in events:
+			if device_id not in self.devices:
+				index = zlib.crc32(device_id.encode("utf-8")) % len(self.links)
+				self.devices[device_id] = VirtualDevice(device_id, 0.0, 0.0, index)
+
+	def _run_loop(self) -> None:
+		span = (self.events[-1][0] if self.events else 0.0) + 1.0
+		base = self._started
+		while self._running and self.events:
+			for offset, kind, device_id, payload in self.events:
+				due = base + offset / self.speed
+				while self._running and time.monotonic() < due:
+					time.sleep(min(due - time.monotonic(), 0.05))
+				if not self._running:
+					return
+				self.max_lag = max(self.max_lag, time.monotonic() - due)
+				device = self.devices[device_id]
+				message = dict(payload, ts=get_timestamp_iso8601())
+				topic = {"status": device.status_topic, "sos": device.sos_topic, "tamper": device.tamper_topic}[kind]
+				if kind == "sos":
+					with self._lock:
+						device.msg_id += 1
+						message["msgId"] = device.msg_id
+						device.pending_sos[device.msg_id] = time.monotonic()
+				self.links[device.client_index].publish(kind, topic, encode(kind, message, self.wire), qos=0 if kind == "status" else 1)
+				self.published += 1
+			if not self.loop:
+				return
+			base += span / self.speed
+
+
 def parse_args() -> argparse.Namespace:
 	parser = argparse.ArgumentParser(description="Wearable safety device simulator (MQTT)")
 	parser.add_argument("--broker", default="broker.hivemq.com", help="MQTT broker host")
@@ -207,12 +569,74 @@ def parse_args() -> argparse.Namespace:
 	parser.add_argument("--device-id", default=generate_device_id(), help="Device ID (topic segment)")
 	parser.add_argument("--center-lat", type=float, default=13.0827, help="Base latitude (default: Chennai)")
 	parser.add_argument("--center-lon", type=float, default=80.2707, help="Base longitude (default: Chennai)")
-	parser.add_argument("--hb", type=int, default=10, help="Heartbeat interval seconds")
+	parser.add_argument("--hb", type=float, default=10, help="Heartbeat interval seconds")
+	parser.add_argument("--wire", choices=("json", "binary"), default="json", help="Payload encoding (binary = compact frame, see codec.py)")
+	parser.add_argument("--buffer-size", type=int, default=0, help="Messages buffered while offline (default 1000, fleet 10000 per connection)")
+	parser.add_argument("--min-backoff", type=float, default=1.0, help="First reconnect delay in seconds (doubles per attempt, jittered)")
+	parser.add_argument("--max-backoff", type=float, default=60.0, help="Longest reconnect delay in seconds")
+	parser.add_argument("--fleet", type=int, default=0, help="Simulate N virtual devices from this process (load generation)")
+	parser.add_argument("--connections", type=int, default=1, help="Fleet mode: MQTT connections shared by all devices")
+	parser.add_argument("--sos-rate", type=float, default=0.0, help="Fleet mode: probability of an SOS per heartbeat")
+	parser.add_argument("--tamper-rate", type=float, default=0.0, help="Fleet mode: probability of a tamper event per heartbeat")
+	parser.add_argument("--lowbatt-rate", type=float, default=0.0, help="Fleet mode: probability of dropping to low battery per heartbeat")
+	parser.add_argument("--duration", type=float, default=0, help="Fleet mode: stop after this many seconds (0 = until Ctrl+C)")
+	parser.add_argument("--report-every", type=float, default=10, help="Fleet mode: seconds between progress reports")
+	parser.add_argument("--replay", help="Fleet mode: replay a log directory or status/sos/tamper CSV (plain or .gz) instead of synthetic traffic")
+	parser.add_argument("--speed", type=float, default=1.0, help="Replay speed multiplier")
+	parser.add_argument("--replay-loop", action="store_true", help="Start the recording over when it ends")
+	parser.add_argument("--fleet-json", help="Fleet mode: write the final report (with per-device ACK percentiles) here")
 	return parser.parse_args()
 
 
+def run_fleet(args: argparse.Namespace) -> None:
+	link_options = {
+		"wire": args.wire,
+		"buffer_size": args.buffer_size or 10000,
+		"min_backoff": args.min_backoff,
+		"max_backoff": args.max_backoff,
+	}
+	if args.replay:
+		events = load_recorded(args.replay)
+		print(f"[fleet] replaying {len(events)} events from {args.replay} at {args.speed}x")
+		fleet: FleetSimulator = ReplaySimulator(
+			args.broker, args.port, events, speed=args.speed, loop=args.replay_loop, connections=args.connections, **link_options
+		)
+	else:
+		fleet = FleetSimulator(
+			broker_host=args.broker,
+			broker_port=args.port,
+			count=args.fleet,
+			center_lat=args.center_lat,
+			center_lon=args.center_lon,
+			heartbeat_seconds=args.hb,
+			connections=args.connections,
+			sos_rate=args.sos_rate,
+			tamper_rate=args.tamper_rate,
+			lowbatt_rate=args.lowbatt_rate,
+			**link_options,
+		)
+	fleet.start()
+	deadline = time.monotonic() + args.duration if args.duration > 0 else None
+	try:
+		while deadline is None or time.monotonic() < deadline:
+			wait = args.report_every if deadline is None else min(args.report_every, deadline - time.monotonic())
+			time.sleep(max(0.0, wait))
+			fleet.report(top=0)
+	except KeyboardInterrupt:
+		pass
+	finally:
+		fleet.stop()
+		summary = fleet.report()
+		if args.fleet_json:
+			with open(args.fleet_json, "w", encoding="utf-8") as f:
+				json.dump(summary, f, indent=2)
+
+
 def main() -> None:
 	args = parse_args()
+	if args.fleet or args.replay:
+		run_fleet(args)
+		return
 	sim = WearableSimulator(
 		broker_host=args.broker,
 		broker_port=args.port,
@@ -220,6 +644,10 @@ def main() -> None:
 		center_lat=args.center_lat,
 		center_lon=args.center_lon,
 		heartbeat_seconds=args.hb,
+		wire=args.wire,
+		buffer_size=args.buffer_size or 1000,
+		min_backoff=args.min_backoff,
+		max_backoff=args.max_backoff,
 	)
 	try:
 		sim.start()
@@ -0,0 +1,224 @@
+import collections
+import random
+import threading
+import time
+from typing import Callable, Optional
+
+import paho.mqtt.client as mqtt
+
+
+# Device-side MQTT session for the simulators, behaving like a ring with a
+# small flash queue: a persistent session (clean_session=False, so the broker
+# keeps subscriptions and queued ACKs across a reconnect), reconnects with
+# jittered exponential backoff so a fleet does not reconnect in lockstep, and
+# a bounded store-and-forward buffer for everything published while offline.
+# The buffer replays SOS first, then tamper, then heartbeats oldest-first; when
+# full it evicts the oldest message of the least important kind, and a
+# message is only discarded in favour of one at least as important.
+
+KIND_PRIORITY = {"sos": 0, "tamper": 1, "status": 2}
+_KINDS = {p: kind for kind, p in KIND_PRIORITY.items()}
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+	# "Equal jitter": half the exponential step is fixed, half is random
+	step = min(cap, base * (2 ** min(attempt, 30)))
+	return step / 2 + random.uniform(0, step / 2)
+
+
+class PublishBuffer:
+	def __init__(self, capacity: int = 1000):
+		self.capacity = max(1, capacity)
+		self._lanes = [collections.deque() for _ in range(len(KIND_PRIORITY))]
+		self._size = 0
+		self._lock = threading.Lock()
+		self.buffered = {kind: 0 for kind in KIND_PRIORITY}
+		self.dropped = {kind: 0 for kind in KIND_PRIORITY}
+
+	def __len__(self) -> int:
+		return self._size
+
+	def push(self, kind: str, topic: str, payload: bytes, qos: int) -> bool:
+		priority = KIND_PRIORITY[kind]
+		with self._lock:
+			if self._size >= self.capacity:
+				victim = max(p for p, lane in enumerate(self._lanes) if lane)
+				if victim < priority:
+					self.dropped[kind] += 1
+					return False
+				self._lanes[victim].popleft()
+				self.dropped[_KINDS[victim]] += 1
+				self._size -= 1
+			self._lanes[priority].append((kind, topic, payload, qos))
+			self._size += 1
+			self.buffered[kind] += 1
+			return True
+
+	def pop(self) -> Optional[tuple[str, str, bytes, int]]:
+		with self._lock:
+			for lane in self._lanes:
+				if lane:
+					self._size -= 1
+					return lane.popleft()
+		return None
+
+	def requeue(self, item: tuple[str, str, bytes, int]) -> None:
+		# Put back a message that could not be handed to the client
+		with self._lock:
+			self._lanes[KIND_PRIORITY[item[0]]].appendleft(item)
+			self._size += 1
+
+
+class DeviceLink:
+	def __init__(
+		self,
+		client_id: str,
+		host: str,
+		port: int,
+		on_connect: Optional[Callable[[mqtt.Client], None]] = None,
+		on_message: Optional[Callable] = None,
+		keepalive: int = 60,
+		buffer_size: int = 1000,
+		min_backoff: float = 1.0,
+		max_backoff: float = 60.0,
+		drain_chunk: int = 100,
+		name: str = "device",
+	):
+		self.host = host
+		self.port = port
+		self.keepalive = keepalive
+		self.min_backoff = min_backoff
+		self.max_backoff = max_backoff
+		self.drain_chunk = max(1, drain_chunk)
+		self.name = name
+		self.client = mqtt.Client(client_id=client_id, clean_session=False)
+		self.client.on_connect = self._on_connect
+		self.client.on_disconnect = self._on_disconnect
+		if on_message is not None:
+			self.client.on_message = on_message
+		self._user_on_connect = on_connect
+		self.buffer = PublishBuffer(buffer_size)
+		self._connected = threading.Event()
+		self._stopping = threading.Event()
+		self._thread: Optional[threading.Thread] = None
+		self._attempt = 0
+		self._offline_since: Optional[float] = None
+		self._reconnected_at: Optional[float] = None
+		self.published = 0
+		self.replayed = 0
+		self.connects = 0
+		self.disconnects = 0
+		self.last_outage_seconds = 0.0
+		self.last_drain_seconds = 0.0
+
+	@property
+	def connected(self) -> bool:
+		return self._connected.is_set()
+
+	def start(self) -> None:
+		if self._thread is not None:
+			return
+		self._stopping.clear()
+		self._thread = threading.Thread(target=self._network_loop, name=f"{self.name}-mqtt", daemon=True)
+		self._thread.start()
+
+	def stop(self, timeout: float = 2.0) -> None:
+		self._stopping.set()
+		if self._thread is not None:
+			self._thread.join(timeout=timeout)
+			self._thread = None
+		try:
+			self.client.disconnect()
+		except Exception:
+			pass
+		self._connected.clear()
+
+	def publish(self, kind: str, topic: str, payload: bytes, qos: int = 0) -> bool:
+		# Publish now if online with nothing older waiting, else buffer.
+		# Returns False when the message was buffered (or dropped).
+		if self._connected.is_set() and not len(self.buffer):
+			info = self.client.publish(topic, payload, qos=qos, retain=False)
+			if info.rc == mqtt.MQTT_ERR_SUCCESS:
+				self.published += 1
+				return True
+		self.buffer.push(kind, topic, payload, qos)
+		return False
+
+	def _on_connect(self, client, userdata, flags, rc):
+		if rc != 0:
+			print(f"[{self.name}] MQTT connect refused (rc={rc})")
+			return
+		self.connects += 1
+		self._attempt = 0
+		if self._offline_since is not None:
+			self.last_outage_seconds = time.monotonic() - self._offline_since
+			self._offline_since = None
+		self._reconnected_at = time.monotonic()
+		if self._user_on_connect is not None:
+			self._user_on_connect(client)
+		self._connected.set()
+
+	def _on_disconnect(self, client, userdata, rc):
+		self._connected.clear()
+		self.disconnects += 1
+		if self._offline_since is None:
+			self._offline_since = time.monotonic()
+
+	def _network_loop(self) -> None:
+		first = True
+		while not self._stopping.is_set():
+			try:
+				if first:
+					self.client.connect(self.host, self.port, keepalive=self.keepalive)
+					first = False
+				else:
+					self.client.reconnect()
+			except (OSError, ValueError) as exc:
+				self._wait_backoff(f"connect failed: {exc}")
+				continue
+			while not self._stopping.is_set():
+				if self.client.loop(timeout=0.1) != mqtt.MQTT_ERR_SUCCESS:
+					break
+				if self._connected.is_set() and len(self.buffer):
+					self._drain()
+			if self._connected.is_set():
+				self._on_disconnect(self.client, None, None)
+			if not self._stopping.is_set():
+				self._wait_backoff("connection lost")
+
+	def _wait_backoff(self, reason: str) -> None:
+		if self._offline_since is None:
+			self._offline_since = time.monotonic()
+		delay = backoff_delay(self._attempt, self.min_backoff, self.max_backoff)
+		self._attempt += 1
+		print(f"[{self.name}] {reason}; reconnecting in {delay:.1f}s ({len(self.buffer)} buffered)")
+		self._stopping.wait(delay)
+
+	def _drain(self) -> None:
+		# A chunk per loop iteration, so ACKs and keepalives keep flowing
+		for _ in range(self.drain_chunk):
+			item = self.buffer.pop()
+			if item is None:
+				break
+			_, topic, payload, qos = item
+			if self.client.publish(topic, payload, qos=qos, retain=False).rc != mqtt.MQTT_ERR_SUCCESS:
+				self.buffer.requeue(item)
+				return
+			self.replayed += 1
+		if not len(self.buffer) and self._reconnected_at is not None:
+			self.last_drain_seconds = time.monotonic() - self._reconnected_at
+			self._reconnected_at = None
+
+	def stats(self) -> dict:
+		return {
+			"connected": self._connected.is_set(),
+			"connects": self.connects,
+			"disconnects": self.disconnects,
+			"published": self.published,
+			"queued": len(self.buffer),
+			"buffered": dict(self.buffer.buffered),
+			"dropped": dict(self.buffer.dropped),
+			"replayed": self.replayed,
+			"last_outage_s": round(self.last_outage_seconds, 2),
+			"last_drain_s": round(self.last_drain_seconds, 2),
+		}
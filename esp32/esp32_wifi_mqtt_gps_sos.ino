@@ -139,7 +139,9 @@ void publishSOS(const char* reason) {
     payload += "\"lat\":null,\"lon\":null";
   }
   payload += "}";
-  mqtt.publish(topicSos.c_str(), payload.c_str(), true);
+  // Not retained: the broker would replay it to the server on every reconnect, and
+  // the server ignores retained SOS (it treats them as stale, not as a new press)
+  mqtt.publish(topicSos.c_str(), payload.c_str(), false);
   // alert beep
   beep(180, 120, 2);
 }
@@ -151,7 +153,7 @@ void publishTamper(const char* reason) {
   payload += "\"reason\":\"" + String(reason) + "\",";
   payload += "\"batteryPercent\":" + String(batteryPercent);
   payload += "}";
-  mqtt.publish(topicTamper.c_str(), payload.c_str(), true);
+  mqtt.publish(topicTamper.c_str(), payload.c_str(), false);
   beep(60, 60, 4);
 }
 
@@ -0,0 +1,191 @@
+import json
+import math
+from pathlib import Path
+from typing import Iterable, Optional
+
+
+# Safe/danger zones per device, checked on every heartbeat with a fix. Fences
+# are bucketed in a uniform lat/lon grid keyed by (owner, cell), where owner
+# is the device id or "*" for fences that apply to every device, so a check
+# costs two dict lookups plus exact tests against only the fences of that
+# device overlapping the point's cell. Which fences each device is inside is
+# remembered, so an alert fires once per transition rather than on every
+# heartbeat. A fence that contains a point always overlaps the point's cell,
+# so fences the device has left never need re-testing. Not thread-safe: call
+# from one thread (the MQTT thread, or the status pipeline applier).
+
+EARTH_RADIUS_M = 6_371_000.0
+ANY_DEVICE = "*"
+_OUTSIDE: frozenset = frozenset()
+
+
+class Fence:
+	__slots__ = ("fence_id", "device_id", "kind", "name", "lat", "lon", "radius_m", "polygon", "bbox")
+
+	def __init__(
+		self,
+		fence_id: str,
+		kind: str,
+		name: str = "",
+		device_id: str = ANY_DEVICE,
+		lat: Optional[float] = None,
+		lon: Optional[float] = None,
+		radius_m: Optional[float] = None,
+		polygon: Optional[list[tuple[float, float]]] = None,
+	):
+		if kind not in ("safe", "danger"):
+			raise ValueError(f"fence {fence_id}: kind must be safe or danger, not {kind!r}")
+		self.fence_id = fence_id
+		self.device_id = device_id
+		self.kind = kind
+		self.name = name or fence_id
+		self.lat = lat
+		self.lon = lon
+		self.radius_m = radius_m
+		self.polygon = [(float(a), float(b)) for a, b in polygon] if polygon else None
+		if self.polygon:
+			lats = [p[0] for p in self.polygon]
+			lons = [p[1] for p in self.polygon]
+			self.bbox = (min(lats), max(lats), min(lons), max(lons))
+		elif lat is not None and lon is not None and radius_m:
+			dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+			dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+			self.bbox = (lat - dlat, lat + dlat, lon - dlon, lon + dlon)
+		else:
+			raise ValueError(f"fence {fence_id}: needs lat/lon/radius or polygon")
+
+	def contains(self, lat: float, lon: float) -> bool:
+		if self.polygon is None:
+			# Equirectangular distance: well within GPS error at fence sizes
+			x = math.radians(lon - self.lon) * math.cos(math.radians((lat + self.lat) / 2))
+			y = math.radians(lat - self.lat)
+			return (x * x + y * y) * EARTH_RADIUS_M * EARTH_RADIUS_M <= self.radius_m * self.radius_m
+		# Ray casting (even-odd) in lat/lon space
+		inside = False
+		points = self.polygon
+		j = len(points) - 1
+		for i in range(len(points)):
+			lat_i, lon_i = points[i]
+			lat_j, lon_j = points[j]
+			if (lon_i > lon) != (lon_j > lon) and lat < (lat_j - lat_i) * (lon - lon_i) / (lon_j - lon_i) + lat_i:
+				inside = not inside
+			j = i
+		return inside
+
+
+class GeofenceEvent:
+	__slots__ = ("device_id", "fence", "entered")
+
+	def __init__(self, device_id: str, fence: Fence, entered: bool):
+		self.device_id = device_id
+		self.fence = fence
+		self.entered = entered
+
+	@property
+	def alarming(self) -> bool:
+		# Leaving a safe zone or entering a danger zone
+		return self.entered == (self.fence.kind == "danger")
+
+	def describe(self) -> str:
+		verb = "entered" if self.entered else "left"
+		return f"{self.device_id} {verb} {self.fence.kind} zone '{self.fence.name}'"
+
+
+class GeofenceEngine:
+	def __init__(self, cell_degrees: float = 0.01):
+		self.cell_degrees = cell_degrees
+		self._cells: dict[tuple[str, int, int], list[Fence]] = {}
+		self._fences: dict[str, Fence] = {}
+		self._inside: dict[str, frozenset] = {}
+		self._owners: set[str] = set()
+		self.checks = 0
+		self.tests = 0
+
+	def __len__(self) -> int:
+		return len(self._fences)
+
+	def _cell_range(self, fence: Fence) -> Iterable[tuple[int, int]]:
+		lat_min, lat_max, lon_min, lon_max = fence.bbox
+		size = self.cell_degrees
+		for cx in range(math.floor(lat_min / size), math.floor(lat_max / size) + 1):
+			for cy in range(math.floor(lon_min / size), math.floor(lon_max / size) + 1):
+				yield cx, cy
+
+	def add(self, fence: Fence) -> None:
+		if fence.fence_id in self._fences:
+			self.remove(fence.fence_id)
+		self._fences[fence.fence_id] = fence
+		self._owners.add(fence.device_id)
+		for cx, cy in self._cell_range(fence):
+			self._cells.setdefault((fence.device_id, cx, cy), []).append(fence)
+
+	def remove(self, fence_id: str) -> None:
+		fence = self._fences.pop(fence_id, None)
+		if fence is None:
+			return
+		for cx, cy in self._cell_range(fence):
+			key = (fence.device_id, cx, cy)
+			bucket = [f for f in self._cells.get(key, ()) if f.fence_id != fence_id]
+			if bucket:
+				self._cells[key] = bucket
+			else:
+				self._cells.pop(key, None)
+		for device_id, inside in list(self._inside.items()):
+			if fence_id in inside:
+				self._inside[device_id] = inside - {fence_id}
+
+	def check(self, device_id: str, lat: float, lon: float) -> list[GeofenceEvent]:
+		if device_id not in self._owners and ANY_DEVICE not in self._owners:
+			return []
+		self.checks += 1
+		cx, cy = math.floor(lat / self.cell_degrees), math.floor(lon / self.cell_degrees)
+		now_inside = _OUTSIDE
+		for owner in (device_id, ANY_DEVICE):
+			if owner not in self._owners:
+				continue
+			for fence in self._cells.get((owner, cx, cy), ()):
+				self.tests += 1
+				if fence.contains(lat, lon):
+					now_inside = now_inside | {fence.fence_id}
+		before = self._inside.get(device_id)
+		if before is None:
+			# First fix: establish state; only being inside a danger zone is news
+			self._inside[device_id] = now_inside
+			return [GeofenceEvent(device_id, self._fences[f], True) for f in now_inside if self._fences[f].kind == "danger"]
+		if now_inside == before:
+			return []
+		events = [GeofenceEvent(device_id, self._fences[f], True) for f in now_inside - before]
+		events.extend(GeofenceEvent(device_id, self._fences[f], False) for f in before - now_inside if f in self._fences)
+		self._inside[device_id] = now_inside
+		return events
+
+	def inside(self, device_id: str) -> list[Fence]:
+		return [self._fences[f] for f in self._inside.get(device_id, ()) if f in self._fences]
+
+	def stats(self) -> dict:
+		return {
+			"fences": len(self._fences),
+			"cells": len(self._cells),
+			"checks": self.checks,
+			"tests_per_check": round(self.tests / self.checks, 2) if self.checks else 0.0,
+		}
+
+
+def load_fences(path: Path) -> list[Fence]:
+	# JSON list of {"id", "kind": safe|danger, "name", "device" (omit for all
+	# devices), and either "lat"/"lon"/"radius" (metres) or "polygon": [[lat, lon], ...]}
+	fences = []
+	for item in json.loads(path.read_text(encoding="utf-8")):
+		fences.append(
+			Fence(
+				str(item["id"]),
+				item["kind"],
+				name=item.get("name", ""),
+				device_id=item.get("device") or ANY_DEVICE,
+				lat=item.get("lat"),
+				lon=item.get("lon"),
+				radius_m=item.get("radius"),
+				polygon=item.get("polygon"),
+			)
+		)
+	return fences
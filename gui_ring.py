@@ -7,10 +7,12 @@ import uuid
 from datetime import datetime, timezone
 from typing import Optional
 
-import paho.mqtt.client as mqtt
 import tkinter as tk
 from tkinter import ttk
 
+from codec import encode
+from devlink import DeviceLink
+
 
 def iso_now() -> str:
 	return datetime.now(timezone.utc).isoformat()
@@ -30,24 +32,48 @@ def jitter_location(base_lat: float, base_lon: float, meters: float = 20.0) -> t
 
 
 class GuiWearableApp:
-	def __init__(self, broker: str, port: int, device_id: str, center_lat: float, center_lon: float, hb: int):
+	def __init__(
+		self,
+		broker: str,
+		port: int,
+		device_id: str,
+		center_lat: float,
+		center_lon: float,
+		hb: int,
+		wire: str = "json",
+		buffer_size: int = 1000,
+		min_backoff: float = 1.0,
+		max_backoff: float = 60.0,
+	):
 		self.broker = broker
 		self.port = port
 		self.device_id = device_id
 		self.center_lat = center_lat
 		self.center_lon = center_lon
 		self.hb = hb
+		self.wire = wire
 
 		self.topic_base = f"wearable/{self.device_id}"
 		self.status_topic = f"{self.topic_base}/status"
 		self.sos_topic = f"{self.topic_base}/sos"
 		self.ack_topic = f"{self.topic_base}/ack"
 		self.tamper_topic = f"{self.topic_base}/tamper"
-
-		self.client = mqtt.Client(client_id=f"{self.device_id}-gui")
-		self.client.on_connect = self._on_connect
-		self.client.on_disconnect = self._on_disconnect
-		self.client.on_message = self._on_message
+		# Monotonic per-device message id, so the server can recognise redeliveries
+		self._msg_id = 0
+
+		# Reconnects with backoff and buffers publishes while offline (see devlink.py)
+		self.link = DeviceLink(
+			f"{self.device_id}-gui",
+			broker,
+			port,
+			on_connect=self._on_connect,
+			on_message=self._on_message,
+			buffer_size=buffer_size,
+			min_backoff=min_backoff,
+			max_backoff=max_backoff,
+			name="gui",
+		)
+		self.client = self.link.client
 
 		self.root = tk.Tk()
 		self.root.title(f"Wearable Ring Simulator - {self.device_id}")
@@ -66,7 +92,7 @@ class GuiWearableApp:
 		self.root.bind("<space>", lambda e: self.handle_sos())
 
 		self._heartbeat_job: Optional[str] = None
-		self._connected = False
+		self._link_job: Optional[str] = None
 
 	def _build_ui(self) -> None:
 		frame = ttk.Frame(self.root, padding=16)
@@ -114,22 +140,24 @@ class GuiWearableApp:
 		footer.pack(pady=(8, 0))
 
 	def connect(self) -> None:
-		try:
-			self.client.connect(self.broker, self.port, keepalive=60)
-			self.client.loop_start()
-		except Exception as exc:
-			self.is_connected.set(f"Connect error: {exc}")
-
-	def _on_connect(self, client, userdata, flags, rc):
-		self._connected = True
-		self.is_connected.set(f"Connected to {self.broker}:{self.port}")
-		self.client.subscribe(self.ack_topic, qos=1)
+		self.link.start()
+		self._refresh_link()
 		self._schedule_heartbeat()
 
-	def _on_disconnect(self, client, userdata, rc):
-		self._connected = False
-		self.is_connected.set(f"Disconnected (rc={rc})")
-		self._cancel_heartbeat()
+	def _on_connect(self, client):
+		# Runs on the link's network thread; the label is refreshed by _refresh_link
+		client.subscribe(self.ack_topic, qos=1)
+
+	def _refresh_link(self) -> None:
+		stats = self.link.stats()
+		if stats["connected"]:
+			status = f"Connected to {self.broker}:{self.port}"
+			if stats["queued"]:
+				status += f" (sending {stats['queued']} buffered)"
+		else:
+			status = f"Offline, reconnecting ({stats['queued']} buffered, {sum(stats['dropped'].values())} dropped)"
+		self.is_connected.set(status)
+		self._link_job = self.root.after(500, self._refresh_link)
 
 	def _on_message(self, client, userdata, msg):
 		if msg.topic == self.ack_topic:
@@ -154,8 +182,7 @@ class GuiWearableApp:
 			self._heartbeat_job = None
 
 	def _heartbeat(self) -> None:
-		if not self._connected:
-			return
+		# Heartbeats keep running while offline; the link buffers them
 		lat, lon = jitter_location(self.center_lat, self.center_lon, meters=20)
 		self.location_label.set(f"lat: {lat:.6f}, lon: {lon:.6f}")
 		payload = {
@@ -166,15 +193,16 @@ class GuiWearableApp:
 			"lat": round(lat, 6),
 			"lon": round(lon, 6),
 		}
-		self.client.publish(self.status_topic, json.dumps(payload), qos=0, retain=False)
+		self.link.publish("status", self.status_topic, encode("status", payload, self.wire), qos=0)
 		new_batt = max(5, self.battery_percent.get() - random.choice([0, 0, 1]))
 		self.battery_percent.set(new_batt)
 		self._schedule_heartbeat()
 
+	def _next_msg_id(self) -> int:
+		self._msg_id += 1
+		return self._msg_id
+
 	def handle_sos(self) -> None:
-		if not self._connected:
-			self.is_connected.set("Not connected")
-			return
 		if self.armed_state.get() != "armed":
 			self.countdown_label.set("Device is disarmed. Toggle Arm first.")
 			self.root.after(2500, lambda: self.countdown_label.set(""))
@@ -221,14 +249,17 @@ class GuiWearableApp:
 				"ts": iso_now(),
 				"type": "SOS",
 				"reason": "gui_button_countdown",
+				"msgId": self._next_msg_id(),
 				"batteryPercent": self.battery_percent.get(),
 				"lat": round(lat, 6),
 				"lon": round(lon, 6),
 				"mapsUrl": f"https://maps.google.com/?q={lat},{lon}",
 			}
-			self.client.publish(self.sos_topic, json.dumps(payload), qos=1, retain=False)
-			self._flash_button()
-			self.countdown_label.set("")
+			if self.link.publish("sos", self.sos_topic, encode("sos", payload, self.wire), qos=1):
+				self._flash_button()
+				self.countdown_label.set("")
+			else:
+				self.countdown_label.set("Offline: SOS queued, sent first on reconnect")
 		else:
 			self.countdown_label.set("SOS cancelled")
 			self.root.after(1500, lambda: self.countdown_label.set(""))
@@ -243,10 +274,8 @@ class GuiWearableApp:
 		self.armed_state.set(new_state)
 
 	def send_tamper(self) -> None:
-		if not self._connected:
-			return
 		payload = {"deviceId": self.device_id, "ts": iso_now(), "type": "TAMPER", "reason": "gui_button"}
-		self.client.publish(self.tamper_topic, json.dumps(payload), qos=1, retain=False)
+		self.link.publish("tamper", self.tamper_topic, encode("tamper", payload, self.wire), qos=1)
 
 	def set_low_battery(self) -> None:
 		self.battery_percent.set(5)
@@ -254,11 +283,9 @@ class GuiWearableApp:
 
 	def quit(self) -> None:
 		self._cancel_heartbeat()
-		try:
-			self.client.loop_stop()
-			self.client.disconnect()
-		except Exception:
-			pass
+		if self._link_job:
+			self.root.after_cancel(self._link_job)
+		self.link.stop()
 		self.root.destroy()
 
 	def run(self) -> None:
@@ -274,6 +301,10 @@ def parse_args() -> argparse.Namespace:
 	parser.add_argument("--center-lat", type=float, default=13.0827, help="Base latitude (default: Chennai)")
 	parser.add_argument("--center-lon", type=float, default=80.2707, help="Base longitude (default: Chennai)")
 	parser.add_argument("--hb", type=int, default=10, help="Heartbeat interval seconds")
+	parser.add_argument("--wire", choices=("json", "binary"), default="json", help="Payload encoding (binary = compact frame, see codec.py)")
+	parser.add_argument("--buffer-size", type=int, default=1000, help="Messages buffered while offline")
+	parser.add_argument("--min-backoff", type=float, default=1.0, help="First reconnect delay in seconds (doubles per attempt, jittered)")
+	parser.add_argument("--max-backoff", type=float, default=60.0, help="Longest reconnect delay in seconds")
 	return parser.parse_args()
 
 
@@ -286,6 +317,10 @@ def main() -> None:
 		center_lat=args.center_lat,
 		center_lon=args.center_lon,
 		hb=args.hb,
+		wire=args.wire,
+		buffer_size=args.buffer_size,
+		min_backoff=args.min_backoff,
+		max_backoff=args.max_backoff,
 	)
 	app.run()
 
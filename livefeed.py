@@ -0,0 +1,373 @@
+import collections
+import json
+import selectors
+import socket
+import threading
+import time
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+
+from registry import DeviceRecord, DeviceRegistry
+
+
+# Live fleet view for dashboards as Server-Sent Events (GET /feed, consumed
+# with a browser EventSource). Ingestion threads only mark devices dirty
+# (touch) or queue discrete events (SOS raised/ACKed, tamper, offline,
+# geofence, battery); everything else runs on one selector thread:
+#
+# - every tick, dirty devices are diffed against the last state sent and
+#   only changed fields go out, so a ring heartbeating 10x per tick costs one
+#   delta. Each device's delta is encoded once and shared by all subscribers.
+# - subscribers may filter by device id (?devices=a,b) or prefix (?prefix=).
+# - sockets are non-blocking and each subscriber has its own frame queue. A
+#   subscriber still more than max_buffer bytes behind when the next tick
+#   comes has its pending frames dropped and gets a fresh snapshot ("resync")
+#   once it has caught up; one lagging for stall_seconds is disconnected. A
+#   slow dashboard therefore costs about max_buffer plus one tick of memory,
+#   never time on the ingestion path.
+
+# last_ts/last_seen change on every heartbeat and are left out, so a ring
+# that is idle in one place sends nothing; "offline" events cover liveness
+FIELDS = ("state", "battery", "lat", "lon", "offline", "last_sos", "last_tamper")
+
+_HEADERS = (
+	b"HTTP/1.1 200 OK\r\n"
+	b"Content-Type: text/event-stream\r\n"
+	b"Cache-Control: no-cache\r\n"
+	b"Connection: keep-alive\r\n"
+	b"Access-Control-Allow-Origin: *\r\n\r\n"
+)
+_NOT_FOUND = b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+_PING = b": ping\n\n"
+
+
+def _frame(event: str, data: bytes) -> bytes:
+	return b"event: " + event.encode("ascii") + b"\ndata: " + data + b"\n\n"
+
+
+def _delta(stamp: bytes, fragments) -> bytes:
+	# Splices pre-encoded '"id":{...}' fragments into one delta frame
+	return _frame("delta", b'{"t":' + stamp + b',"devices":{' + b",".join(fragments) + b"}}")
+
+
+def _values(record: DeviceRecord) -> tuple:
+	lat, lon = record.lat, record.lon
+	return (
+		record.state,
+		record.battery,
+		None if lat is None else round(lat, 6),
+		None if lon is None else round(lon, 6),
+		record.offline,
+		record.last_sos,
+		record.last_tamper,
+	)
+
+
+class _Subscriber:
+	__slots__ = ("sock", "request", "frames", "offset", "queued", "devices", "prefix", "lagging_since", "resync", "sent", "dropped")
+
+	def __init__(self, sock: socket.socket):
+		self.sock = sock
+		self.request = b""
+		self.frames: collections.deque = collections.deque()
+		self.offset = 0
+		self.queued = 0
+		self.devices: Optional[frozenset] = None
+		self.prefix: Optional[str] = None
+		self.lagging_since: Optional[float] = None
+		self.resync = False
+		self.sent = 0
+		self.dropped = 0
+
+	@property
+	def filtered(self) -> bool:
+		return self.devices is not None or self.prefix is not None
+
+	def wants(self, device_id: str) -> bool:
+		if self.devices is not None and device_id not in self.devices:
+			return False
+		return self.prefix is None or device_id.startswith(self.prefix)
+
+
+class LiveFeed:
+	def __init__(
+		self,
+		registry: DeviceRegistry,
+		host: str = "127.0.0.1",
+		port: int = 0,
+		tick_seconds: float = 0.5,
+		max_buffer: int = 256 * 1024,
+		stall_seconds: float = 30.0,
+		max_events: int = 10000,
+		ping_seconds: float = 15.0,
+	):
+		self.registry = registry
+		self.host = host
+		self.port = port
+		self.tick_seconds = tick_seconds
+		self.max_buffer = max_buffer
+		self.stall_seconds = stall_seconds
+		self.ping_seconds = ping_seconds
+		self._dirty: set[str] = set()
+		self._events: collections.deque = collections.deque(maxlen=max(1, max_events))
+		self._lock = threading.Lock()
+		self._sent: dict[str, tuple] = {}
+		self._subscribers: dict[int, _Subscriber] = {}
+		self._selector: Optional[selectors.BaseSelector] = None
+		self._listener: Optional[socket.socket] = None
+		self._stop = threading.Event()
+		self._thread: Optional[threading.Thread] = None
+		self.ticks = 0
+		self.deltas = 0
+		self.events = 0
+		self.resyncs = 0
+		self.disconnected = 0
+
+	def __len__(self) -> int:
+		return len(self._subscribers)
+
+	# Producer side: called from the MQTT, pipeline applier and offline threads
+
+	def touch(self, device_id: str) -> None:
+		with self._lock:
+			self._dirty.add(device_id)
+
+	def event(self, kind: str, device_id: str, **fields) -> None:
+		fields["deviceId"] = device_id
+		fields["t"] = time.time()
+		with self._lock:
+			self._events.append((kind, device_id, fields))
+
+	# Feed thread
+
+	def start(self) -> None:
+		listener = socket.create_server((self.host, self.port))
+		listener.setblocking(False)
+		self._listener = listener
+		self.port = listener.getsockname()[1]
+		self._selector = selectors.DefaultSelector()
+		self._selector.register(listener, selectors.EVENT_READ)
+		self._stop.clear()
+		self._thread = threading.Thread(target=self._run, name="livefeed", daemon=True)
+		self._thread.start()
+		print(f"[live] serving http://{self.host}:{self.port}/feed (SSE, tick {self.tick_seconds}s)")
+
+	def stop(self) -> None:
+		self._stop.set()
+		if self._thread is not None:
+			self._thread.join(timeout=2.0)
+			self._thread = None
+		for sub in list(self._subscribers.values()):
+			self._close(sub)
+		if self._listener is not None:
+			self._listener.close()
+			self._listener = None
+		if self._selector is not None:
+			self._selector.close()
+			self._selector = None
+
+	def _run(self) -> None:
+		next_tick = time.monotonic() + self.tick_seconds
+		next_ping = time.monotonic() + self.ping_seconds
+		while not self._stop.is_set():
+			for key, mask in self._selector.select(max(0.0, next_tick - time.monotonic())):
+				if key.fileobj is self._listener:
+					self._accept()
+					continue
+				sub = key.data
+				if mask & selectors.EVENT_READ:
+					self._read(sub)
+				if mask & selectors.EVENT_WRITE and sub.sock.fileno() >= 0:
+					self._flush(sub)
+			now = time.monotonic()
+			if now >= next_tick:
+				next_tick = max(next_tick + self.tick_seconds, now)
+				self._tick(now)
+			if now >= next_ping:
+				next_ping = now + self.ping_seconds
+				for sub in list(self._subscribers.values()):
+					if sub.request is None:
+						self._send(sub, _PING, now)
+
+	def _accept(self) -> None:
+		while True:
+			try:
+				sock, _ = self._listener.accept()
+			except (BlockingIOError, InterruptedError):
+				return
+			sock.setblocking(False)
+			sub = _Subscriber(sock)
+			self._subscribers[sock.fileno()] = sub
+			self._selector.register(sock, selectors.EVENT_READ, sub)
+
+	def _read(self, sub: _Subscriber) -> None:
+		try:
+			data = sub.sock.recv(4096)
+		except (BlockingIOError, InterruptedError):
+			return
+		except OSError:
+			data = b""
+		if not data:
+			self._close(sub)
+			return
+		if sub.request is None:
+			# Already streaming; anything else the client sends is ignored
+			return
+		sub.request += data
+		if b"\r\n\r\n" not in sub.request:
+			if len(sub.request) > 8192:
+				self._close(sub)
+			return
+		line = sub.request.split(b"\r\n", 1)[0].decode("latin-1")
+		parts = line.split()
+		url = urlsplit(parts[1] if len(parts) > 1 else "/")
+		if parts[:1] != ["GET"] or url.path not in ("/feed", "/"):
+			sub.sock.send(_NOT_FOUND)
+			self._close(sub)
+			return
+		query = parse_qs(url.query)
+		devices = [d for v in query.get("devices", []) for d in v.split(",") if d]
+		sub.devices = frozenset(devices) if devices else None
+		sub.prefix = query.get("prefix", [None])[0] or None
+		sub.request = None
+		self._send(sub, _HEADERS, time.monotonic())
+		self._snapshot(sub, time.monotonic())
+
+	def _snapshot(self, sub: _Subscriber, now: float, cache: Optional[dict] = None) -> None:
+		# cache: unfiltered snapshot shared by the resyncs of one tick
+		if not sub.filtered and cache is not None and "frame" in cache:
+			self._send(sub, cache["frame"], now)
+			return
+		if sub.devices is not None:
+			records = [r for r in map(self.registry.get, sub.devices) if r is not None and sub.wants(r.device_id)]
+		else:
+			records = [r for r in self.registry.records() if sub.wants(r.device_id)]
+		devices = {record.device_id: dict(zip(FIELDS, _values(record))) for record in records}
+		frame = _frame("snapshot", json.dumps({"t": time.time(), "devices": devices}).encode("utf-8"))
+		if not sub.filtered and cache is not None:
+			cache["frame"] = frame
+		self._send(sub, frame, now)
+
+	def _tick(self, now: float) -> None:
+		self.ticks += 1
+		with self._lock:
+			dirty, self._dirty = self._dirty, set()
+			events = list(self._events)
+			self._events.clear()
+		fragments: dict[str, bytes] = {}
+		for device_id in dirty:
+			record = self.registry.get(device_id)
+			if record is None:
+				continue
+			values = _values(record)
+			previous = self._sent.get(device_id)
+			if previous == values:
+				continue
+			self._sent[device_id] = values
+			changed = {name: value for i, (name, value) in enumerate(zip(FIELDS, values)) if previous is None or previous[i] != value}
+			fragments[device_id] = json.dumps(device_id).encode("utf-8") + b":" + json.dumps(changed).encode("utf-8")
+		self.deltas += len(fragments)
+		self.events += len(events)
+		encoded = [(device_id, _frame(kind, json.dumps(fields).encode("utf-8"))) for kind, device_id, fields in events]
+		if not self._subscribers or (not fragments and not encoded):
+			return
+		stamp = json.dumps(time.time()).encode("ascii")
+		shared = None
+		snapshots: dict = {}
+		for sub in list(self._subscribers.values()):
+			if sub.request is not None:
+				continue
+			if sub.queued > self.max_buffer:
+				self._overflow(sub)
+			if sub.resync:
+				if sub.queued == 0:
+					sub.resync = False
+					self._snapshot(sub, now, snapshots)
+				continue
+			for device_id, frame in encoded:
+				if sub.wants(device_id):
+					self._queue(sub, frame)
+			if sub.devices is not None:
+				parts = [fragments[d] for d in sub.devices if d in fragments and sub.wants(d)]
+				if parts:
+					self._queue(sub, _delta(stamp, parts))
+			elif sub.prefix is not None:
+				parts = [frag for device_id, frag in fragments.items() if sub.wants(device_id)]
+				if parts:
+					self._queue(sub, _delta(stamp, parts))
+			elif fragments:
+				if shared is None:
+					shared = _delta(stamp, fragments.values())
+				self._queue(sub, shared)
+			self._flush(sub, now)
+
+	def _queue(self, sub: _Subscriber, frame: bytes) -> None:
+		sub.frames.append(frame)
+		sub.queued += len(frame)
+
+	def _send(self, sub: _Subscriber, frame: bytes, now: float) -> None:
+		self._queue(sub, frame)
+		self._flush(sub, now)
+
+	def _flush(self, sub: _Subscriber, now: Optional[float] = None) -> None:
+		now = time.monotonic() if now is None else now
+		while sub.frames:
+			frame = sub.frames[0]
+			try:
+				n = sub.sock.send(memoryview(frame)[sub.offset:])
+			except (BlockingIOError, InterruptedError):
+				break
+			except OSError:
+				self._close(sub)
+				return
+			sub.sent += n
+			sub.queued -= n
+			sub.offset += n
+			if sub.offset < len(frame):
+				break
+			sub.frames.popleft()
+			sub.offset = 0
+		if not sub.frames:
+			sub.lagging_since = None
+			self._selector.modify(sub.sock, selectors.EVENT_READ, sub)
+			return
+		self._selector.modify(sub.sock, selectors.EVENT_READ | selectors.EVENT_WRITE, sub)
+		if sub.lagging_since is None:
+			sub.lagging_since = now
+		elif now - sub.lagging_since > self.stall_seconds:
+			print(f"[live] disconnecting subscriber stalled for {now - sub.lagging_since:.0f}s")
+			self._close(sub)
+
+	def _overflow(self, sub: _Subscriber) -> None:
+		# Keep only the frame being written (it is partly on the wire)
+		keep = sub.frames.popleft() if sub.offset else None
+		sub.dropped += len(sub.frames)
+		sub.frames.clear()
+		sub.queued = len(keep) - sub.offset if keep is not None else 0
+		if keep is not None:
+			sub.frames.append(keep)
+		if not sub.resync:
+			sub.resync = True
+			self.resyncs += 1
+
+	def _close(self, sub: _Subscriber) -> None:
+		if self._subscribers.pop(sub.sock.fileno(), None) is None:
+			return
+		self.disconnected += 1
+		try:
+			self._selector.unregister(sub.sock)
+		except (KeyError, ValueError):
+			pass
+		sub.sock.close()
+
+	def stats(self) -> dict:
+		subscribers = list(self._subscribers.values())
+		return {
+			"subscribers": len(subscribers),
+			"ticks": self.ticks,
+			"deltas": self.deltas,
+			"events": self.events,
+			"resyncs": self.resyncs,
+			"disconnected": self.disconnected,
+			"queued_bytes": sum(sub.queued for sub in subscribers),
+		}
@@ -0,0 +1,142 @@
+import math
+import threading
+import time
+from typing import Optional
+
+
+# Per-device location smoothing for the status ingestion path. Each device
+# keeps one fixed-slot track (estimate, its variance, time of the last
+# accepted fix and a rejection streak), so memory is constant per device and
+# an update is O(1): a scalar Kalman step with a random-walk motion model
+# (the estimate's uncertainty grows with time since the last fix at walking
+# speed, and each fix is weighted against the configured GPS accuracy).
+#
+# A fix that would require moving faster than max_speed_mps (plus the noise
+# of both positions) is rejected and the estimate kept; after reject_limit
+# consecutive rejections the track is reset to the newest fix, so a ring that
+# really did move (GPS off in a car, train) re-acquires instead of being
+# pinned to its old position. A fix older than stale_seconds is reported as
+# stale, and its confidence radius keeps growing with age.
+
+EARTH_RADIUS_M = 6_371_000.0
+# Radius of the ~95% circle of a 2D Gaussian, in standard deviations
+CONFIDENCE_SIGMAS = 2.45
+
+
+def distance_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+	# Equirectangular approximation; accurate to well under GPS error over
+	# the distances between consecutive heartbeats
+	x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+	y = math.radians(lat2 - lat1)
+	return math.sqrt(x * x + y * y) * EARTH_RADIUS_M
+
+
+def zoom_for_radius(lat: float, radius_m: float) -> int:
+	# Google Maps zoom at which the confidence circle spans roughly 100 pixels
+	metres_per_pixel = max(radius_m, 1.0) / 100
+	zoom = math.log2(156543.03 * math.cos(math.radians(lat)) / metres_per_pixel)
+	return max(3, min(19, int(zoom)))
+
+
+def maps_url(lat: float, lon: float, radius_m: Optional[float] = None) -> str:
+	if radius_m is None:
+		return f"https://maps.google.com/?q={lat},{lon}"
+	return f"https://maps.google.com/?q={lat:.6f},{lon:.6f}&z={zoom_for_radius(lat, radius_m)}"
+
+
+class Fix:
+	__slots__ = ("lat", "lon", "radius_m", "age_seconds", "stale", "rejected")
+
+	def __init__(self, lat: float, lon: float, radius_m: float, age_seconds: float, stale: bool, rejected: bool = False):
+		self.lat = lat
+		self.lon = lon
+		self.radius_m = radius_m
+		self.age_seconds = age_seconds
+		self.stale = stale
+		self.rejected = rejected
+
+	def as_dict(self) -> dict:
+		return {name: getattr(self, name) for name in self.__slots__}
+
+
+class _Track:
+	__slots__ = ("lat", "lon", "variance", "updated", "rejects")
+
+	def __init__(self, lat: float, lon: float, variance: float, updated: float):
+		self.lat = lat
+		self.lon = lon
+		self.variance = variance
+		self.updated = updated
+		self.rejects = 0
+
+
+class LocationFilter:
+	def __init__(
+		self,
+		accuracy_m: float = 25.0,
+		speed_mps: float = 1.5,
+		max_speed_mps: float = 60.0,
+		stale_seconds: float = 120.0,
+		reject_limit: int = 3,
+	):
+		self.measurement_variance = accuracy_m * accuracy_m
+		self.speed_mps = speed_mps
+		self.max_speed_mps = max_speed_mps
+		self.stale_seconds = stale_seconds
+		self.reject_limit = max(1, reject_limit)
+		self._tracks: dict[str, _Track] = {}
+		# Status (pipeline applier) and SOS (MQTT thread) may update the same track
+		self._lock = threading.Lock()
+		self.accepted = 0
+		self.rejected = 0
+		self.resets = 0
+
+	def __len__(self) -> int:
+		return len(self._tracks)
+
+	def _fix(self, track: _Track, now: float, rejected: bool = False) -> Fix:
+		age = max(0.0, now - track.updated)
+		drift = self.speed_mps * age
+		radius = CONFIDENCE_SIGMAS * math.sqrt(track.variance + drift * drift)
+		return Fix(track.lat, track.lon, round(radius, 1), round(age, 1), age > self.stale_seconds, rejected)
+
+	def update(self, device_id: str, lat: float, lon: float, now: Optional[float] = None) -> Fix:
+		now = time.time() if now is None else now
+		r = self.measurement_variance
+		with self._lock:
+			track = self._tracks.get(device_id)
+			if track is None:
+				track = self._tracks[device_id] = _Track(lat, lon, r, now)
+				self.accepted += 1
+				return self._fix(track, now)
+			dt = max(0.0, now - track.updated)
+			drift = self.speed_mps * dt
+			prior = track.variance + drift * drift
+			moved = distance_m(track.lat, track.lon, lat, lon)
+			if moved > self.max_speed_mps * dt + 3 * math.sqrt(prior + r):
+				track.rejects += 1
+				if track.rejects < self.reject_limit:
+					self.rejected += 1
+					return self._fix(track, now, rejected=True)
+				# Persistent disagreement: the ring really moved, start over
+				self.resets += 1
+				track.lat, track.lon, track.variance, track.updated, track.rejects = lat, lon, r, now, 0
+				return self._fix(track, now)
+			gain = prior / (prior + r)
+			track.lat += gain * (lat - track.lat)
+			track.lon += gain * (lon - track.lon)
+			track.variance = (1 - gain) * prior
+			track.updated = now
+			track.rejects = 0
+			self.accepted += 1
+			return self._fix(track, now)
+
+	def estimate(self, device_id: str, now: Optional[float] = None) -> Optional[Fix]:
+		with self._lock:
+			track = self._tracks.get(device_id)
+			if track is None:
+				return None
+			return self._fix(track, time.time() if now is None else now)
+
+	def stats(self) -> dict:
+		return {"devices": len(self._tracks), "accepted": self.accepted, "rejected": self.rejected, "resets": self.resets}
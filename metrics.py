@@ -0,0 +1,277 @@
+import bisect
+import os
+import threading
+from abc import ABC, abstractmethod
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+
+# Small Prometheus-style metrics registry. Hot paths should bind label values
+# once (metric.labels(...)) and keep the child. By default recording takes no
+# lock: a counter inc is one attribute add (~25 ns) and a histogram observe a
+# bisect plus two adds (~150 ns), but two threads writing the same child at
+# the same instant can lose an update. That suits children with one writer
+# (the per-message ones, written by the MQTT thread). Metrics whose children
+# are written from several threads (provider latency and retries from the
+# dispatcher workers, decode failures from the MQTT thread and the status
+# applier, ...) are registered with shared=True and lock every update.
+
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+	parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+	if extra:
+		parts.append(extra)
+	return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _CounterChild:
+	__slots__ = ("value",)
+
+	def __init__(self) -> None:
+		self.value = 0
+
+	def inc(self, amount: float = 1) -> None:
+		self.value += amount
+
+
+class _SharedCounterChild(_CounterChild):
+	__slots__ = ("_lock",)
+
+	def __init__(self) -> None:
+		super().__init__()
+		self._lock = threading.Lock()
+
+	def inc(self, amount: float = 1) -> None:
+		with self._lock:
+			self.value += amount
+
+
+class _HistogramChild:
+	__slots__ = ("buckets", "counts", "total")
+
+	def __init__(self, buckets: tuple[float, ...]):
+		self.buckets = buckets
+		self.counts = [0] * (len(buckets) + 1)
+		self.total = 0.0
+
+	def observe(self, value: float) -> None:
+		self.counts[bisect.bisect_left(self.buckets, value)] += 1
+		self.total += value
+
+
+class _SharedHistogramChild(_HistogramChild):
+	__slots__ = ("_lock",)
+
+	def __init__(self, buckets: tuple[float, ...]):
+		super().__init__(buckets)
+		self._lock = threading.Lock()
+
+	def observe(self, value: float) -> None:
+		index = bisect.bisect_left(self.buckets, value)
+		with self._lock:
+			self.counts[index] += 1
+			self.total += value
+
+
+class _Metric(ABC):
+	kind = "untyped"
+
+	def __init__(self, name: str, help_text: str):
+		self.name = name
+		self.help = help_text
+
+	@abstractmethod
+	def render(self) -> list[str]: ...
+
+
+class _LabeledMetric(_Metric):
+	def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = (), shared: bool = False):
+		super().__init__(name, help_text)
+		self.labelnames = labelnames
+		self.shared = shared
+		self._children: dict[tuple[str, ...], object] = {}
+		self._lock = threading.Lock()
+
+	def labels(self, *values: str):
+		key = tuple(str(v) for v in values)
+		child = self._children.get(key)
+		if child is None:
+			with self._lock:
+				child = self._children.get(key)
+				if child is None:
+					child = self._children[key] = self._new_child()
+		return child
+
+	@abstractmethod
+	def _new_child(self): ...
+
+	def render(self) -> list[str]:
+		lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+		for values, child in sorted(self._children.items()):
+			lines.extend(self._render_child(values, child))
+		return lines
+
+	@abstractmethod
+	def _render_child(self, values: tuple[str, ...], child) -> list[str]: ...
+
+
+class Counter(_LabeledMetric):
+	kind = "counter"
+
+	def _new_child(self) -> _CounterChild:
+		return _SharedCounterChild() if self.shared else _CounterChild()
+
+	def inc(self, amount: float = 1.0) -> None:
+		self.labels().inc(amount)
+
+	def _render_child(self, values, child) -> list[str]:
+		return [f"{self.name}{_format_labels(self.labelnames, values)} {child.value}"]
+
+
+class Histogram(_LabeledMetric):
+	kind = "histogram"
+
+	def __init__(
+		self,
+		name: str,
+		help_text: str,
+		labelnames: tuple[str, ...] = (),
+		buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+		shared: bool = False,
+	):
+		super().__init__(name, help_text, labelnames, shared)
+		self.buckets = tuple(sorted(buckets))
+
+	def _new_child(self) -> _HistogramChild:
+		return _SharedHistogramChild(self.buckets) if self.shared else _HistogramChild(self.buckets)
+
+	def observe(self, value: float) -> None:
+		self.labels().observe(value)
+
+	def _render_child(self, values, child) -> list[str]:
+		counts = list(child.counts)
+		total, count = child.total, sum(counts)
+		lines = []
+		cumulative = 0
+		for bound, n in zip(self.buckets + (float("inf"),), counts):
+			cumulative += n
+			le = "+Inf" if bound == float("inf") else repr(bound)
+			extra = f'le="{le}"'
+			lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, extra)} {cumulative}")
+		lines.append(f"{self.name}_sum{_format_labels(self.labelnames, values)} {total}")
+		lines.append(f"{self.name}_count{_format_labels(self.labelnames, values)} {count}")
+		return lines
+
+
+class Gauge(_Metric):
+	# Read at scrape time from a callback, so nothing is recorded on hot paths
+	kind = "gauge"
+
+	def __init__(self, name: str, help_text: str, func: Callable[[], float]):
+		super().__init__(name, help_text)
+		self.func = func
+
+	def render(self) -> list[str]:
+		try:
+			value = float(self.func())
+		except Exception:
+			value = float("nan")
+		return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+class MetricsRegistry:
+	def __init__(self) -> None:
+		self._metrics: dict[str, _Metric] = {}
+
+	def _register(self, metric: _Metric) -> _Metric:
+		if metric.name in self._metrics:
+			raise ValueError(f"metric {metric.name} already registered")
+		self._metrics[metric.name] = metric
+		return metric
+
+	def counter(self, name: str, help_text: str, labelnames: tuple[str, ...] = (), shared: bool = False) -> Counter:
+		return self._register(Counter(name, help_text, labelnames, shared))  # type: ignore[return-value]
+
+	def histogram(
+		self,
+		name: str,
+		help_text: str,
+		labelnames: tuple[str, ...] = (),
+		buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+		shared: bool = False,
+	) -> Histogram:
+		return self._register(Histogram(name, help_text, labelnames, buckets, shared))  # type: ignore[return-value]
+
+	def gauge(self, name: str, help_text: str, func: Callable[[], float]) -> Gauge:
+		return self._register(Gauge(name, help_text, func))  # type: ignore[return-value]
+
+	def render(self) -> str:
+		lines: list[str] = []
+		for metric in self._metrics.values():
+			lines.extend(metric.render())
+		return "\n".join(lines) + "\n"
+
+	def dump(self, path: str) -> None:
+		tmp = f"{path}.tmp"
+		with open(tmp, "w", encoding="utf-8") as f:
+			f.write(self.render())
+		os.replace(tmp, path)
+
+
+class MetricsExporter:
+	# Serves GET /metrics on a local port and/or rewrites a file periodically
+	def __init__(self, registry: MetricsRegistry, host: str = "127.0.0.1", port: int = 0, path: str = "", interval: float = 15.0):
+		self.registry = registry
+		self.host = host
+		self.port = port
+		self.path = path
+		self.interval = interval
+		self._httpd: Optional[ThreadingHTTPServer] = None
+		self._stop = threading.Event()
+
+	def start(self) -> None:
+		if self.port:
+			registry = self.registry
+
+			class Handler(BaseHTTPRequestHandler):
+				def do_GET(self):
+					if self.path.split("?")[0] not in ("/metrics", "/"):
+						self.send_error(404)
+						return
+					body = registry.render().encode("utf-8")
+					self.send_response(200)
+					self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+					self.send_header("Content-Length", str(len(body)))
+					self.end_headers()
+					self.wfile.write(body)
+
+				def log_message(self, format, *args):
+					pass
+
+			self._httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+			self._httpd.daemon_threads = True
+			self.port = self._httpd.server_address[1]
+			threading.Thread(target=self._httpd.serve_forever, name="metrics-http", daemon=True).start()
+			print(f"[metrics] serving http://{self.host}:{self.port}/metrics")
+		if self.path:
+			threading.Thread(target=self._dump_loop, name="metrics-dump", daemon=True).start()
+
+	def _dump_loop(self) -> None:
+		while not self._stop.wait(self.interval):
+			self._dump()
+
+	def _dump(self) -> None:
+		try:
+			self.registry.dump(self.path)
+		except OSError as exc:
+			print(f"[metrics] dump to {self.path} failed: {exc}")
+
+	def stop(self) -> None:
+		self._stop.set()
+		if self._httpd is not None:
+			self._httpd.shutdown()
+			self._httpd.server_close()
+		if self.path:
+			self._dump()
@@ -0,0 +1,384 @@
+import heapq
+import itertools
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Optional
+
+if TYPE_CHECKING:
+	import asyncio
+
+
+# Lower value = more urgent. SOS jobs are never dropped; when the queue is full
+# they evict the least urgent queued job or, failing that, run over capacity.
+PRIORITY_SOS = 0
+PRIORITY_ALERT = 1
+PRIORITY_INFO = 2
+
+PRIORITY_NAMES = {PRIORITY_SOS: "sos", PRIORITY_ALERT: "alert", PRIORITY_INFO: "info"}
+
+
+class ChannelStats:
+	__slots__ = ("sent", "failed", "total_seconds", "max_seconds", "last_seconds")
+
+	def __init__(self) -> None:
+		self.sent = 0
+		self.failed = 0
+		self.total_seconds = 0.0
+		self.max_seconds = 0.0
+		self.last_seconds = 0.0
+
+	def record(self, seconds: float, ok: bool) -> None:
+		if ok:
+			self.sent += 1
+		else:
+			self.failed += 1
+		self.total_seconds += seconds
+		self.last_seconds = seconds
+		if seconds > self.max_seconds:
+			self.max_seconds = seconds
+
+	def as_dict(self) -> dict:
+		done = self.sent + self.failed
+		return {
+			"sent": self.sent,
+			"failed": self.failed,
+			"avg_ms": round(self.total_seconds / done * 1000, 2) if done else 0.0,
+			"max_ms": round(self.max_seconds * 1000, 2),
+			"last_ms": round(self.last_seconds * 1000, 2),
+		}
+
+
+class _Job:
+	__slots__ = ("priority", "seq", "channel", "func", "label", "enqueued")
+
+	def __init__(self, priority: int, seq: int, channel: str, func: Callable[[], object], label: str):
+		self.priority = priority
+		self.seq = seq
+		self.channel = channel
+		self.func = func
+		self.label = label
+		self.enqueued = time.monotonic()
+
+	def __lt__(self, other: "_Job") -> bool:
+		return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+# Bounded priority queue drained by a pool of worker threads. Callers (the MQTT
+# network thread) only enqueue; provider calls, retries and backoff sleeps run
+# on the workers. A job returning False counts as a failed send.
+class NotificationDispatcher:
+	def __init__(self, workers: int = 4, queue_size: int = 1000, name: str = "notify"):
+		self.workers = max(1, workers)
+		self.queue_size = max(1, queue_size)
+		self.name = name
+		self._heap: list[_Job] = []
+		self._cond = threading.Condition()
+		self._seq = itertools.count()
+		self._threads: list[threading.Thread] = []
+		self._running = False
+		self._in_flight = 0
+		self._channels: dict[str, ChannelStats] = {}
+		self._dropped: dict[str, int] = {n: 0 for n in PRIORITY_NAMES.values()}
+
+	def start(self) -> None:
+		with self._cond:
+			if self._running:
+				return
+			self._running = True
+		for i in range(self.workers):
+			t = threading.Thread(target=self._worker, name=f"{self.name}-{i}", daemon=True)
+			t.start()
+			self._threads.append(t)
+
+	def stop(self, timeout: float = 5.0) -> None:
+		with self._cond:
+			self._running = False
+			self._cond.notify_all()
+		deadline = time.monotonic() + timeout
+		for t in self._threads:
+			t.join(timeout=max(0.0, deadline - time.monotonic()))
+		self._threads = []
+
+	def submit(self, channel: str, func: Callable[[], object], label: str, priority: int = PRIORITY_INFO) -> bool:
+		job = _Job(priority, next(self._seq), channel, func, label)
+		with self._cond:
+			if len(self._heap) >= self.queue_size:
+				victim = self._least_urgent()
+				if victim is not None and victim.priority > priority:
+					self._heap.remove(victim)
+					heapq.heapify(self._heap)
+					self._drop(victim)
+				elif priority != PRIORITY_SOS:
+					self._drop(job)
+					return False
+			heapq.heappush(self._heap, job)
+			self._cond.notify()
+		return True
+
+	def _least_urgent(self) -> Optional[_Job]:
+		victim = None
+		for job in self._heap:
+			if victim is None or (job.priority, job.seq) > (victim.priority, victim.seq):
+				victim = job
+		return victim
+
+	def _drop(self, job: _Job) -> None:
+		self._dropped[PRIORITY_NAMES.get(job.priority, "info")] += 1
+		print(f"[notify] queue full; dropped {job.label}")
+
+	def _worker(self) -> None:
+		while True:
+			with self._cond:
+				while self._running and not self._heap:
+					self._cond.wait()
+				if not self._heap:
+					return
+				job = heapq.heappop(self._heap)
+				self._in_flight += 1
+			try:
+				ok = job.func() is not False
+			except Exception as exc:
+				ok = False
+				print(f"[notify] {job.label} failed: {exc}")
+			elapsed = time.monotonic() - job.enqueued
+			with self._cond:
+				self._in_flight -= 1
+				stats = self._channels.get(job.channel)
+				if stats is None:
+					stats = self._channels[job.channel] = ChannelStats()
+				stats.record(elapsed, ok)
+
+	@property
+	def queue_depth(self) -> int:
+		return len(self._heap)
+
+	@property
+	def in_flight(self) -> int:
+		return self._in_flight
+
+	def stats(self) -> dict:
+		with self._cond:
+			return {
+				"queue_depth": len(self._heap),
+				"in_flight": self._in_flight,
+				"workers": self.workers,
+				"queue_size": self.queue_size,
+				"dropped": dict(self._dropped),
+				"channels": {name: s.as_dict() for name, s in self._channels.items()},
+			}
+
+
+# NotificationDispatcher drained by asyncio tasks instead of threads, for the
+# asyncio server mode. Jobs are coroutine functions, so a send waiting on a
+# slow provider holds a task rather than a worker thread and hundreds can be
+# in flight at once. Queueing, shedding and stats are inherited unchanged;
+# submit() may be called from any thread. asyncio is imported on first use so
+# the threaded server never loads it.
+class AsyncNotificationDispatcher(NotificationDispatcher):
+	def __init__(self, concurrency: int = 100, queue_size: int = 1000, name: str = "notify"):
+		super().__init__(workers=concurrency, queue_size=queue_size, name=name)
+		self._loop: Optional[asyncio.AbstractEventLoop] = None
+		self._ready: Optional[asyncio.Event] = None
+		self._tasks: list[asyncio.Task] = []
+
+	def start(self) -> None:
+		# Must be called on the event loop that will run the jobs
+		import asyncio
+
+		with self._cond:
+			if self._running:
+				return
+			self._running = True
+		self._loop = asyncio.get_running_loop()
+		self._ready = asyncio.Event()
+		self._tasks = [self._loop.create_task(self._worker()) for _ in range(self.workers)]
+
+	def stop(self, timeout: float = 5.0) -> None:
+		# Lets queued jobs finish, like the threaded dispatcher; call from
+		# any thread but the loop's own
+		import asyncio
+
+		with self._cond:
+			self._running = False
+		loop = self._loop
+		if loop is None or loop.is_closed() or not loop.is_running():
+			return
+		try:
+			asyncio.run_coroutine_threadsafe(self._drain(timeout), loop).result(timeout + 1.0)
+		except Exception as exc:
+			print(f"[notify] stop: {exc!r}")
+
+	async def _drain(self, timeout: float) -> None:
+		import asyncio
+
+		self._ready.set()
+		done, pending = await asyncio.wait(self._tasks, timeout=timeout)
+		for task in pending:
+			task.cancel()
+		self._tasks = []
+
+	def submit(self, channel: str, func: Callable[[], object], label: str, priority: int = PRIORITY_INFO) -> bool:
+		queued = super().submit(channel, func, label, priority)
+		if queued and self._loop is not None and not self._loop.is_closed():
+			self._loop.call_soon_threadsafe(self._ready.set)
+		return queued
+
+	async def _worker(self) -> None:
+		while True:
+			with self._cond:
+				job = heapq.heappop(self._heap) if self._heap else None
+				if job is None and not self._running:
+					return
+				if job is not None:
+					self._in_flight += 1
+			if job is None:
+				# submit() sets the event from the loop after pushing, so a job
+				# queued between the pop above and this clear is not missed
+				self._ready.clear()
+				await self._ready.wait()
+				continue
+			try:
+				ok = await job.func() is not False
+			except Exception as exc:
+				ok = False
+				print(f"[notify] {job.label} failed: {exc}")
+			elapsed = time.monotonic() - job.enqueued
+			with self._cond:
+				self._in_flight -= 1
+				stats = self._channels.get(job.channel)
+				if stats is None:
+					stats = self._channels[job.channel] = ChannelStats()
+				stats.record(elapsed, ok)
+
+
+class _Window:
+	__slots__ = ("closes", "sent_priority", "texts", "trailing", "keys")
+
+	def __init__(self, closes: float, priority: int, trailing: bool):
+		self.closes = closes
+		self.sent_priority = priority
+		self.texts: list[tuple[int, str]] = []
+		self.trailing = trailing
+		self.keys: list[str] = []
+
+
+# Merges alerts for the same (device, channel, recipient) inside a short window.
+# The first alert of a window is delivered immediately, and so is every SOS
+# and any later alert that is more urgent than everything already delivered
+# in the window (an SOS after a low-battery alert is never held back; true
+# redeliveries of one SOS are stopped earlier, by SOS dedup and the outbox).
+# Everything else is buffered and delivered as one merged message, most
+# urgent text first, when the window closes, or discarded for channels opened
+# with trailing=False.
+# Outbox keys travel with the text: a merged message carries the keys of every
+# alert it covers, and keys of discarded alerts are passed to on_discard.
+class NotificationCoalescer:
+	def __init__(
+		self,
+		window_seconds: float,
+		deliver: Callable[[str, str, str, str, int, tuple[str, ...]], None],
+		on_discard: Optional[Callable[[tuple[str, ...]], None]] = None,
+	):
+		self.window_seconds = window_seconds
+		self._deliver = deliver
+		self._on_discard = on_discard
+		self._windows: dict[tuple[str, str, str], _Window] = {}
+		self._heap: list[tuple[float, tuple[str, str, str]]] = []
+		self._cond = threading.Condition()
+		self._thread: threading.Thread | None = None
+		self._running = False
+		self.immediate = 0
+		self.merged = 0
+		self.discarded = 0
+
+	def start(self) -> None:
+		if self._running or self.window_seconds <= 0:
+			return
+		self._running = True
+		self._thread = threading.Thread(target=self._flush_loop, name="notify-coalesce", daemon=True)
+		self._thread.start()
+
+	def stop(self) -> None:
+		with self._cond:
+			self._running = False
+			self._cond.notify_all()
+		if self._thread is not None:
+			self._thread.join(timeout=2.0)
+		self._flush(float("inf"))
+
+	def submit(
+		self,
+		device_id: str,
+		channel: str,
+		recipient: str,
+		text: str,
+		priority: int,
+		trailing: bool = True,
+		keys: tuple[str, ...] = (),
+	) -> None:
+		if self.window_seconds <= 0:
+			self._deliver(device_id, channel, recipient, text, priority, keys)
+			return
+		key = (device_id, channel, recipient)
+		now = time.monotonic()
+		with self._cond:
+			window = self._windows.get(key)
+			if window is None:
+				window = self._windows[key] = _Window(now + self.window_seconds, priority, trailing)
+				heapq.heappush(self._heap, (window.closes, key))
+				self._cond.notify()
+			elif priority == PRIORITY_SOS or priority < window.sent_priority:
+				window.sent_priority = min(window.sent_priority, priority)
+			else:
+				window.texts.append((priority, text))
+				window.keys.extend(keys)
+				return
+			self.immediate += 1
+		self._deliver(device_id, channel, recipient, text, priority, keys)
+
+	def _flush_loop(self) -> None:
+		while True:
+			with self._cond:
+				while self._running and (not self._heap or self._heap[0][0] > time.monotonic()):
+					timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+					self._cond.wait(timeout)
+				if not self._running:
+					return
+			self._flush(time.monotonic())
+
+	def _flush(self, now: float) -> None:
+		due = []
+		discarded: list[str] = []
+		with self._cond:
+			while self._heap and self._heap[0][0] <= now:
+				_, key = heapq.heappop(self._heap)
+				window = self._windows.pop(key, None)
+				if window is None or not window.texts:
+					continue
+				if window.trailing:
+					self.merged += len(window.texts)
+					due.append((key, window))
+				else:
+					self.discarded += len(window.texts)
+					discarded.extend(window.keys)
+		if discarded and self._on_discard is not None:
+			self._on_discard(tuple(discarded))
+		for (device_id, channel, recipient), window in due:
+			# Stable, so texts of equal priority keep their arrival order
+			entries = sorted(window.texts, key=lambda entry: entry[0])
+			priority = entries[0][0]
+			texts = [text for _, text in entries]
+			if len(texts) == 1:
+				text = texts[0]
+			else:
+				text = f"{len(texts)} more alerts for {device_id}: " + " | ".join(texts)
+			self._deliver(device_id, channel, recipient, text, priority, tuple(window.keys))
+
+	def stats(self) -> dict:
+		with self._cond:
+			return {
+				"open_windows": len(self._windows),
+				"immediate": self.immediate,
+				"merged": self.merged,
+				"discarded": self.discarded,
+			}
@@ -0,0 +1,220 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+
+# Durable record of every SOS notification intent, written (and synced)
+# before the device is ACKed. Each row is one (SOS, channel, recipient) with
+# an idempotency key built from the device id and sos_id(): the SOS's own
+# timestamp and message id, so a broker redelivery after a restart maps onto
+# the same rows instead of paging guardians twice. A payload without either
+# (the ESP32 sketches) cannot tell a redelivery from a second press with the
+# same battery, fix and reason, so it is keyed on its digest plus a receipt
+# id of ours: every copy is a new SOS unless the broker flags it as a
+# redelivery (dup), which then reuses the id recorded for the same packet id
+# (redelivered()).
+#
+# Row life cycle: pending with due NULL while this process is sending it,
+# pending with a due time after a failed attempt, sent, or expired once it
+# is older than max_age_seconds. Rows still in flight when the process died
+# are made due again by recover(). Delivery is at-least-once: a crash after
+# the provider accepted a message but before mark_sent() resends it.
+
+OUTBOX_COLUMNS = (
+	"key TEXT PRIMARY KEY",
+	"device_id TEXT",
+	"channel TEXT",
+	"recipient TEXT",
+	"body TEXT",
+	"created REAL",
+	"attempts INTEGER DEFAULT 0",
+	"state TEXT DEFAULT 'pending'",
+	"due REAL",
+	"sent_at REAL",
+)
+
+
+def payload_digest(data: dict) -> str:
+	# Same for every copy of a message, key order aside
+	digest = hashlib.blake2b(json.dumps(data, sort_keys=True, default=str).encode("utf-8"), digest_size=12)
+	return "sha:" + digest.hexdigest()
+
+
+def receipt_id(mid: int) -> str:
+	# The broker's packet id, which a redelivery keeps, plus when we got it
+	return f"{mid}:{time.time_ns()}"
+
+
+def sos_id(data: dict, receipt: str) -> str:
+	ts = data.get("ts")
+	if ts is not None:
+		msg_id = data.get("msgId")
+		return ts if msg_id is None else f"{ts}#{msg_id}"
+	return f"{payload_digest(data)}@{receipt}"
+
+
+def idempotency_key(device_id: str, sos: str, channel: str, recipient: str) -> str:
+	return f"{device_id}|{sos}|{channel}|{recipient}"
+
+
+class OutboxEntry:
+	__slots__ = ("key", "device_id", "channel", "recipient", "body", "attempts")
+
+	def __init__(self, key: str, device_id: str, channel: str, recipient: str, body: str, attempts: int = 0):
+		self.key = key
+		self.device_id = device_id
+		self.channel = channel
+		self.recipient = recipient
+		self.body = body
+		self.attempts = attempts
+
+
+class SosOutbox:
+	def __init__(self, path: Path, retry_seconds: float = 30.0, max_age_seconds: float = 3600.0):
+		self.path = path
+		self.retry_seconds = retry_seconds
+		self.max_age_seconds = max_age_seconds
+		self._lock = threading.Lock()
+		self._conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+		self._conn.execute("PRAGMA journal_mode=WAL")
+		self._conn.execute("PRAGMA synchronous=FULL")
+		self._conn.execute(f"CREATE TABLE IF NOT EXISTS outbox ({', '.join(OUTBOX_COLUMNS)})")
+		self._conn.execute("CREATE INDEX IF NOT EXISTS outbox_pending ON outbox (state, due)")
+		self.recorded = 0
+		self.duplicates = 0
+		self.sent = 0
+		self.retried = 0
+		self.expired = 0
+
+	def record(self, entries: list[OutboxEntry]) -> list[OutboxEntry]:
+		# One synced transaction for all recipients of an SOS. Returns the
+		# entries that are new; keys already present are owned by an earlier
+		# delivery (live or replay) and must not be sent again.
+		now = time.time()
+		fresh = []
+		with self._lock:
+			self._conn.execute("BEGIN")
+			try:
+				for entry in entries:
+					cur = self._conn.execute(
+						"INSERT OR IGNORE INTO outbox (key, device_id, channel, recipient, body, created) VALUES (?, ?, ?, ?, ?, ?)",
+						(entry.key, entry.device_id, entry.channel, entry.recipient, entry.body, now),
+					)
+					if cur.rowcount:
+						fresh.append(entry)
+				self._conn.execute("COMMIT")
+			except Exception:
+				self._conn.execute("ROLLBACK")
+				raise
+		self.recorded += len(fresh)
+		self.duplicates += len(entries) - len(fresh)
+		return fresh
+
+	def mark_sent(self, keys: tuple[str, ...]) -> None:
+		if not keys:
+			return
+		with self._lock:
+			self._conn.executemany(
+				"UPDATE outbox SET state='sent', sent_at=?, due=NULL WHERE key=? AND state='pending'",
+				[(time.time(), key) for key in keys],
+			)
+		self.sent += len(keys)
+
+	def mark_failed(self, keys: tuple[str, ...]) -> None:
+		# All in-process retries failed: hand the rows to the replayer with
+		# exponential backoff (retry_seconds, 2x, 4x, ... capped at 10 minutes)
+		if not keys:
+			return
+		now = time.time()
+		with self._lock:
+			self._conn.executemany(
+				"UPDATE outbox SET attempts=attempts+1, "
+				"due=? + MIN(?, ? * (1 << MIN(attempts, 10))) WHERE key=? AND state='pending'",
+				[(now, 600.0, self.retry_seconds, key) for key in keys],
+			)
+		self.retried += len(keys)
+
+	def recover(self) -> int:
+		# Rows a previous process was still sending become due immediately
+		with self._lock:
+			cur = self._conn.execute("UPDATE outbox SET due=0 WHERE state='pending' AND due IS NULL")
+			return cur.rowcount
+
+	def claim_due(self, limit: int = 100) -> list[OutboxEntry]:
+		# Expire stale rows, then take due rows out of the due set (due=NULL)
+		# so the next scan does not hand them out twice.
+		now = time.time()
+		with self._lock:
+			self._conn.execute("BEGIN")
+			try:
+				cur = self._conn.execute(
+					"UPDATE outbox SET state='expired', due=NULL WHERE state='pending' AND created < ?",
+					(now - self.max_age_seconds,),
+				)
+				self.expired += cur.rowcount
+				rows = self._conn.execute(
+					"SELECT key, device_id, channel, recipient, body, attempts FROM outbox "
+					"WHERE state='pending' AND due <= ? ORDER BY due LIMIT ?",
+					(now, limit),
+				).fetchall()
+				self._conn.executemany("UPDATE outbox SET due=NULL WHERE key=?", [(row[0],) for row in rows])
+				self._conn.execute("COMMIT")
+			except Exception:
+				self._conn.execute("ROLLBACK")
+				raise
+		return [OutboxEntry(*row) for row in rows]
+
+	def redelivered(self, device_id: str, data: dict, mid: int) -> Optional[str]:
+		# sos_id() recorded for an earlier copy of this packet, for a copy the
+		# broker flagged as a redelivery; None when the SOS has its own ids or
+		# the first copy never got this far
+		if data.get("ts") is not None:
+			return None
+		prefix = f"{device_id}|{payload_digest(data)}@{mid}:"
+		with self._lock:
+			row = self._conn.execute(
+				"SELECT key FROM outbox WHERE key >= ? AND key < ? LIMIT 1",
+				(prefix, prefix + "\uffff"),
+			).fetchone()
+		return row[0][len(device_id) + 1:].split("|", 1)[0] if row else None
+
+	def pending(self) -> int:
+		with self._lock:
+			return self._conn.execute("SELECT COUNT(*) FROM outbox WHERE state='pending'").fetchone()[0]
+
+	def prune(self, older_than_seconds: float) -> int:
+		with self._lock:
+			cur = self._conn.execute(
+				"DELETE FROM outbox WHERE state IN ('sent', 'expired') AND created < ?",
+				(time.time() - older_than_seconds,),
+			)
+			return cur.rowcount
+
+	def close(self) -> None:
+		with self._lock:
+			self._conn.close()
+
+	def stats(self) -> dict:
+		return {
+			"recorded": self.recorded,
+			"duplicates": self.duplicates,
+			"sent": self.sent,
+			"retried": self.retried,
+			"expired": self.expired,
+		}
+
+
+def open_outbox(config: dict) -> Optional[SosOutbox]:
+	if not config.get("outbox_enabled", True):
+		return None
+	directory = Path(config.get("store_dir", "."))
+	directory.mkdir(parents=True, exist_ok=True)
+	return SosOutbox(
+		directory / "sos_outbox.db",
+		retry_seconds=config.get("outbox_retry_seconds", 30.0),
+		max_age_seconds=config.get("outbox_max_age_seconds", 3600.0),
+	)
@@ -0,0 +1,262 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Callable, Iterator, Optional
+
+from battery import parse_percent
+from codec import CodecError, decode
+
+
+def iso_now() -> str:
+	return datetime.now(timezone.utc).isoformat()
+
+
+def status_row(data: dict) -> tuple:
+	# (ts, deviceId, state, batteryPercent, lat, lon, percent); percent is
+	# the battery as a float, or None when absent or unparseable
+	batt = data.get("batteryPercent")
+	return (
+		data.get("ts", iso_now()),
+		data.get("deviceId", "unknown"),
+		data.get("state"),
+		batt,
+		data.get("lat"),
+		data.get("lon"),
+		parse_percent(batt),
+	)
+
+
+def _lower_priority() -> None:
+	# Pool worker initializer
+	try:
+		os.nice(10)
+	except (AttributeError, OSError):
+		pass
+
+
+def decode_status_batch(payloads: list[bytes]) -> tuple[list[tuple], int]:
+	# Runs in a pool worker: decode, validate and parse the battery level for
+	# a whole batch so the parent only does storage, registry and tracker updates.
+	rows = []
+	bad = 0
+	for raw in payloads:
+		try:
+			data = decode("status", raw)
+		except CodecError:
+			bad += 1
+			continue
+		rows.append(status_row(data))
+	return rows, bad
+
+
+# Bulk lane for status heartbeats. The MQTT thread only appends the raw
+# payload to the open batch; batches are cut by size or age, decoded in a
+# process pool and applied back in this process in small chunks, strictly in
+# the order the batches were cut: a small batch flushed by age can finish
+# decoding before a larger earlier one, and applying it first would move a
+# device's last-known state and location backwards. Heartbeat
+# load is kept away from the SOS lane (which stays inline on the MQTT thread)
+# in two ways: at most max_pending batches may be in flight, beyond which new
+# heartbeats are shed and counted, and the applier stands aside for an SOS.
+# It yields the GIL after every apply_chunk rows, so a waiting SOS gets the
+# interpreter within about one chunk, and while an SOS is being handled
+# (urgent()) it stops after the row in hand until the SOS is done, so the
+# ACK path does not keep losing the GIL to it at every blocking call.
+class StatusPipeline:
+	def __init__(
+		self,
+		apply: Callable[[tuple], None],
+		mode: str = "process",
+		batch_size: int = 500,
+		flush_seconds: float = 0.2,
+		workers: int = 2,
+		max_pending: int = 16,
+		apply_chunk: int = 100,
+		on_invalid: Optional[Callable[[int], None]] = None,
+	):
+		self._apply = apply
+		self._on_invalid = on_invalid
+		self.mode = mode
+		self.batch_size = max(1, batch_size)
+		self.flush_seconds = flush_seconds
+		self.workers = max(1, workers)
+		self.max_pending = max(1, max_pending)
+		self.apply_chunk = max(1, apply_chunk)
+		self._batch: list[bytes] = []
+		self._batch_started = 0.0
+		self._lock = threading.Lock()
+		self._pending = 0
+		self._cut_seq = 0
+		# Decoded batches by cut sequence number, applied from _apply_seq on
+		self._applied: dict[int, tuple[list[tuple], int]] = {}
+		self._apply_seq = 0
+		self._applied_cond = threading.Condition()
+		self._executor: Optional[Executor] = None
+		self._applier: Optional[threading.Thread] = None
+		self._urgent = 0
+		self._urgent_cond = threading.Condition()
+		self._running = False
+		self.accepted = 0
+		self.shed = 0
+		self.invalid = 0
+		self.batches = 0
+
+	def start(self) -> None:
+		if self._running:
+			return
+		if self.mode == "process":
+			# Niced: on a busy host the decoders, not the MQTT thread, wait for a core
+			self._executor = ProcessPoolExecutor(
+				self.workers, mp_context=multiprocessing.get_context("spawn"), initializer=_lower_priority
+			)
+		else:
+			self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="status-decode")
+		self._running = True
+		threading.Thread(target=self._flush_loop, name="status-flush", daemon=True).start()
+		self._applier = threading.Thread(target=self._apply_loop, name="status-apply", daemon=True)
+		self._applier.start()
+
+	def stop(self) -> None:
+		self._cut()
+		if self._executor is not None:
+			self._executor.shutdown(wait=True)
+		with self._applied_cond:
+			self._running = False
+			self._applied_cond.notify_all()
+		if self._applier is not None:
+			self._applier.join()
+
+	def submit(self, payload: bytes) -> bool:
+		with self._lock:
+			if self._pending >= self.max_pending:
+				self.shed += 1
+				return False
+			if not self._batch:
+				self._batch_started = time.monotonic()
+			self._batch.append(payload)
+			self.accepted += 1
+			full = len(self._batch) >= self.batch_size
+		if full:
+			self._cut()
+		return True
+
+	@contextmanager
+	def urgent(self) -> Iterator[None]:
+		# Held by the MQTT thread around an SOS; nests and may overlap
+		with self._urgent_cond:
+			self._urgent += 1
+		try:
+			yield
+		finally:
+			with self._urgent_cond:
+				self._urgent -= 1
+				if not self._urgent:
+					self._urgent_cond.notify_all()
+
+	def _cut(self) -> None:
+		with self._lock:
+			if not self._batch or self._executor is None:
+				return
+			batch, self._batch = self._batch, []
+			seq = self._cut_seq
+			self._cut_seq += 1
+			self._pending += 1
+			self.batches += 1
+		decode = decode_status_batch if self.mode == "process" else self._decode_in_thread
+		try:
+			future = self._executor.submit(decode, batch)
+		except RuntimeError as exc:
+			# Broken or shut down pool: drop the batch instead of raising on the
+			# MQTT thread; its empty result keeps later batches moving
+			print(f"[pipeline] dropped status batch of {len(batch)}: {exc}")
+			with self._lock:
+				self.shed += len(batch)
+			self._put(seq, ([], 0))
+			return
+		future.add_done_callback(lambda future: self._decoded(seq, future))
+
+	def _decode_in_thread(self, payloads: list[bytes]) -> tuple[list[tuple], int]:
+		# Thread mode decodes in this process, so it stands aside for an SOS too
+		rows: list[tuple] = []
+		bad = 0
+		for start in range(0, len(payloads), self.apply_chunk):
+			self._wait_urgent()
+			chunk_rows, chunk_bad = decode_status_batch(payloads[start:start + self.apply_chunk])
+			rows.extend(chunk_rows)
+			bad += chunk_bad
+		return rows, bad
+
+	def _wait_urgent(self) -> None:
+		if self._urgent:
+			with self._urgent_cond:
+				while self._urgent:
+					self._urgent_cond.wait()
+
+	def _decoded(self, seq: int, future: Future) -> None:
+		try:
+			result = future.result()
+		except Exception as exc:
+			print(f"[pipeline] status batch failed: {exc}")
+			result = ([], 0)
+		self._put(seq, result)
+
+	def _put(self, seq: int, result: tuple[list[tuple], int]) -> None:
+		with self._applied_cond:
+			self._applied[seq] = result
+			if seq == self._apply_seq:
+				self._applied_cond.notify()
+
+	def _flush_loop(self) -> None:
+		while self._running:
+			time.sleep(self.flush_seconds)
+			with self._lock:
+				due = self._batch and time.monotonic() - self._batch_started >= self.flush_seconds
+			if due:
+				self._cut()
+
+	def _apply_loop(self) -> None:
+		while True:
+			with self._applied_cond:
+				# Wait for the next batch in cut order, even if later ones are done
+				while self._running and self._apply_seq not in self._applied:
+					self._applied_cond.wait()
+				if self._apply_seq not in self._applied:
+					return
+				rows, bad = self._applied.pop(self._apply_seq)
+				self._apply_seq += 1
+			self._apply_rows(rows, bad)
+
+	def _apply_rows(self, rows: list[tuple], bad: int) -> None:
+		if bad:
+			self.invalid += bad
+			if self._on_invalid is not None:
+				self._on_invalid(bad)
+		for i, row in enumerate(rows, 1):
+			try:
+				self._apply(row)
+			except Exception as exc:
+				print(f"[pipeline] failed to apply status row: {exc}")
+			if self._urgent:
+				self._wait_urgent()
+			elif i % self.apply_chunk == 0:
+				time.sleep(0)
+		with self._lock:
+			self._pending -= 1
+
+	@property
+	def pending(self) -> int:
+		return self._pending
+
+	def stats(self) -> dict:
+		return {
+			"accepted": self.accepted,
+			"shed": self.shed,
+			"invalid": self.invalid,
+			"batches": self.batches,
+			"pending_batches": self._pending,
+			"open_batch": len(self._batch),
+		}
@@ -0,0 +1,178 @@
+import importlib.util
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+
+# Twilio client that is only built when first needed. twilio.rest pulls in
+# requests and urllib3, about a third of the server's import time, and is
+# not needed at all when Twilio is not configured, so it is imported on
+# first use rather than at module load.
+#
+# Building the client opens no connection, so without help the first SOS
+# would also pay for DNS, TCP and TLS to the API host. warm() opens pooled
+# keep-alive connections ahead of time with an unauthenticated HEAD (no API
+# call, nothing billed); the server runs it in the background once MQTT is
+# up, and again every keepwarm interval because idle connections are closed
+# by the far end. A failed warm-up is harmless: sends connect as before.
+#
+# asynchronous=True builds twilio's aiohttp client instead (SERVER_MODE=
+# asyncio); the client, and warm_async(), must then run on the event loop.
+
+API_URL = "https://api.twilio.com"
+
+
+def twilio_installed(asynchronous: bool = False) -> bool:
+	# Without importing anything
+	if importlib.util.find_spec("twilio") is None:
+		return False
+	return not asynchronous or importlib.util.find_spec("aiohttp") is not None
+
+
+class LazyTwilio:
+	def __init__(
+		self,
+		sid: str,
+		token: str,
+		pool_size: int = 4,
+		timeout: float = 10.0,
+		api_url: str = API_URL,
+		asynchronous: bool = False,
+	):
+		self.sid = sid
+		self.token = token
+		self.pool_size = max(1, pool_size)
+		self.timeout = timeout
+		self.api_url = api_url.rstrip("/")
+		self.asynchronous = asynchronous
+		self._client = None
+		self._lock = threading.Lock()
+		self.built_seconds: Optional[float] = None
+		self.warmups = 0
+		self.warm_failures = 0
+		self.last_warm_seconds: Optional[float] = None
+
+	@property
+	def client(self):
+		client = self._client
+		if client is None:
+			with self._lock:
+				if self._client is None:
+					start = time.perf_counter()
+					self._client = self._build()
+					self.built_seconds = time.perf_counter() - start
+				client = self._client
+		return client
+
+	@property
+	def built(self) -> bool:
+		return self._client is not None
+
+	def preload(self) -> None:
+		# Imports only, so it may run on any thread; _build is then cheap
+		import twilio.rest  # noqa: F401
+
+		if self.asynchronous:
+			import twilio.http.async_http_client  # noqa: F401
+
+	def _build(self):
+		from twilio.rest import Client
+
+		if self.asynchronous:
+			from twilio.http.async_http_client import AsyncTwilioHttpClient
+
+			http_client = AsyncTwilioHttpClient(timeout=self.timeout)
+		else:
+			from requests.adapters import HTTPAdapter
+			from twilio.http.http_client import TwilioHttpClient
+
+			# One keep-alive session shared by all dispatcher workers, with
+			# enough pooled connections that concurrent sends to different
+			# recipients do not open fresh TLS connections
+			http_client = TwilioHttpClient(pool_connections=True, timeout=self.timeout)
+			http_client.session.mount(self.api_url, HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size))
+		client = Client(self.sid, self.token, http_client=http_client)
+		if self.api_url != API_URL:
+			client.api.base_url = self.api_url
+		return client
+
+	@property
+	def messages(self):
+		return self.client.messages
+
+	@property
+	def calls(self):
+		return self.client.calls
+
+	def warm(self, connections: int = 1) -> bool:
+		session = self.client.http_client.session
+		connections = max(1, min(connections, self.pool_size))
+
+		def touch(_) -> None:
+			session.head(self.api_url, timeout=self.timeout)
+
+		start = time.perf_counter()
+		try:
+			# Concurrently, so each request holds its own pooled connection
+			with ThreadPoolExecutor(max_workers=connections, thread_name_prefix="twilio-warm") as pool:
+				list(pool.map(touch, range(connections)))
+		except Exception as exc:
+			return self._warmed(start, exc)
+		return self._warmed(start)
+
+	async def warm_async(self, connections: int = 1) -> bool:
+		import asyncio
+
+		session = self.client.http_client.session
+
+		async def touch() -> None:
+			async with session.head(self.api_url, timeout=self.timeout) as response:
+				await response.read()
+
+		start = time.perf_counter()
+		try:
+			await asyncio.gather(*(touch() for _ in range(max(1, connections))))
+		except Exception as exc:
+			return self._warmed(start, exc)
+		return self._warmed(start)
+
+	def _warmed(self, start: float, exc: Optional[Exception] = None) -> bool:
+		self.last_warm_seconds = time.perf_counter() - start
+		if exc is not None:
+			self.warm_failures += 1
+			print(f"[server] Twilio warm-up failed: {exc}")
+			return False
+		self.warmups += 1
+		return True
+
+	def keep_warm(self, connections: int, interval: float, stopping: threading.Event) -> None:
+		# Thread body for the sync server: warm now, then every interval (0 = once)
+		if self.warm(connections):
+			print(f"[server] Twilio: {connections} connection(s) to {self.api_url} warm in {self.last_warm_seconds * 1000:.0f} ms")
+		while interval > 0 and not stopping.wait(interval):
+			self.warm(connections)
+
+	async def keep_warm_async(self, connections: int, interval: float) -> None:
+		import asyncio
+
+		# Importing twilio takes a few hundred ms; not on the loop
+		await asyncio.get_running_loop().run_in_executor(None, self.preload)
+		if await self.warm_async(connections):
+			print(f"[server] Twilio: {connections} connection(s) to {self.api_url} warm in {self.last_warm_seconds * 1000:.0f} ms")
+		while interval > 0:
+			await asyncio.sleep(interval)
+			await self.warm_async(connections)
+
+	async def aclose(self) -> None:
+		if self._client is not None and self.asynchronous:
+			await self._client.http_client.close()
+
+	def stats(self) -> dict:
+		return {
+			"built": self.built,
+			"build_ms": None if self.built_seconds is None else round(self.built_seconds * 1000, 1),
+			"warmups": self.warmups,
+			"warm_failures": self.warm_failures,
+			"last_warm_ms": None if self.last_warm_seconds is None else round(self.last_warm_seconds * 1000, 1),
+		}
@@ -0,0 +1,465 @@
+import argparse
+import csv
+import io
+import itertools
+import json
+import mmap
+import re
+import sqlite3
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+from storage import CSV_FILES, SCHEMAS, SegmentManifest, read_segment
+
+
+# Incremental sparse index over the CSV event logs. Each log is cut into
+# blocks of BLOCK_ROWS records, at record ends rather than at every newline
+# since a quoted field may span lines; per block the index keeps its byte
+# range, time span and lat/lon bounding box, plus which devices appear in
+# it. A query reads only the blocks that can match, via mmap, and streams
+# the rows. New appends are indexed on the next query by continuing from the
+# last indexed record end; a file that shrank (rotated or truncated) is
+# re-indexed from scratch.
+#
+# The index lives in STORE_DIR/query_index.db and covers STORE_DIR plus any
+# worker-N/ subdirectories written by clustered servers, including plain
+# segments of STORE_BACKEND=segmented. Gzipped segments cannot be mmapped;
+# they are selected by the time span recorded in the manifest and streamed.
+# With STORE_BACKEND=sqlite the events table is queried directly instead,
+# comparing timestamps as instants (julianday), with indexes on that created
+# on first use.
+
+BLOCK_ROWS = 4096
+INDEX_FILE = "query_index.db"
+QUERY_KINDS = ("sos", "status")
+
+_INDEX_SCHEMA = (
+	"CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, kind TEXT, indexed_bytes INTEGER)",
+	"CREATE TABLE IF NOT EXISTS blocks ("
+	"id INTEGER PRIMARY KEY, path TEXT, start INTEGER, end INTEGER, rows INTEGER, "
+	"ts_min REAL, ts_max REAL, lat_min REAL, lat_max REAL, lon_min REAL, lon_max REAL)",
+	"CREATE INDEX IF NOT EXISTS blocks_time ON blocks (path, ts_max, ts_min)",
+	"CREATE TABLE IF NOT EXISTS device_blocks (device TEXT, block INTEGER, PRIMARY KEY (device, block)) WITHOUT ROWID",
+)
+
+_RELATIVE = re.compile(r"^(\d+(?:\.\d+)?)([smhdw])$")
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+def parse_time(value: str) -> float:
+	# ISO-8601, "now", or a relative age such as 90m, 12h, 7d, 2w; an argparse type
+	value = value.strip()
+	if value == "now":
+		return time.time()
+	match = _RELATIVE.match(value)
+	if match:
+		return time.time() - float(match.group(1)) * _UNITS[match.group(2)]
+	try:
+		parsed = datetime.fromisoformat(value)
+	except ValueError:
+		raise argparse.ArgumentTypeError(f"{value!r} is not an ISO time, now, or an age such as 12h, 7d") from None
+	if parsed.tzinfo is None:
+		parsed = parsed.replace(tzinfo=timezone.utc)
+	return parsed.timestamp()
+
+
+def _epoch(ts: str) -> Optional[float]:
+	try:
+		parsed = datetime.fromisoformat(ts)
+	except ValueError:
+		return None
+	if parsed.tzinfo is None:
+		parsed = parsed.replace(tzinfo=timezone.utc)
+	return parsed.timestamp()
+
+
+def _record_end(mm: mmap.mmap, pos: int, limit: int) -> int:
+	# Offset just past the CSV record starting at pos, or -1 if it does not
+	# end before limit. csv.writer doubles quotes inside a quoted field, so a
+	# newline ends the record only where the count of quotes so far is even.
+	quotes = 0
+	while True:
+		nl = mm.find(b"\n", pos, limit)
+		if nl < 0:
+			return -1
+		quotes += mm[pos:nl].count(b'"')
+		pos = nl + 1
+		if quotes % 2 == 0:
+			return pos
+
+
+def _float(value: str) -> Optional[float]:
+	try:
+		return float(value)
+	except ValueError:
+		return None
+
+
+def _columns(kind: str) -> tuple[int, int, int]:
+	cols = SCHEMAS[kind]
+	return cols.index("deviceId"), cols.index("lat"), cols.index("lon")
+
+
+def _log_dirs(store_dir: Path) -> list[Path]:
+	return [store_dir] + sorted(p for p in store_dir.glob("worker-*") if p.is_dir())
+
+
+def log_files(store_dir: Path, kind: str) -> list[Path]:
+	# Plain (mmappable) logs: legacy single files and uncompressed segments
+	paths = []
+	for directory in _log_dirs(store_dir):
+		paths.append(directory / CSV_FILES[kind])
+		paths.extend(sorted((directory / "segments").glob(f"{kind}-*.csv")))
+	return [p for p in paths if p.exists()]
+
+
+def compressed_segments(store_dir: Path, kind: str, since: Optional[float], until: Optional[float]) -> list[Path]:
+	paths = []
+	for directory in _log_dirs(store_dir):
+		if not (directory / "segments" / "manifest.json").exists():
+			continue
+		manifest = SegmentManifest(directory / "segments")
+		for segment in manifest.snapshot(kind):
+			if segment["state"] != "compressed":
+				continue
+			lo, hi = _epoch(segment["ts_min"] or ""), _epoch(segment["ts_max"] or "")
+			if lo is not None and hi is not None and ((since is not None and hi < since) or (until is not None and lo > until)):
+				continue
+			paths.append(manifest.directory / segment["file"])
+	return paths
+
+
+class LogIndex:
+	def __init__(self, store_dir: Path):
+		self.store_dir = store_dir
+		self._conn = sqlite3.connect(str(store_dir / INDEX_FILE))
+		for statement in _INDEX_SCHEMA:
+			self._conn.execute(statement)
+
+	def close(self) -> None:
+		self._conn.close()
+
+	def update(self, kind: str) -> int:
+		# Index whatever was appended since the last call; returns new rows
+		added = 0
+		paths = log_files(self.store_dir, kind)
+		live = {str(p.relative_to(self.store_dir)) for p in paths}
+		for (key,) in self._conn.execute("SELECT path FROM files WHERE kind=?", (kind,)).fetchall():
+			if key not in live:
+				# Segment was compressed (or deleted) since it was indexed
+				self._drop_file(key)
+		for path in paths:
+			added += self._update_file(kind, path)
+		self._conn.commit()
+		return added
+
+	def _update_file(self, kind: str, path: Path) -> int:
+		key = str(path.relative_to(self.store_dir))
+		size = path.stat().st_size
+		row = self._conn.execute("SELECT indexed_bytes FROM files WHERE path=?", (key,)).fetchone()
+		offset = row[0] if row else 0
+		if size < offset:
+			self._drop_file(key)
+			offset = 0
+		if size == offset:
+			return 0
+		dev_col, lat_col, lon_col = _columns(kind)
+		added = 0
+		with path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+			if offset == 0 and mm[:3] == b"ts,":
+				offset = mm.find(b"\n") + 1
+			end_of_data = mm.rfind(b"\n", offset) + 1
+			pos = offset
+			while pos < end_of_data:
+				start = pos
+				records = []
+				while len(records) < BLOCK_ROWS:
+					end = _record_end(mm, pos, end_of_data)
+					if end < 0:
+						# Nothing left, or a record still being written
+						break
+					records.append(mm[pos:end].decode("utf-8", errors="replace"))
+					pos = end
+				if not records:
+					break
+				added += self._add_block(key, start, pos, records, dev_col, lat_col, lon_col)
+			self._conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?)", (key, kind, pos))
+		self._conn.commit()
+		return added
+
+	def _add_block(self, key: str, start: int, end: int, records: list[str], dev_col: int, lat_col: int, lon_col: int) -> int:
+		ts_min = lat_min = lon_min = float("inf")
+		ts_max = lat_max = lon_max = float("-inf")
+		devices = set()
+		for fields in csv.reader(records):
+			if len(fields) <= max(dev_col, lat_col, lon_col):
+				continue
+			devices.add(fields[dev_col])
+			ts = _epoch(fields[0])
+			if ts is not None:
+				ts_min = min(ts_min, ts)
+				ts_max = max(ts_max, ts)
+			lat, lon = _float(fields[lat_col]), _float(fields[lon_col])
+			if lat is not None and lon is not None:
+				lat_min, lat_max = min(lat_min, lat), max(lat_max, lat)
+				lon_min, lon_max = min(lon_min, lon), max(lon_max, lon)
+		cur = self._conn.execute(
+			"INSERT INTO blocks (path, start, end, rows, ts_min, ts_max, lat_min, lat_max, lon_min, lon_max) "
+			"VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+			(key, start, end, len(records), ts_min, ts_max, lat_min, lat_max, lon_min, lon_max),
+		)
+		self._conn.executemany("INSERT OR IGNORE INTO device_blocks VALUES (?, ?)", [(d, cur.lastrowid) for d in devices])
+		return len(records)
+
+	def _drop_file(self, key: str) -> None:
+		self._conn.execute("DELETE FROM device_blocks WHERE block IN (SELECT id FROM blocks WHERE path=?)", (key,))
+		self._conn.execute("DELETE FROM blocks WHERE path=?", (key,))
+		self._conn.execute("DELETE FROM files WHERE path=?", (key,))
+
+	def blocks(
+		self,
+		kind: str,
+		since: Optional[float] = None,
+		until: Optional[float] = None,
+		device: Optional[str] = None,
+		bbox: Optional[tuple[float, float, float, float]] = None,
+	) -> list[tuple[str, int, int]]:
+		sql = ["SELECT b.path, b.start, b.end FROM blocks b JOIN files f ON f.path = b.path"]
+		args: list = []
+		if device is not None:
+			sql.append("JOIN device_blocks d ON d.block = b.id AND d.device = ?")
+			args.append(device)
+		sql.append("WHERE f.kind = ?")
+		args.append(kind)
+		if since is not None:
+			sql.append("AND b.ts_max >= ?")
+			args.append(since)
+		if until is not None:
+			sql.append("AND b.ts_min <= ?")
+			args.append(until)
+		if bbox is not None:
+			sql.append("AND b.lat_max >= ? AND b.lat_min <= ? AND b.lon_max >= ? AND b.lon_min <= ?")
+			args.extend(bbox)
+		sql.append("ORDER BY b.path, b.start")
+		return self._conn.execute(" ".join(sql), args).fetchall()
+
+
+def _read_blocks(store_dir: Path, blocks: list[tuple[str, int, int]]) -> Iterator[list[str]]:
+	# One mmap per file; only the matching byte ranges are touched
+	current = None
+	f = mm = None
+	try:
+		for path, start, end in blocks:
+			if path != current:
+				if mm is not None:
+					mm.close()
+					f.close()
+				current = path
+				f = (store_dir / path).open("rb")
+				mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+			# Blocks hold whole records; a quoted field may still contain newlines
+			yield from csv.reader(io.StringIO(mm[start:end].decode("utf-8", errors="replace"), newline=""))
+	finally:
+		if mm is not None:
+			mm.close()
+			f.close()
+
+
+def _in_range(ts: Optional[float], since: Optional[float], until: Optional[float]) -> bool:
+	if ts is None:
+		return since is None and until is None
+	return (since is None or ts >= since) and (until is None or ts <= until)
+
+
+class EventQuery:
+	# Streaming queries over the logs in store_dir (CSV or sqlite backend)
+	def __init__(self, store_dir: Path, backend: str = "buffered"):
+		self.store_dir = store_dir
+		self.sqlite_path = store_dir / "events.db"
+		self.use_sqlite = backend == "sqlite" and self.sqlite_path.exists()
+		self._index: Optional[LogIndex] = None
+		self._db: Optional[sqlite3.Connection] = None
+		if self.use_sqlite:
+			self._db = sqlite3.connect(str(self.sqlite_path))
+			self._db.execute('CREATE INDEX IF NOT EXISTS status_device_jd ON status ("deviceId", julianday(ts))')
+			self._db.execute("CREATE INDEX IF NOT EXISTS sos_jd ON sos (julianday(ts))")
+		else:
+			self._index = LogIndex(store_dir)
+
+	def close(self) -> None:
+		if self._index is not None:
+			self._index.close()
+		if self._db is not None:
+			self._db.close()
+
+	def update_index(self) -> dict:
+		if self._index is None:
+			return {}
+		return {kind: self._index.update(kind) for kind in QUERY_KINDS}
+
+	def _rows(self, kind: str, since, until, device=None, bbox=None) -> Iterator[dict]:
+		columns = SCHEMAS[kind]
+		if self._db is not None:
+			yield from self._sql_rows(kind, since, until, device, bbox)
+			return
+		self._index.update(kind)
+		dev_col, lat_col, lon_col = _columns(kind)
+		blocks = _read_blocks(self.store_dir, self._index.blocks(kind, since, until, device, bbox))
+		archived = (row for path in compressed_segments(self.store_dir, kind, since, until) for row in read_segment(path))
+		for fields in itertools.chain(archived, blocks):
+			if len(fields) != len(columns) or (device is not None and fields[dev_col] != device):
+				continue
+			if not _in_range(_epoch(fields[0]), since, until):
+				continue
+			if bbox is not None:
+				lat, lon = _float(fields[lat_col]), _float(fields[lon_col])
+				if lat is None or lon is None or not (bbox[0] <= lat <= bbox[1] and bbox[2] <= lon <= bbox[3]):
+					continue
+			yield dict(zip(columns, fields))
+
+	def _sql_rows(self, kind: str, since, until, device, bbox) -> Iterator[dict]:
+		# ts is stored as the device's ISO string, in whatever offset it used;
+		# julianday() turns both sides into the same instant scale (no offset = UTC)
+		columns = SCHEMAS[kind]
+		sql = [f"SELECT * FROM {kind} WHERE 1=1"]
+		args: list = []
+		if device is not None:
+			sql.append('AND "deviceId" = ?')
+			args.append(device)
+		if since is not None:
+			sql.append("AND julianday(ts) >= julianday(?)")
+			args.append(datetime.fromtimestamp(since, timezone.utc).isoformat())
+		if until is not None:
+			sql.append("AND julianday(ts) <= julianday(?)")
+			args.append(datetime.fromtimestamp(until, timezone.utc).isoformat())
+		if bbox is not None:
+			sql.append("AND lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?")
+			args.extend(bbox)
+		sql.append("ORDER BY julianday(ts)")
+		for row in self._db.execute(" ".join(sql), args):
+			yield {c: "" if v is None else str(v) for c, v in zip(columns, row)}
+
+	def track(self, device: str, since: Optional[float] = None, until: Optional[float] = None) -> Iterator[dict]:
+		for row in self._rows("status", since, until, device=device):
+			if row["lat"] and row["lon"]:
+				yield {"ts": row["ts"], "deviceId": row["deviceId"], "lat": row["lat"], "lon": row["lon"], "state": row["state"]}
+
+	def sos(
+		self,
+		since: Optional[float] = None,
+		until: Optional[float] = None,
+		bbox: Optional[tuple[float, float, float, float]] = None,
+		device: Optional[str] = None,
+	) -> Iterator[dict]:
+		yield from self._rows("sos", since, until, device=device, bbox=bbox)
+
+	def battery(
+		self,
+		devices: Iterable[Optional[str]],
+		since: Optional[float] = None,
+		until: Optional[float] = None,
+		bucket_seconds: float = 3600.0,
+	) -> Iterator[dict]:
+		# Per device: average battery per time bucket and the drain rate
+		# (percent per hour) since the previous bucket
+		for device in devices:
+			buckets: dict[tuple[str, int], list[float]] = {}
+			for row in self._rows("status", since, until, device=device):
+				ts, batt = _epoch(row["ts"]), _float(row["batteryPercent"])
+				if ts is None or batt is None:
+					continue
+				acc = buckets.setdefault((row["deviceId"], int(ts // bucket_seconds)), [0.0, 0])
+				acc[0] += batt
+				acc[1] += 1
+			previous: dict[str, tuple[int, float]] = {}
+			for (device_id, bucket), (total, count) in sorted(buckets.items()):
+				avg = total / count
+				drain = ""
+				if device_id in previous:
+					prev_bucket, prev_avg = previous[device_id]
+					hours = (bucket - prev_bucket) * bucket_seconds / 3600.0
+					drain = round((prev_avg - avg) / hours, 2)
+				previous[device_id] = (bucket, avg)
+				yield {
+					"deviceId": device_id,
+					"bucket": datetime.fromtimestamp(bucket * bucket_seconds, timezone.utc).isoformat(),
+					"battery": round(avg, 1),
+					"samples": count,
+					"drainPerHour": drain,
+				}
+
+
+def _bbox(value: str) -> tuple[float, float, float, float]:
+	# lat1,lon1,lat2,lon2 (any two opposite corners) -> lat_min, lat_max, lon_min, lon_max
+	lat1, lon1, lat2, lon2 = (float(v) for v in value.split(","))
+	return min(lat1, lat2), max(lat1, lat2), min(lon1, lon2), max(lon1, lon2)
+
+
+def _emit(rows: Iterable[dict], fmt: str) -> int:
+	writer = None
+	count = 0
+	for row in rows:
+		if fmt == "jsonl":
+			sys.stdout.write(json.dumps(row) + "\n")
+		else:
+			if writer is None:
+				writer = csv.DictWriter(sys.stdout, fieldnames=list(row))
+				writer.writeheader()
+			writer.writerow(row)
+		count += 1
+	sys.stdout.flush()
+	return count
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+	parser = argparse.ArgumentParser(prog="server.py query", description="Query stored status/SOS history")
+	parser.add_argument("--store-dir", help="Event log directory (default: STORE_DIR)")
+	parser.add_argument("--backend", help="csv/buffered or sqlite (default: STORE_BACKEND)")
+	sub = parser.add_subparsers(dest="command", required=True)
+	sub.add_parser("index", help="Bring the block index up to date")
+	track = sub.add_parser("track", help="Locations reported by a device")
+	track.add_argument("--device", required=True)
+	sos = sub.add_parser("sos", help="SOS events, optionally inside a bounding box")
+	sos.add_argument("--bbox", type=_bbox, help="lat1,lon1,lat2,lon2")
+	sos.add_argument("--device")
+	battery = sub.add_parser("battery", help="Battery level and drain rate per device over time")
+	battery.add_argument("--device", action="append", help="Repeat for several devices (default: all, which scans every block)")
+	battery.add_argument("--bucket", type=float, default=60.0, help="Bucket size in minutes")
+	for p in (track, sos, battery):
+		p.add_argument("--format", choices=("csv", "jsonl"), default="csv")
+		p.add_argument("--since", type=parse_time, help="ISO time or age such as 12h, 7d (default: everything)")
+		p.add_argument("--until", type=parse_time, help="ISO time or age (default: now)")
+	return parser.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+	from server import load_config
+
+	args = parse_args(argv)
+	config = load_config()
+	query = EventQuery(Path(args.store_dir or config["store_dir"]), args.backend or config["store_backend"])
+	try:
+		if args.command == "index":
+			start = time.perf_counter()
+			added = query.update_index()
+			print(f"[query] indexed {added} new rows in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+			return
+		if args.command == "track":
+			rows = query.track(args.device, args.since, args.until)
+		elif args.command == "sos":
+			rows = query.sos(args.since, args.until, bbox=args.bbox, device=args.device)
+		else:
+			rows = query.battery(args.device or [None], args.since, args.until, bucket_seconds=args.bucket * 60)
+		count = _emit(rows, args.format)
+		print(f"[query] {count} rows", file=sys.stderr)
+	except BrokenPipeError:
+		pass
+	finally:
+		query.close()
+
+
+if __name__ == "__main__":
+	main()
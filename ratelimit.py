@@ -0,0 +1,77 @@
+import threading
+import time
+from collections import OrderedDict
+
+from notify import PRIORITY_NAMES, PRIORITY_SOS
+
+
+class _Bucket:
+	__slots__ = ("tokens", "updated")
+
+	def __init__(self, tokens: float, updated: float):
+		self.tokens = tokens
+		self.updated = updated
+
+
+# Token buckets scoped by (device, recipient, channel, priority class). Each
+# non-SOS class has a burst size and refills one token every refill_seconds.
+# SOS is never suppressed here (bursts are merged by the coalescer instead).
+# A bucket idle for burst * refill_seconds is full again, the same as a new
+# one, so dropping it is lossless. Buckets are evicted strictly in LRU order:
+# on each call every bucket idle for the largest burst's refill time (so LRU
+# order is also idle order), and the least recently used ones whenever a new
+# bucket would take the table past max_buckets.
+class TokenBucketLimiter:
+	def __init__(self, refill_seconds: float, bursts: dict[int, int], max_buckets: int = 100_000):
+		self.refill_seconds = refill_seconds
+		self.bursts = bursts
+		self.max_buckets = max(1, max_buckets)
+		self._idle_seconds = max(bursts.values(), default=1) * refill_seconds
+		self._buckets: "OrderedDict[tuple, _Bucket]" = OrderedDict()
+		self._lock = threading.Lock()
+		self.suppressed: dict[tuple[str, str], int] = {}
+		self.evicted = 0
+
+	def allow(self, device_id: str, channel: str, recipient: str, priority: int) -> bool:
+		if priority == PRIORITY_SOS or self.refill_seconds <= 0:
+			return True
+		burst = self.bursts.get(priority, 1)
+		key = (device_id, recipient, channel, priority)
+		now = time.monotonic()
+		with self._lock:
+			self._evict(now, 0 if key in self._buckets else 1)
+			bucket = self._buckets.get(key)
+			if bucket is None:
+				bucket = self._buckets[key] = _Bucket(float(burst), now)
+			else:
+				self._buckets.move_to_end(key)
+				bucket.tokens = min(float(burst), bucket.tokens + (now - bucket.updated) / self.refill_seconds)
+				bucket.updated = now
+			if bucket.tokens >= 1.0:
+				bucket.tokens -= 1.0
+				return True
+			name = (PRIORITY_NAMES.get(priority, "info"), channel)
+			self.suppressed[name] = self.suppressed.get(name, 0) + 1
+			return False
+
+	def _evict(self, now: float, room: int) -> None:
+		# room: buckets about to be added
+		buckets = self._buckets
+		while buckets:
+			bucket = next(iter(buckets.values()))
+			if len(buckets) + room > self.max_buckets or now - bucket.updated >= self._idle_seconds:
+				buckets.popitem(last=False)
+				self.evicted += 1
+			else:
+				break
+
+	def __len__(self) -> int:
+		return len(self._buckets)
+
+	def stats(self) -> dict:
+		with self._lock:
+			return {
+				"buckets": len(self._buckets),
+				"evicted": self.evicted,
+				"suppressed": {f"{cls}/{channel}": n for (cls, channel), n in self.suppressed.items()},
+			}
@@ -0,0 +1,231 @@
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Optional
+
+
+# Who is notified for which device, loaded from ROUTES_FILE:
+#
+#   {
+#     "default": {"contacts": ["+15550001"], "channels": ["sms"]},
+#     "routes": [
+#       {"device": "ring-01", "contacts": ["+15550002", {"number": "+15550003", "channels": ["sms", "call"]}]},
+#       {"group": "school", "devices": ["ring-07", "ring-08"], "contacts": ["+15550004"]},
+#       {"prefix": "care-home-", "contacts": ["+15550005"], "channels": ["call"]}
+#     ]
+#   }
+#
+# A device gets the union of every route naming it (by id, group membership
+# or prefix); only a device no route matches falls back to "default" (or to
+# EMERGENCY_NUMBERS when the file has none). Channels are per contact: "sms"
+# receives every alert, "call" rings on SOS. Without "channels" a contact
+# gets SMS, plus calls when TWILIO_ENABLE_CALLS is set.
+#
+# Everything is resolved into an immutable index when the file is loaded:
+# devices named by id or group map straight to their Recipients, and other
+# devices cost one dict probe per distinct prefix length (a handful), so a
+# lookup on the SOS path is a few dict accesses whatever the fleet size.
+# A watcher thread polls the file and builds the new index on its own
+# thread; the server swaps it in with one reference assignment, so a lookup
+# sees either the old table or the new one, never a mix. A file that fails
+# to parse keeps the previous table.
+
+CHANNELS = ("sms", "call")
+
+
+class Recipients:
+	__slots__ = ("contacts", "sms", "call")
+
+	def __init__(self, contacts: dict[str, frozenset]):
+		self.contacts = tuple(contacts.items())
+		self.sms = tuple([number for number, channels in self.contacts if "sms" in channels])
+		self.call = tuple([number for number, channels in self.contacts if "call" in channels])
+
+	def __bool__(self) -> bool:
+		return bool(self.contacts)
+
+	def pairs(self) -> list[tuple[str, str]]:
+		# (channel, number) for every notification an SOS sends
+		return [("sms", number) for number in self.sms] + [("call", number) for number in self.call]
+
+
+def _merge(into: dict[str, frozenset], contacts: dict[str, frozenset]) -> None:
+	for number, channels in contacts.items():
+		into[number] = into.get(number, frozenset()) | channels
+
+
+class RoutingIndex:
+	def __init__(
+		self,
+		default: Recipients,
+		routes: list[dict[str, frozenset]],
+		named: dict[str, list[int]],
+		prefixes: dict[str, tuple[int, ...]],
+	):
+		# routes: contacts per route; named/prefixes: route numbers per device
+		# id / prefix. Devices matching the same routes share one Recipients.
+		self.default = default
+		self._routes = routes
+		self._prefixes = prefixes
+		self._lengths = tuple(sorted({len(p) for p in prefixes}))
+		self._combos: dict[tuple[int, ...], Recipients] = {}
+		self._devices = {device_id: self._resolve(tuple(ids) + self._matching(device_id)) for device_id, ids in named.items()}
+
+	def __len__(self) -> int:
+		return len(self._devices)
+
+	@property
+	def prefixes(self) -> int:
+		return len(self._prefixes)
+
+	def _matching(self, device_id: str) -> tuple[int, ...]:
+		# One dict probe per distinct prefix length
+		found: tuple[int, ...] = ()
+		for length in self._lengths:
+			if length > len(device_id):
+				break
+			ids = self._prefixes.get(device_id[:length])
+			if ids is not None:
+				found += ids
+		return found
+
+	def _resolve(self, ids: tuple[int, ...]) -> Recipients:
+		recipients = self._combos.get(ids)
+		if recipients is None:
+			merged: dict[str, frozenset] = {}
+			for i in ids:
+				_merge(merged, self._routes[i])
+			# Racing threads build equal objects; either may win
+			recipients = self._combos[ids] = Recipients(merged)
+		return recipients
+
+	def lookup(self, device_id: str) -> Recipients:
+		recipients = self._devices.get(device_id)
+		if recipients is not None:
+			return recipients
+		if not self._lengths:
+			return self.default
+		ids = self._matching(device_id)
+		return self._resolve(ids) if ids else self.default
+
+
+def _contacts(route: dict, default_channels: frozenset, where: str) -> dict[str, frozenset]:
+	channels = frozenset(route.get("channels") or default_channels)
+	contacts: dict[str, frozenset] = {}
+	for item in route.get("contacts", []):
+		if isinstance(item, str):
+			number, own = item, channels
+		else:
+			number, own = item["number"], frozenset(item.get("channels") or channels)
+		unknown = own - set(CHANNELS)
+		if unknown:
+			raise ValueError(f"{where}: unknown channel(s) {sorted(unknown)} for {number} (expected sms or call)")
+		number = str(number).strip()
+		contacts[number] = contacts.get(number, frozenset()) | own
+	return contacts
+
+
+def build_index(data: dict, default_numbers: list[str], default_channels: frozenset) -> RoutingIndex:
+	if "default" in data:
+		default = Recipients(_contacts(data["default"], default_channels, "default"))
+	else:
+		default = Recipients({number: default_channels for number in default_numbers})
+	routes: list[dict[str, frozenset]] = []
+	named: dict[str, list[int]] = {}
+	prefixes: dict[str, list[int]] = {}
+	for i, route in enumerate(data.get("routes", [])):
+		where = f"route {i + 1}"
+		routes.append(_contacts(route, default_channels, where))
+		if "device" in route:
+			named.setdefault(str(route["device"]), []).append(i)
+		elif "group" in route:
+			for device_id in route.get("devices", []):
+				named.setdefault(str(device_id), []).append(i)
+		elif "prefix" in route:
+			prefixes.setdefault(str(route["prefix"]), []).append(i)
+		else:
+			raise ValueError(f"{where}: needs one of device, group or prefix")
+	return RoutingIndex(default, routes, named, {prefix: tuple(ids) for prefix, ids in prefixes.items()})
+
+
+class RoutingTable:
+	def __init__(
+		self,
+		path: Optional[Path],
+		default_numbers: list[str],
+		default_channels: frozenset = frozenset({"sms"}),
+		reload_seconds: float = 2.0,
+	):
+		self.path = path
+		self.default_numbers = default_numbers
+		self.default_channels = default_channels
+		self.reload_seconds = reload_seconds
+		self.index = build_index({}, default_numbers, default_channels)
+		self._signature: Optional[tuple] = None
+		self._stop = threading.Event()
+		self._thread: Optional[threading.Thread] = None
+		self.version = 0
+		self.reloads = 0
+		self.errors = 0
+
+	def lookup(self, device_id: str) -> Recipients:
+		return self.index.lookup(device_id)
+
+	def load(self) -> None:
+		# Initial load; unlike a reload, a broken file is an error
+		if self.path is not None:
+			self._load(self._stat())
+
+	def _stat(self) -> Optional[tuple]:
+		try:
+			st = os.stat(self.path)
+		except OSError:
+			return None
+		return (st.st_mtime_ns, st.st_size)
+
+	def _load(self, signature: Optional[tuple]) -> None:
+		data = json.loads(Path(self.path).read_text(encoding="utf-8"))
+		index = build_index(data, self.default_numbers, self.default_channels)
+		# One reference assignment: lookups see the old index or this one
+		self.index = index
+		self._signature = signature
+		self.version += 1
+		print(f"[routes] v{self.version}: {len(index)} devices, {index.prefixes} prefixes, {len(index.default.contacts)} default contacts from {self.path}")
+
+	def start(self) -> None:
+		if self.path is None or self._thread is not None:
+			return
+		self._stop.clear()
+		self._thread = threading.Thread(target=self._watch, name="routes-reload", daemon=True)
+		self._thread.start()
+
+	def stop(self) -> None:
+		self._stop.set()
+		if self._thread is not None:
+			self._thread.join(timeout=2.0)
+			self._thread = None
+
+	def _watch(self) -> None:
+		while not self._stop.wait(self.reload_seconds):
+			signature = self._stat()
+			if signature is None or signature == self._signature:
+				continue
+			try:
+				self._load(signature)
+				self.reloads += 1
+			except (OSError, ValueError, KeyError, TypeError, AttributeError) as exc:
+				# Remember the broken version so it is reported once, not every poll
+				self._signature = signature
+				self.errors += 1
+				print(f"[routes] reload of {self.path} failed, keeping v{self.version}: {exc}")
+
+	def stats(self) -> dict:
+		index = self.index
+		return {
+			"version": self.version,
+			"devices": len(index),
+			"prefixes": index.prefixes,
+			"reloads": self.reloads,
+			"errors": self.errors,
+		}
@@ -1,18 +1,34 @@
+import argparse
 import json
+import multiprocessing
 import os
 import sys
+import threading
+import zlib
 from datetime import datetime, timezone
-import csv
-import time
 from pathlib import Path
+import time
+from typing import Optional
 
 import paho.mqtt.client as mqtt
 from dotenv import load_dotenv
 
-try:
-	from twilio.rest import Client as TwilioClient  # type: ignore
-except Exception:  # pragma: no cover - allows running without Twilio installed
-	TwilioClient = None  # type: ignore
+import codec
+from battery import LEVEL_CRITICAL, LEVEL_LOW, LEVEL_NAMES, BatteryAlert, BatteryTracker
+from dedup import DedupCache, sos_key
+from geofence import GeofenceEngine, load_fences
+from livefeed import LiveFeed
+from locfilter import Fix, LocationFilter, maps_url
+from metrics import MetricsExporter, MetricsRegistry
+from pipeline import StatusPipeline, status_row
+from outbox import OutboxEntry, idempotency_key, open_outbox, receipt_id, sos_id
+from provider import API_URL, LazyTwilio, twilio_installed
+from notify import PRIORITY_ALERT, PRIORITY_INFO, PRIORITY_SOS, NotificationCoalescer, NotificationDispatcher
+from ratelimit import TokenBucketLimiter
+from registry import DeviceRegistry
+from routing import Recipients, RoutingTable
+from storage import open_store
+from timers import TimerWheel
 
 
 def iso_now() -> str:
@@ -34,7 +50,75 @@ def load_config() -> dict:
 		"twilio_enable_calls": os.getenv("TWILIO_ENABLE_CALLS", "false").lower() in ("1", "true", "yes", "on"),
 		"twilio_call_message": os.getenv("TWILIO_CALL_MESSAGE", "This is an automated safety alert. Please check on the sender immediately."),
 		"rate_limit_seconds": int(os.getenv("RATE_LIMIT_SECONDS", "120")),
+		"rate_limit_burst": int(os.getenv("RATE_LIMIT_BURST", "1")),
+		"alert_rate_limit_burst": int(os.getenv("ALERT_RATE_LIMIT_BURST", "3")),
+		"rate_limit_max_buckets": int(os.getenv("RATE_LIMIT_MAX_BUCKETS", "100000")),
 		"retry_attempts": int(os.getenv("RETRY_ATTEMPTS", "3")),
+		"notify_workers": int(os.getenv("NOTIFY_WORKERS", "4")),
+		"notify_queue_size": int(os.getenv("NOTIFY_QUEUE_SIZE", "1000")),
+		"notify_coalesce_seconds": float(os.getenv("NOTIFY_COALESCE_SECONDS", "10")),
+		"twilio_timeout": float(os.getenv("TWILIO_TIMEOUT", "10")),
+		"twilio_api_url": os.getenv("TWILIO_API_URL", API_URL),
+		"twilio_warm_connections": int(os.getenv("TWILIO_WARM_CONNECTIONS", "2")),
+		"twilio_keepwarm_seconds": float(os.getenv("TWILIO_KEEPWARM_SECONDS", "60")),
+		"store_backend": os.getenv("STORE_BACKEND", "buffered").lower(),
+		"store_dir": os.getenv("STORE_DIR", "."),
+		"store_flush_rows": int(os.getenv("STORE_FLUSH_ROWS", "500")),
+		"store_flush_seconds": float(os.getenv("STORE_FLUSH_SECONDS", "1.0")),
+		"store_segment_bytes": int(os.getenv("STORE_SEGMENT_BYTES", str(64 * 1024 * 1024))),
+		"store_segment_seconds": float(os.getenv("STORE_SEGMENT_SECONDS", "86400")),
+		"store_compress": os.getenv("STORE_COMPRESS", "true").lower() in ("1", "true", "yes", "on"),
+		"store_compact_after_seconds": float(os.getenv("STORE_COMPACT_AFTER_SECONDS", str(7 * 86400))),
+		"store_compact_resolution_seconds": float(os.getenv("STORE_COMPACT_RESOLUTION_SECONDS", "60")),
+		"store_maintenance_seconds": float(os.getenv("STORE_MAINTENANCE_SECONDS", "60")),
+		"heartbeat_seconds": float(os.getenv("HEARTBEAT_SECONDS", "10")),
+		"offline_grace_multiple": float(os.getenv("OFFLINE_GRACE_MULTIPLE", "3")),
+		"offline_tick_seconds": float(os.getenv("OFFLINE_TICK_SECONDS", "1")),
+		"metrics_host": os.getenv("METRICS_HOST", "127.0.0.1"),
+		"metrics_port": int(os.getenv("METRICS_PORT", "0")),
+		"metrics_file": os.getenv("METRICS_FILE", ""),
+		"metrics_dump_seconds": float(os.getenv("METRICS_DUMP_SECONDS", "15")),
+		"client_id": os.getenv("CLIENT_ID", "wearable-server-sub"),
+		"mqtt_reconnect_min_seconds": float(os.getenv("MQTT_RECONNECT_MIN_SECONDS", "1")),
+		"mqtt_reconnect_max_seconds": float(os.getenv("MQTT_RECONNECT_MAX_SECONDS", "120")),
+		"cluster_mode": os.getenv("CLUSTER_MODE", "off").lower(),
+		"cluster_workers": int(os.getenv("CLUSTER_WORKERS", "1")),
+		"cluster_index": int(os.getenv("CLUSTER_INDEX", "0")),
+		"cluster_group": os.getenv("CLUSTER_GROUP", "wearable-servers"),
+		"sos_dedup_ttl_seconds": float(os.getenv("SOS_DEDUP_TTL_SECONDS", "600")),
+		"sos_dedup_max_entries": int(os.getenv("SOS_DEDUP_MAX_ENTRIES", "100000")),
+		"sos_dedup_digest_window_seconds": float(os.getenv("SOS_DEDUP_DIGEST_WINDOW_SECONDS", "5")),
+		"outbox_enabled": os.getenv("OUTBOX_ENABLED", "true").lower() in ("1", "true", "yes", "on"),
+		"outbox_retry_seconds": float(os.getenv("OUTBOX_RETRY_SECONDS", "30")),
+		"outbox_max_age_seconds": float(os.getenv("OUTBOX_MAX_AGE_SECONDS", "3600")),
+		"outbox_replay_seconds": float(os.getenv("OUTBOX_REPLAY_SECONDS", "5")),
+		"json_backend": os.getenv("JSON_BACKEND", "auto").lower(),
+		"status_pipeline": os.getenv("STATUS_PIPELINE", "off").lower(),
+		"status_batch_size": int(os.getenv("STATUS_BATCH_SIZE", "500")),
+		"status_flush_seconds": float(os.getenv("STATUS_FLUSH_SECONDS", "0.2")),
+		"status_processes": int(os.getenv("STATUS_PROCESSES", "2")),
+		"status_max_pending_batches": int(os.getenv("STATUS_MAX_PENDING_BATCHES", "16")),
+		"status_apply_chunk": int(os.getenv("STATUS_APPLY_CHUNK", "100")),
+		"location_accuracy_m": float(os.getenv("LOCATION_ACCURACY_M", "25")),
+		"location_max_speed_mps": float(os.getenv("LOCATION_MAX_SPEED_MPS", "60")),
+		"location_stale_seconds": float(os.getenv("LOCATION_STALE_SECONDS", "120")),
+		"routes_file": os.getenv("ROUTES_FILE", ""),
+		"routes_reload_seconds": float(os.getenv("ROUTES_RELOAD_SECONDS", "2")),
+		"geofence_file": os.getenv("GEOFENCE_FILE", ""),
+		"geofence_cell_degrees": float(os.getenv("GEOFENCE_CELL_DEGREES", "0.01")),
+		"battery_low_percent": float(os.getenv("BATTERY_LOW_PERCENT", "10")),
+		"battery_critical_percent": float(os.getenv("BATTERY_CRITICAL_PERCENT", "5")),
+		"battery_recover_percent": float(os.getenv("BATTERY_RECOVER_PERCENT", "20")),
+		"battery_warn_hours": float(os.getenv("BATTERY_WARN_HOURS", "2")),
+		"battery_half_life_seconds": float(os.getenv("BATTERY_HALF_LIFE_SECONDS", "3600")),
+		"battery_min_span_seconds": float(os.getenv("BATTERY_MIN_SPAN_SECONDS", "600")),
+		"live_host": os.getenv("LIVE_HOST", "127.0.0.1"),
+		"live_port": int(os.getenv("LIVE_PORT", "0")),
+		"live_tick_seconds": float(os.getenv("LIVE_TICK_SECONDS", "0.5")),
+		"live_max_buffer_bytes": int(os.getenv("LIVE_MAX_BUFFER_BYTES", str(256 * 1024))),
+		"live_stall_seconds": float(os.getenv("LIVE_STALL_SECONDS", "30")),
+		"server_mode": os.getenv("SERVER_MODE", "sync").lower(),
+		"notify_async_concurrency": int(os.getenv("NOTIFY_ASYNC_CONCURRENCY", "100")),
 	}
 
 
@@ -45,11 +129,42 @@ class SosServer:
 		self.topic_sos: str = config["topic_sos"]
 		self.topic_status: str = config["topic_status"]
 		self.topic_tamper: str = config["topic_tamper"]
-		self.emergency_numbers: list[str] = config["emergency_numbers"]
 		self.rate_limit_seconds: int = config["rate_limit_seconds"]
 		self.retry_attempts: int = config["retry_attempts"]
-
-		self.client = mqtt.Client(client_id="wearable-server-sub")
+		self.dispatcher = NotificationDispatcher(
+			workers=config["notify_workers"],
+			queue_size=config["notify_queue_size"],
+		)
+		self.coalescer = NotificationCoalescer(config["notify_coalesce_seconds"], self._deliver, self._outbox_sent)
+
+		# Clustering: "shared" uses $share/<group>/ subscriptions so the broker
+		# hands each message to exactly one worker; "partition" has every worker
+		# subscribe to everything and keep only devices that hash to its index.
+		self.cluster_mode: str = config["cluster_mode"]
+		self.cluster_workers: int = max(1, config["cluster_workers"])
+		self.cluster_index: int = config["cluster_index"]
+		self.cluster_group: str = config["cluster_group"]
+		if self.cluster_mode not in ("off", "shared", "partition"):
+			raise ValueError(f"unknown CLUSTER_MODE '{self.cluster_mode}' (expected off, shared or partition)")
+		if self.cluster_mode == "partition" and not 0 <= self.cluster_index < self.cluster_workers:
+			# Such a worker would own no devices and drop every message
+			raise ValueError(
+				f"CLUSTER_INDEX {self.cluster_index} out of range for CLUSTER_WORKERS {self.cluster_workers} "
+				f"(expected 0..{self.cluster_workers - 1})"
+			)
+		self.client_id: str = config["client_id"]
+		if self.cluster_mode != "off":
+			self.client_id = f"{self.client_id}-{self.cluster_index}"
+		self.client = mqtt.Client(client_id=self.client_id)
+		# Without a persistent session the broker drops what devices publish
+		# before we are back, so the server should not lag the fleet's backoff
+		self.reconnect_delay = (config["mqtt_reconnect_min_seconds"], config["mqtt_reconnect_max_seconds"])
+		self.client.reconnect_delay_set(*self.reconnect_delay)
+		if self.cluster_mode == "shared":
+			print(
+				"[server] Shared subscriptions: per-device state (offline detection, coalescing, rate limits) "
+				"assumes the broker keeps each topic on one worker; use CLUSTER_MODE=partition otherwise"
+			)
 		self.client.on_connect = self._on_connect
 		self.client.on_message = self._on_message
 		self.client.on_disconnect = self._on_disconnect
@@ -61,178 +176,732 @@ class SosServer:
 		self.twilio_from = twilio_from
 		self.twilio_enable_calls: bool = config["twilio_enable_calls"]
 		self.twilio_call_message: str = config["twilio_call_message"]
-		if TwilioClient and twilio_sid and twilio_token and twilio_from:
-			self.twilio = TwilioClient(twilio_sid, twilio_token)
+		# Imported and connected lazily (see provider.py); warmed once MQTT is up
+		self.twilio_warm_connections: int = config["twilio_warm_connections"]
+		self.twilio_keepwarm_seconds: float = config["twilio_keepwarm_seconds"]
+		self._warming = False
+		if twilio_installed() and twilio_sid and twilio_token and twilio_from:
+			self.twilio = LazyTwilio(
+				twilio_sid,
+				twilio_token,
+				pool_size=config["notify_workers"],
+				timeout=config["twilio_timeout"],
+				api_url=config["twilio_api_url"],
+			)
 			print("[server] Twilio enabled")
 		else:
 			print("[server] Twilio not configured; SMS will be printed to console")
 
-		# CSV logs
-		self.sos_log_path = Path("sos_log.csv")
-		self.status_log_path = Path("status_log.csv")
-		self._init_csv(self.sos_log_path, ["ts", "deviceId", "lat", "lon", "reason", "mapsUrl"])
-		self._init_csv(self.status_log_path, ["ts", "deviceId", "state", "batteryPercent", "lat", "lon"])
-
-		# Rate limiting: (deviceId, number) -> last_ts
-		self._rate_map: dict[tuple[str, str], float] = {}
+		# Event log (csv, buffered csv or sqlite; see storage.py)
+		self.store = open_store(config)
+		print(f"[server] Event store: {config['store_backend']} in {config['store_dir']}")
+		# SOS notification intents, synced before the ACK and replayed after a crash
+		self.outbox = open_outbox(config)
+		self._outbox_replay: float = config["outbox_replay_seconds"]
+
+		# Last-known state per device (location, battery, arm state, last seen)
+		self.registry = DeviceRegistry()
+		# Smoothed location per device; registry, geofences and SOS messages
+		# use its estimate, the event logs keep the raw fixes (an SOS row's
+		# mapsUrl is the estimate guardians were sent)
+		self.locations = LocationFilter(
+			accuracy_m=config["location_accuracy_m"],
+			max_speed_mps=config["location_max_speed_mps"],
+			stale_seconds=config["location_stale_seconds"],
+		)
+		# Drain-rate fit and alert level per device; one alert per level until
+		# the ring is charged (see battery.py)
+		self.batteries = BatteryTracker(
+			low_percent=config["battery_low_percent"],
+			critical_percent=config["battery_critical_percent"],
+			recover_percent=config["battery_recover_percent"],
+			warn_hours=config["battery_warn_hours"],
+			half_life_seconds=config["battery_half_life_seconds"],
+			min_span_seconds=config["battery_min_span_seconds"],
+		)
+
+		# Missed-heartbeat detection: every message pushes the device's deadline
+		# out; the wheel only surfaces devices whose deadline actually passed.
+		# Silence while our own MQTT link is down says nothing about the rings,
+		# so nothing expires then, and a reconnect gives every device a full
+		# grace period again before it can be reported offline.
+		self.offline_after: float = config["heartbeat_seconds"] * config["offline_grace_multiple"]
+		self._offline_tick: float = config["offline_tick_seconds"]
+		self._offline_wheel = TimerWheel(self._offline_tick, now=time.monotonic())
+		self._offline_lock = threading.Lock()
+		self._link_up = False
+		self._stopping = threading.Event()
+
+		# Rate limiting per (device, number, channel); SOS is never suppressed
+		self.limiter = TokenBucketLimiter(
+			self.rate_limit_seconds,
+			{PRIORITY_ALERT: config["alert_rate_limit_burst"], PRIORITY_INFO: config["rate_limit_burst"]},
+			max_buckets=config["rate_limit_max_buckets"],
+		)
+
+		# Optional bulk lane for status heartbeats (see pipeline.py); SOS and
+		# tamper always stay inline on the MQTT thread.
+		self.status_pipeline = None
+		mode = config["status_pipeline"]
+		if mode not in ("off", "thread", "process"):
+			raise ValueError(f"unknown STATUS_PIPELINE '{mode}' (expected off, thread or process)")
+		if mode != "off":
+			self.status_pipeline = StatusPipeline(
+				self._apply_status,
+				mode=mode,
+				batch_size=config["status_batch_size"],
+				flush_seconds=config["status_flush_seconds"],
+				workers=config["status_processes"],
+				max_pending=config["status_max_pending_batches"],
+				apply_chunk=config["status_apply_chunk"],
+				on_invalid=lambda n: self._m_decode_failures.inc(n),
+			)
+			print(f"[server] Status pipeline: {mode}, batches of {config['status_batch_size']}")
+
+		# Redelivered SOS copies only get their ACK again (see dedup.py)
+		self.sos_dedup: Optional[DedupCache] = None
+		if config["sos_dedup_ttl_seconds"] > 0:
+			self.sos_dedup = DedupCache(config["sos_dedup_ttl_seconds"], config["sos_dedup_max_entries"])
+		self.sos_dedup_digest_window = config["sos_dedup_digest_window_seconds"]
+
+		# Who to notify per device, hot-reloaded from ROUTES_FILE (see routing.py)
+		self.routes = RoutingTable(
+			Path(config["routes_file"]) if config["routes_file"] else None,
+			config["emergency_numbers"],
+			frozenset(("sms", "call") if self.twilio_enable_calls else ("sms",)),
+			config["routes_reload_seconds"],
+		)
+		self.routes.load()
+
+		# Safe/danger zones checked on every heartbeat with a fix (see geofence.py)
+		self.geofences: Optional[GeofenceEngine] = None
+		if config["geofence_file"]:
+			self.geofences = GeofenceEngine(config["geofence_cell_degrees"])
+			for fence in load_fences(Path(config["geofence_file"])):
+				self.geofences.add(fence)
+			print(f"[server] Geofences: {len(self.geofences)} from {config['geofence_file']}")
+
+		# Dashboard feed of registry deltas and alerts over SSE (see livefeed.py)
+		self.live: Optional[LiveFeed] = None
+		if config["live_port"]:
+			self.live = LiveFeed(
+				self.registry,
+				host=config["live_host"],
+				port=config["live_port"],
+				tick_seconds=config["live_tick_seconds"],
+				max_buffer=config["live_max_buffer_bytes"],
+				stall_seconds=config["live_stall_seconds"],
+			)
+
+		print(f"[server] JSON backend: {codec.use_json_backend(config['json_backend'])}")
+
+		self._init_metrics(config)
+		self._handlers = {"sos": self._handle_sos, "status": self._handle_status, "tamper": self._handle_tamper}
+
+	def _init_metrics(self, config: dict) -> None:
+		# Children are bound once here so the per-message cost is a dict lookup
+		# plus an add/bisect. Metrics updated from more than one thread are
+		# shared=True (see metrics.py); the rest have a single writer per child.
+		m = self.metrics = MetricsRegistry()
+		messages = m.counter("wearable_messages_total", "MQTT messages received by topic type", ("type",))
+		self._m_messages = {k: messages.labels(k) for k in ("sos", "status", "tamper", "other")}
+		self._m_foreign = m.counter("wearable_partition_skipped_total", "Messages skipped because another worker owns the device").labels()
+		self._m_sos_duplicates = m.counter("wearable_sos_duplicates_total", "Redelivered SOS answered with a re-ACK only").labels()
+		retained = m.counter("wearable_retained_events_total", "Retained SOS/tamper replayed by the broker and not acted on", ("kind",))
+		self._m_retained = {kind: retained.labels(kind) for kind in ("sos", "tamper")}
+		if self.sos_dedup is not None:
+			dedup = self.sos_dedup
+			m.gauge("wearable_sos_dedup_entries", "SOS remembered for deduplication", lambda: len(dedup))
+		self._m_decode_failures = m.counter("wearable_decode_failures_total", "Payloads that failed to decode", shared=True).labels()
+		handler = m.histogram("wearable_handler_seconds", "Handler latency by topic type", ("handler",))
+		self._m_handler = {k: handler.labels(k) for k in ("sos", "status", "tamper")}
+		store = m.histogram("wearable_store_append_seconds", "Event store append latency", ("kind",))
+		self._m_store = {k: store.labels(k) for k in ("sos", "status", "tamper")}
+		self._m_provider = m.histogram("wearable_provider_request_seconds", "Twilio request latency per attempt", ("channel",), shared=True)
+		self._m_retries = m.counter("wearable_provider_retries_total", "Twilio request retries", ("channel",), shared=True)
+		self._m_failures = m.counter("wearable_provider_failures_total", "Notifications that failed after all retries", ("channel",), shared=True)
+		self._m_rate_limited = m.counter("wearable_rate_limited_total", "Notifications suppressed by the rate limiter", ("channel",), shared=True)
+		self._m_outbox_record = m.histogram("wearable_outbox_record_seconds", "Outbox write latency on the SOS path").labels()
+		self._m_outbox_replayed = m.counter("wearable_outbox_replayed_total", "Notifications resent from the outbox").labels()
+		self._m_connects = m.counter("wearable_mqtt_connects_total", "MQTT (re)connections").labels()
+		self._m_disconnects = m.counter("wearable_mqtt_disconnects_total", "MQTT disconnections").labels()
+		m.gauge("wearable_notify_queue_depth", "Notifications waiting for a worker", lambda: self.dispatcher.queue_depth)
+		m.gauge("wearable_notify_in_flight", "Notifications currently being sent", lambda: self.dispatcher.in_flight)
+		m.gauge("wearable_devices", "Devices in the in-memory registry", lambda: len(self.registry))
+		m.gauge("wearable_rate_limit_buckets", "Live rate-limit buckets", lambda: len(self.limiter))
+		if self.outbox is not None:
+			outbox = self.outbox
+			m.gauge("wearable_outbox_pending", "SOS notifications not yet confirmed sent", outbox.pending)
+		if self.status_pipeline is not None:
+			pipeline = self.status_pipeline
+			m.gauge("wearable_status_pending_batches", "Status batches being decoded or applied", lambda: pipeline.pending)
+			m.gauge("wearable_status_shed", "Status heartbeats dropped because the pipeline was full", lambda: pipeline.shed)
+		if self.geofences is not None:
+			geofences = self.geofences
+			m.gauge("wearable_geofences", "Geofences loaded", lambda: len(geofences))
+		transitions = m.counter("wearable_geofence_transitions_total", "Geofence enter/exit transitions", ("direction",))
+		self._m_geofence = {True: transitions.labels("enter"), False: transitions.labels("exit")}
+		battery_alerts = m.counter("wearable_battery_alerts_total", "Battery alerts sent by level", ("level",))
+		self._m_battery_alerts = {level: battery_alerts.labels(LEVEL_NAMES[level]) for level in (LEVEL_LOW, LEVEL_CRITICAL)}
+		if self.live is not None:
+			live = self.live
+			m.gauge("wearable_live_subscribers", "Connected dashboard feed subscribers", lambda: len(live))
+		routes = self.routes
+		m.gauge("wearable_routes_version", "Routing table reloads applied (0 = EMERGENCY_NUMBERS only)", lambda: routes.version)
+		m.gauge("wearable_routes_devices", "Devices with their own routes", lambda: len(routes.index))
+		m.gauge("wearable_routes_reload_errors", "Routing file reloads rejected", lambda: routes.errors)
+		m.gauge("wearable_battery_tracked", "Devices with a battery drain fit", lambda: len(self.batteries))
+		self._m_location_rejected = m.counter("wearable_location_rejected_total", "GPS fixes rejected as impossible jumps", shared=True).labels()
+		self.metrics_exporter = MetricsExporter(
+			m,
+			host=config["metrics_host"],
+			port=config["metrics_port"],
+			path=config["metrics_file"],
+			interval=config["metrics_dump_seconds"],
+		)
 
 	def _on_connect(self, client, userdata, flags, rc):
-		print(f"[server] MQTT connected (rc={rc})")
-		client.subscribe(self.topic_sos, qos=1)
-		client.subscribe(self.topic_status, qos=0)
-		client.subscribe(self.topic_tamper, qos=1)
-		print(f"[server] Subscribed: SOS='{self.topic_sos}', STATUS='{self.topic_status}', TAMPER='{self.topic_tamper}'")
+		self._m_connects.inc()
+		print(f"[server] MQTT connected (rc={rc}) as {self.client_id}")
+		with self._offline_lock:
+			self._offline_wheel.postpone_all(time.monotonic() + self.offline_after)
+			self._link_up = True
+		client.subscribe(self._subscription(self.topic_sos), qos=1)
+		client.subscribe(self._subscription(self.topic_status), qos=0)
+		client.subscribe(self._subscription(self.topic_tamper), qos=1)
+		self._start_warmup()
+		print(
+			f"[server] Subscribed: SOS='{self._subscription(self.topic_sos)}', "
+			f"STATUS='{self._subscription(self.topic_status)}', TAMPER='{self._subscription(self.topic_tamper)}'"
+		)
+
+	def _start_warmup(self) -> None:
+		# After the first connect, so importing twilio and the TLS handshakes
+		# never delay subscribing; later reconnects keep the same thread
+		if self._warming or not isinstance(self.twilio, LazyTwilio) or self.twilio_warm_connections <= 0:
+			return
+		self._warming = True
+		threading.Thread(
+			target=self.twilio.keep_warm,
+			args=(self.twilio_warm_connections, self.twilio_keepwarm_seconds, self._stopping),
+			name="twilio-warm",
+			daemon=True,
+		).start()
+
+	def _subscription(self, topic: str) -> str:
+		if self.cluster_mode == "shared":
+			return f"$share/{self.cluster_group}/{topic}"
+		return topic
+
+	def _owns(self, topic: str) -> bool:
+		# Device id is the second topic level: wearable/{deviceId}/...
+		parts = topic.split("/", 2)
+		device_id = parts[1] if len(parts) > 1 else topic
+		return zlib.crc32(device_id.encode("utf-8")) % self.cluster_workers == self.cluster_index
 
 	def _on_disconnect(self, client, userdata, rc):
+		with self._offline_lock:
+			self._link_up = False
+		self._m_disconnects.inc()
 		print(f"[server] MQTT disconnected (rc={rc})")
 
-	def _init_csv(self, path: Path, headers: list[str]) -> None:
-		if not path.exists():
-			with path.open("w", newline="", encoding="utf-8") as f:
-				writer = csv.writer(f)
-				writer.writerow(headers)
-
-	def _send_sms(self, body: str) -> None:
-		if not self.emergency_numbers:
-			print("[server] No EMERGENCY_NUMBERS configured; skipping SMS")
+	def _send_sms(
+		self,
+		body: str,
+		priority: int = PRIORITY_INFO,
+		device_id: str = "",
+		keys: Optional[dict] = None,
+		recipients: Optional[Recipients] = None,
+	) -> None:
+		# keys: outbox keys by (channel, number); numbers missing from it were
+		# already notified for this SOS (broker redelivery) and are skipped
+		if recipients is None:
+			recipients = self.routes.lookup(device_id)
+		if not recipients.sms:
+			print(f"[server] No SMS contacts routed for {device_id or 'this alert'}; skipping SMS")
 			print(f"[server] (SMS MOCK) {body}")
 			return
+		for number in recipients.sms:
+			if keys is None:
+				self.coalescer.submit(device_id, "sms", number, body, priority)
+			elif ("sms", number) in keys:
+				self.coalescer.submit(device_id, "sms", number, body, priority, keys=(keys[("sms", number)],))
+
+	def _deliver(self, device_id: str, channel: str, number: str, body: str, priority: int, keys: tuple[str, ...] = ()) -> None:
+		# Called by the coalescer, either inline or when a merge window closes,
+		# and by the outbox replayer
 		if not self.twilio:
-			for number in self.emergency_numbers:
-				print(f"[server] (SMS MOCK) to {number}: {body}")
+			text = self.twilio_call_message if channel == "call" else body
+			print(f"[server] ({channel.upper()} MOCK) to {number}: {text}")
+			self._outbox_sent(keys)
+			return
+		if not self.limiter.allow(device_id, channel, number, priority):
+			self._m_rate_limited.labels(channel).inc()
+			print(f"[server] Rate limit: skipping {channel} to {number} for {device_id}")
 			return
-		for number in self.emergency_numbers:
-			if not self._check_rate_limit("sms", number):
-				continue
-			self._with_retries(lambda: self._twilio_send_sms(number, body), f"SMS to {number}")
+		self._dispatch(channel, number, body, priority, keys)
+
+	def _dispatch(self, channel: str, number: str, body: str, priority: int, keys: tuple[str, ...] = ()) -> None:
+		# Only enqueue here; this is called from the MQTT network thread
+		label = f"{channel.upper()} to {number}"
+		send = self._twilio_make_call if channel == "call" else self._twilio_send_sms
+
+		def job() -> bool:
+			ok = self._with_retries(lambda: send(number, body), label, channel)
+			if keys and self.outbox is not None:
+				if ok:
+					self.outbox.mark_sent(keys)
+				else:
+					self.outbox.mark_failed(keys)
+			return ok
+
+		self.dispatcher.submit(channel, job, label, priority)
+
+	def _outbox_sent(self, keys: tuple[str, ...]) -> None:
+		if keys and self.outbox is not None:
+			self.outbox.mark_sent(keys)
+
+	def _record_sos_intents(self, device_id: str, sos: str, message: str, recipients: Recipients) -> Optional[dict]:
+		# One synced outbox transaction per SOS covering every guardian and
+		# channel, keyed on sos_id() so redelivered copies map to the same rows
+		if self.outbox is None or not recipients:
+			return None
+		entries = [
+			OutboxEntry(
+				idempotency_key(device_id, sos, channel, number),
+				device_id,
+				channel,
+				number,
+				self._call_twiml() if channel == "call" else message,
+			)
+			for channel, number in recipients.pairs()
+		]
+		start = time.perf_counter()
+		fresh = self.outbox.record(entries)
+		self._m_outbox_record.observe(time.perf_counter() - start)
+		if len(fresh) < len(entries):
+			print(f"[server] SOS {device_id} ({sos}) already in outbox; not notifying again")
+		return {(entry.channel, entry.recipient): entry.key for entry in fresh}
+
+	def _outbox_loop(self) -> None:
+		recovered = self.outbox.recover()
+		if recovered:
+			print(f"[server] Outbox: resuming {recovered} unsent SOS notification(s)")
+		while True:
+			# Sent and expired rows go once they are as old as a row that is
+			# given up on; until then they still stop a redelivered SOS
+			self.outbox.prune(self.outbox.max_age_seconds)
+			due = self.outbox.claim_due(limit=100)
+			for entry in due:
+				self._m_outbox_replayed.inc()
+				print(f"[server] Outbox replay: {entry.channel} to {entry.recipient} for {entry.device_id} (attempt {entry.attempts + 1})")
+				self._deliver(entry.device_id, entry.channel, entry.recipient, entry.body, PRIORITY_SOS, (entry.key,))
+			# A full batch means a backlog (e.g. after a crash): keep going
+			if len(due) < 100 and self._stopping.wait(self._outbox_replay):
+				return
 
 	def _twilio_send_sms(self, number: str, body: str) -> None:
 		msg = self.twilio.messages.create(body=body, from_=self.twilio_from, to=number)  # type: ignore
 		print(f"[server] SMS sent to {number} sid={msg.sid}")
 
 	def _on_message(self, client, userdata, msg):
-		try:
-			data = json.loads(msg.payload.decode("utf-8"))
-		except Exception as exc:
-			print(f"[server] bad payload on {msg.topic}: {exc}")
-			return
-
 		topic = msg.topic
+		if self.cluster_mode == "partition" and not self._owns(topic):
+			self._m_foreign.inc()
+			return
 		if "/sos" in topic:
-			self._handle_sos(data)
+			kind = "sos"
 		elif "/status" in topic:
-			self._handle_status(data)
+			kind = "status"
 		elif "/tamper" in topic:
-			self._handle_tamper(data)
+			kind = "tamper"
+		else:
+			kind = "other"
+		self._m_messages[kind].inc()
+		if kind == "status" and self.status_pipeline is not None:
+			self.status_pipeline.submit(msg.payload)
+			return
+		try:
+			data = codec.decode(kind, msg.payload)
+		except codec.CodecError as exc:
+			self._m_decode_failures.inc()
+			print(f"[server] bad payload on {topic}: {exc}")
+			return
 
-	def _handle_sos(self, data: dict) -> None:
+		if msg.retain and kind in ("sos", "tamper"):
+			self._handle_retained(kind, data)
+			return
+
+		handler = self._handlers.get(kind)
+		if handler is not None:
+			start = time.perf_counter()
+			if kind == "sos" and self.status_pipeline is not None:
+				# The status applier waits until this SOS is handled
+				with self.status_pipeline.urgent():
+					handler(data, msg)
+			elif kind == "sos":
+				handler(data, msg)
+			else:
+				handler(data)
+			self._m_handler[kind].observe(time.perf_counter() - start)
+
+	def _store_append(self, kind: str, row: list, durable: bool = False) -> None:
+		start = time.perf_counter()
+		self.store.append(kind, row, durable=durable)
+		self._m_store[kind].observe(time.perf_counter() - start)
+
+	def _handle_retained(self, kind: str, data: dict) -> None:
+		# A retained SOS or tamper is the broker replaying the device's last
+		# event to a new subscription (ours, on every reconnect), not a new
+		# one: an SOS is answered so the device stops waiting, but nobody is
+		# notified again
+		device_id = data.get("deviceId", "unknown")
+		self._m_retained[kind].inc()
+		print(f"[server] Retained {kind.upper()} from {device_id} ignored (replayed by the broker on subscribe)")
+		if kind == "sos":
+			ack = {"ok": True, "ts": iso_now()}
+			if data.get("msgId") is not None:
+				ack["msgId"] = data["msgId"]
+			self.client.publish(f"wearable/{device_id}/ack", json.dumps(ack), qos=0, retain=False)
+
+	def _handle_sos(self, data: dict, msg: Optional[mqtt.MQTTMessage] = None) -> None:
 		device_id = data.get("deviceId", "unknown")
-		lat = data.get("lat")
-		lon = data.get("lon")
-		maps_url = data.get("mapsUrl") or (f"https://maps.google.com/?q={lat},{lon}" if lat and lon else "")
+		ack = {"ok": True, "ts": iso_now()}
+		if data.get("msgId") is not None:
+			ack["msgId"] = data["msgId"]
+		ack_payload = json.dumps(ack)
+		if self.sos_dedup is None:
+			self._process_sos(device_id, data, ack_payload, msg)
+			return
+		key = sos_key(data)
+		# Without ids of its own, an identical copy may be a second press
+		window = self.sos_dedup_digest_window if data.get("msgId") is None and data.get("ts") is None else None
+		previous = self.sos_dedup.check(key, ack_payload, redelivery=msg is not None and msg.dup, window=window)
+		if previous is not None:
+			# A redelivered copy: answer it again and do nothing else. QoS 0,
+			# since a device that misses this one will resend and be answered again
+			self._m_sos_duplicates.inc()
+			self.client.publish(f"wearable/{device_id}/ack", previous, qos=0, retain=False)
+			return
+		try:
+			self._process_sos(device_id, data, ack_payload, msg)
+		except Exception:
+			self.sos_dedup.forget(key)
+			raise
+
+	def _sos_id(self, device_id: str, data: dict, msg: Optional[mqtt.MQTTMessage]) -> str:
+		# See outbox.py: only a copy the broker flags as a redelivery can map
+		# onto an SOS without ids of its own that was already recorded
+		mid = msg.mid if msg is not None else 0
+		if msg is not None and msg.dup and self.outbox is not None:
+			earlier = self.outbox.redelivered(device_id, data, mid)
+			if earlier is not None:
+				return earlier
+		return sos_id(data, receipt_id(mid))
+
+	def _process_sos(self, device_id: str, data: dict, ack_payload: str, msg: Optional[mqtt.MQTTMessage] = None) -> None:
+		raw_lat = data.get("lat")
+		raw_lon = data.get("lon")
+		# For the message text and the log row only; the outbox keys on _sos_id()
 		timestamp = data.get("ts", iso_now())
 		reason = data.get("reason", "unknown")
-		print(f"[server] SOS from {device_id} at {timestamp} (reason={reason}) → {lat},{lon}")
-		# ACK back to device
-		ack_topic = f"wearable/{device_id}/ack"
-		self.client.publish(ack_topic, json.dumps({"ok": True, "ts": iso_now()}), qos=1, retain=False)
-		# Log CSV
-		with self.sos_log_path.open("a", newline="", encoding="utf-8") as f:
-			writer = csv.writer(f)
-			writer.writerow([timestamp, device_id, lat, lon, reason, maps_url])
+		# An SOS fix goes through the same filter as heartbeats; without one,
+		# fall back to the smoothed estimate from the last heartbeats
+		fix = None
+		if raw_lat is not None and raw_lon is not None:
+			fix = self.locations.update(device_id, float(raw_lat), float(raw_lon))
+			if fix.rejected:
+				self._m_location_rejected.inc()
+		else:
+			fix = self.locations.estimate(device_id)
+		lat = lon = None
+		location = "unknown"
+		if fix is not None:
+			lat, lon = round(fix.lat, 6), round(fix.lon, 6)
+			location = f"{lat:.6f},{lon:.6f} (±{fix.radius_m:.0f} m)"
+			if raw_lat is None or raw_lon is None or fix.rejected:
+				location += f" (last known, {fix.age_seconds:.0f}s ago{', stale' if fix.stale else ''})"
+			if fix.rejected:
+				location += f"; device reported {raw_lat},{raw_lon} (implausible jump)"
+		url = maps_url(lat, lon, fix.radius_m) if fix is not None else data.get("mapsUrl", "")
+		print(f"[server] SOS from {device_id} at {timestamp} (reason={reason}) → {location}")
+		message = f"SOS from {device_id} at {timestamp}. Location: {location} {url}".rstrip()
+		# One routing snapshot for the whole SOS, even if the table reloads meanwhile
+		recipients = self.routes.lookup(device_id)
+		# Record who must be notified before telling the device help is coming
+		keys = self._record_sos_intents(device_id, self._sos_id(device_id, data, msg), message, recipients)
+		# ACK back to device; everything else can wait until it is on its way
+		self.client.publish(f"wearable/{device_id}/ack", ack_payload, qos=1, retain=False)
+		self.registry.record_sos(device_id, timestamp, data.get("batteryPercent"), lat, lon)
+		self._mark_seen(device_id)
+		if self.live is not None:
+			self.live.event("sos", device_id, ts=timestamp, reason=reason, lat=lat, lon=lon, radius_m=fix.radius_m if fix else None)
+			self.live.event("ack", device_id, ts=timestamp)
+		# Log (SOS rows are fsynced before we notify)
+		self._store_append("sos", [timestamp, device_id, raw_lat, raw_lon, reason, url], durable=True)
 		# Notify
-		message = f"SOS from {device_id} at {timestamp}. Location: {lat},{lon} {maps_url}"
-		self._send_sms(message)
-		if self.twilio_enable_calls:
-			self._send_calls(message)
+		self._send_sms(message, priority=PRIORITY_SOS, device_id=device_id, keys=keys, recipients=recipients)
+		self._send_calls(message, device_id=device_id, keys=keys, recipients=recipients)
 
 	def _handle_status(self, data: dict) -> None:
-		device_id = data.get("deviceId", "unknown")
-		ts = data.get("ts", iso_now())
-		state = data.get("state", "unknown")
-		batt = data.get("batteryPercent")
-		lat = data.get("lat")
-		lon = data.get("lon")
-		with self.status_log_path.open("a", newline="", encoding="utf-8") as f:
-			writer = csv.writer(f)
-			writer.writerow([ts, device_id, state, batt, lat, lon])
-		# Low battery alert
-		try:
-			if batt is not None and int(batt) <= 10:
-				self._send_sms(f"Low battery alert for {device_id} ({batt}%). Consider charging.")
-		except Exception:
-			pass
+		self._apply_status(status_row(data))
+
+	def _apply_status(self, row: tuple) -> None:
+		# Shared by the inline handler and the status pipeline's applier thread
+		ts, device_id, state, batt, lat, lon, percent = row
+		self._store_append("status", [ts, device_id, "unknown" if state is None else state, batt, lat, lon])
+		fix = None
+		if lat is not None and lon is not None:
+			fix = self.locations.update(device_id, float(lat), float(lon))
+			if fix.rejected:
+				self._m_location_rejected.inc()
+				fix = None
+		self.registry.update_status(device_id, ts, state, batt, fix.lat if fix else None, fix.lon if fix else None)
+		self._mark_seen(device_id)
+		if percent is not None:
+			alert = self.batteries.update(device_id, percent)
+			if alert is not None:
+				self._battery_alert(alert)
+		if self.geofences is not None and fix is not None:
+			self._check_geofences(device_id, ts, fix)
+
+	def _battery_alert(self, alert: BatteryAlert) -> None:
+		self._m_battery_alerts[alert.level].inc()
+		print(f"[server] BATTERY {alert.name} for {alert.device_id}: {alert.estimate.describe()}")
+		if self.live is not None:
+			self.live.event("battery", alert.device_id, level=alert.name, **alert.estimate.as_dict())
+		priority = PRIORITY_ALERT if alert.level == LEVEL_CRITICAL else PRIORITY_INFO
+		self._send_sms(alert.describe(), priority=priority, device_id=alert.device_id)
+
+	def _check_geofences(self, device_id: str, ts: str, fix: Fix) -> None:
+		for event in self.geofences.check(device_id, fix.lat, fix.lon):
+			self._m_geofence[event.entered].inc()
+			if self.live is not None:
+				self.live.event("geofence", device_id, fence=event.fence.fence_id, kind=event.fence.kind, entered=event.entered)
+			print(f"[server] GEOFENCE {event.describe()} at {ts}")
+			self._send_sms(
+				f"Geofence: {event.describe()} at {ts}. Location: {fix.lat:.6f},{fix.lon:.6f} (±{fix.radius_m:.0f} m) "
+				f"{maps_url(fix.lat, fix.lon, fix.radius_m)}",
+				priority=PRIORITY_ALERT if event.alarming else PRIORITY_INFO,
+				device_id=device_id,
+			)
 
 	def _handle_tamper(self, data: dict) -> None:
 		device_id = data.get("deviceId", "unknown")
 		ts = data.get("ts", iso_now())
 		reason = data.get("reason", "unknown")
+		self._store_append("tamper", [ts, device_id, reason])
+		self.registry.record_tamper(device_id, ts)
+		self._mark_seen(device_id)
 		print(f"[server] TAMPER from {device_id} at {ts} (reason={reason})")
-		self._send_sms(f"Tamper detected on {device_id} at {ts} (reason={reason}).")
+		if self.live is not None:
+			self.live.event("tamper", device_id, ts=ts, reason=reason)
+		self._send_sms(f"Tamper detected on {device_id} at {ts} (reason={reason}).", priority=PRIORITY_ALERT, device_id=device_id)
+
+	def _mark_seen(self, device_id: str) -> None:
+		record = self.registry.get(device_id)
+		if record is not None and record.offline:
+			record.offline = False
+			print(f"[server] {device_id} back online")
+			if self.live is not None:
+				self.live.event("online", device_id)
+		with self._offline_lock:
+			self._offline_wheel.schedule(device_id, time.monotonic() + self.offline_after)
+		if self.live is not None:
+			self.live.touch(device_id)
+
+	def _offline_loop(self) -> None:
+		while not self._stopping.wait(self._offline_tick):
+			with self._offline_lock:
+				if not self._link_up:
+					continue
+				expired = self._offline_wheel.advance(time.monotonic())
+			for device_id in expired:
+				self._handle_offline(device_id)
+
+	def _handle_offline(self, device_id: str) -> None:
+		record = self.registry.get(device_id)
+		if record is None or record.offline:
+			return
+		record.offline = True
+		last_seen = datetime.fromtimestamp(record.last_seen, timezone.utc).isoformat()
+		location = f" Last location: {record.lat},{record.lon}." if record.lat is not None else ""
+		battery = f" Battery was {record.battery}%." if record.battery is not None else ""
+		print(f"[server] OFFLINE {device_id} (no message for {int(self.offline_after)}s, last seen {last_seen})")
+		if self.live is not None:
+			self.live.touch(device_id)
+			self.live.event("offline", device_id, last_seen=last_seen)
+		self._send_sms(
+			f"Device {device_id} is offline: no heartbeat for {int(self.offline_after)}s since {last_seen}.{battery}{location}",
+			priority=PRIORITY_ALERT,
+			device_id=device_id,
+		)
 
 	def run(self) -> None:
+		self._start_services()
 		self.client.connect(self.broker_host, self.broker_port, keepalive=60)
 		self.client.loop_forever()
 
-	def _with_retries(self, func, label: str):
+	def _start_services(self) -> None:
+		# Everything but the MQTT client; shared with the asyncio mode
+		self.metrics_exporter.start()
+		self.routes.start()
+		if self.live is not None:
+			self.live.start()
+		self.dispatcher.start()
+		self.coalescer.start()
+		if self.status_pipeline is not None:
+			self.status_pipeline.start()
+		if self.outbox is not None:
+			threading.Thread(target=self._outbox_loop, name="outbox-replay", daemon=True).start()
+		if self.offline_after > 0:
+			threading.Thread(target=self._offline_loop, name="offline-monitor", daemon=True).start()
+
+	def stop(self) -> None:
+		self._stopping.set()
+		self.client.disconnect()
+		if self.status_pipeline is not None:
+			self.status_pipeline.stop()
+			print(f"[server] status pipeline: {self.status_pipeline.stats()}")
+		self.coalescer.stop()
+		self.dispatcher.stop()
+		self._close_storage()
+		self.metrics_exporter.stop()
+		self.routes.stop()
+		if self.live is not None:
+			print(f"[server] live feed: {self.live.stats()}")
+			self.live.stop()
+		if self.sos_dedup is not None:
+			print(f"[server] SOS dedup: {self.sos_dedup.stats()}")
+		print(f"[server] notify stats: {self.dispatcher.stats()} coalescer: {self.coalescer.stats()} limiter: {self.limiter.stats()}")
+
+	def _close_storage(self) -> None:
+		self.store.close()
+		if self.outbox is not None:
+			print(f"[server] outbox: {self.outbox.stats()}")
+			self.outbox.close()
+
+	def _with_retries(self, func, label: str, channel: str = "sms") -> bool:
+		# Runs on a dispatcher worker, so the backoff sleep never blocks MQTT I/O
+		latency = self._m_provider.labels(channel)
 		delay = 1.0
 		for attempt in range(1, self.retry_attempts + 1):
+			if attempt > 1:
+				self._m_retries.labels(channel).inc()
+			start = time.perf_counter()
 			try:
 				func()
-				return
+				latency.observe(time.perf_counter() - start)
+				return True
 			except Exception as exc:
+				latency.observe(time.perf_counter() - start)
 				print(f"[server] {label} failed (attempt {attempt}): {exc}")
 				if attempt < self.retry_attempts:
 					time.sleep(delay)
 					delay *= 2
+		self._m_failures.labels(channel).inc()
+		return False
 
-	def _check_rate_limit(self, channel: str, number: str) -> bool:
-		# Simple rate limit per number irrespective of device, to avoid spamming
-		key = (channel, number)
-		now = time.time()
-		last = self._rate_map.get(key, 0.0)
-		if now - last < self.rate_limit_seconds:
-			remain = int(self.rate_limit_seconds - (now - last))
-			print(f"[server] Rate limit: skipping {channel} to {number} (wait {remain}s)")
-			return False
-		self._rate_map[key] = now
-		return True
-
-	def _send_calls(self, sms_message: str) -> None:
-		if not self.emergency_numbers:
-			return
-		if not self.twilio:
-			for number in self.emergency_numbers:
-				print(f"[server] (CALL MOCK) to {number}: {self.twilio_call_message}")
-			return
+	def _call_twiml(self) -> str:
 		# Use inline TwiML for TTS
-		twiml = f"<Response><Say voice=\"alice\">{self.twilio_call_message}</Say></Response>"
-		for number in self.emergency_numbers:
-			if not self._check_rate_limit("call", number):
-				continue
-			self._with_retries(lambda: self._twilio_make_call(number, twiml), f"CALL to {number}")
+		return f"<Response><Say voice=\"alice\">{self.twilio_call_message}</Say></Response>"
+
+	def _send_calls(self, sms_message: str, device_id: str = "", keys: Optional[dict] = None, recipients: Optional[Recipients] = None) -> None:
+		if recipients is None:
+			recipients = self.routes.lookup(device_id)
+		if not recipients.call:
+			return
+		twiml = self._call_twiml()
+		for number in recipients.call:
+			# Every SOS rings (see NotificationCoalescer); nothing is ever merged into a call
+			if keys is None:
+				self.coalescer.submit(device_id, "call", number, twiml, PRIORITY_SOS, trailing=False)
+			elif ("call", number) in keys:
+				self.coalescer.submit(device_id, "call", number, twiml, PRIORITY_SOS, trailing=False, keys=(keys[("call", number)],))
 
 	def _twilio_make_call(self, number: str, twiml: str) -> None:
 		call = self.twilio.calls.create(to=number, from_=self.twilio_from, twiml=twiml)  # type: ignore
 		print(f"[server] Call initiated to {number} sid={call.sid}")
 
 
-def main() -> None:
-	config = load_config()
+def parse_args() -> argparse.Namespace:
+	parser = argparse.ArgumentParser(description="Wearable SOS server (MQTT)")
+	parser.add_argument("--workers", type=int, default=0, help="Run N clustered worker processes on this host")
+	parser.add_argument("--cluster-mode", choices=["shared", "partition"], help="Clustering strategy (default: CLUSTER_MODE, or shared with --workers)")
+	parser.add_argument("--server-mode", choices=["sync", "asyncio"], help="MQTT/notification core (default: SERVER_MODE, or sync)")
+	return parser.parse_args()
+
+
+def run_server(config: dict) -> None:
 	print(
 		f"[server] Starting with broker={config['broker_host']}:{config['broker_port']} "
 		f"SOS='{config['topic_sos']}' STATUS='{config['topic_status']}' TAMPER='{config['topic_tamper']}' "
-		f"numbers={config['emergency_numbers']}, calls={config['twilio_enable_calls']}"
+		f"numbers={config['emergency_numbers']}, routes={config['routes_file'] or '-'}, calls={config['twilio_enable_calls']}, "
+		f"cluster={config['cluster_mode']} ({config['cluster_index']}/{config['cluster_workers']}), mode={config['server_mode']}"
 	)
-	server = SosServer(config)
+	if config["server_mode"] == "asyncio":
+		from aioserver import AsyncSosServer
+
+		server: SosServer = AsyncSosServer(config)
+	elif config["server_mode"] == "sync":
+		server = SosServer(config)
+	else:
+		raise ValueError(f"unknown SERVER_MODE '{config['server_mode']}' (expected sync or asyncio)")
 	try:
 		server.run()
 	except KeyboardInterrupt:
 		print("\n[server] Stopped by user")
+		server.stop()
 		sys.exit(0)
 
 
-if __name__ == "__main__":
-	main()
+def worker_config(config: dict, index: int) -> dict:
+	# Each worker gets its own client id, log directory and metrics port
+	config = dict(config, cluster_index=index)
+	config["store_dir"] = os.path.join(config["store_dir"], f"worker-{index}")
+	if config["metrics_port"]:
+		config["metrics_port"] += index
+	if config["metrics_file"]:
+		config["metrics_file"] = f"{config['metrics_file']}.{index}"
+	return config
 
 
+def run_cluster(config: dict) -> None:
+	procs = []
+	for index in range(config["cluster_workers"]):
+		proc = multiprocessing.Process(target=run_server, args=(worker_config(config, index),), name=f"sos-worker-{index}")
+		proc.start()
+		procs.append(proc)
+	try:
+		for proc in procs:
+			proc.join()
+	except KeyboardInterrupt:
+		# Workers share our process group and get the same Ctrl+C
+		for proc in procs:
+			proc.join(timeout=10)
+		print("\n[server] Cluster stopped")
+
+
+def main() -> None:
+	if sys.argv[1:2] == ["query"]:
+		import query
+
+		query.main(sys.argv[2:])
+		return
+	args = parse_args()
+	config = load_config()
+	if args.cluster_mode:
+		config["cluster_mode"] = args.cluster_mode
+	if args.server_mode:
+		config["server_mode"] = args.server_mode
+	if args.workers > 1:
+		config["cluster_workers"] = args.workers
+		if config["cluster_mode"] == "off":
+			config["cluster_mode"] = "shared"
+		run_cluster(config)
+		return
+	run_server(config)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,483 @@
+import csv
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator, Optional
+
+
+SCHEMAS: dict[str, list[str]] = {
+	"sos": ["ts", "deviceId", "lat", "lon", "reason", "mapsUrl"],
+	"status": ["ts", "deviceId", "state", "batteryPercent", "lat", "lon"],
+	"tamper": ["ts", "deviceId", "reason"],
+}
+
+CSV_FILES = {"sos": "sos_log.csv", "status": "status_log.csv", "tamper": "tamper_log.csv"}
+
+# Kinds that compaction may thin out; every SOS and tamper row is kept
+COMPACTABLE = ("status",)
+
+
+class EventStore(ABC):
+	@abstractmethod
+	def append(self, kind: str, row: list, durable: bool = False) -> None: ...
+
+	def flush(self) -> None:
+		pass
+
+	def close(self) -> None:
+		self.flush()
+
+
+class CsvStore(EventStore):
+	# Original behaviour: one open/write/close per row. Kept for compatibility
+	# and as the baseline in benchmarks/storage_bench.py.
+	def __init__(self, directory: Path):
+		self.paths = {kind: directory / name for kind, name in CSV_FILES.items()}
+		for kind, path in self.paths.items():
+			_init_csv(path, SCHEMAS[kind])
+
+	def append(self, kind: str, row: list, durable: bool = False) -> None:
+		with self.paths[kind].open("a", newline="", encoding="utf-8") as f:
+			writer = csv.writer(f)
+			writer.writerow(row)
+			if durable:
+				f.flush()
+				os.fsync(f.fileno())
+
+
+class _GroupCommitStore(EventStore):
+	# Rows are buffered per kind and written in one batch when flush_rows are
+	# pending or flush_seconds have passed. A durable append commits everything
+	# pending, including the row itself, and fsyncs before returning.
+	def __init__(self, flush_rows: int = 500, flush_seconds: float = 1.0):
+		self.flush_rows = max(1, flush_rows)
+		self.flush_seconds = flush_seconds
+		self._pending: dict[str, list[list]] = {kind: [] for kind in SCHEMAS}
+		self._pending_count = 0
+		self._lock = threading.Lock()
+		self._closed = threading.Event()
+		self._flusher: threading.Thread | None = None
+		if flush_seconds > 0:
+			self._flusher = threading.Thread(target=self._flush_loop, name="store-flush", daemon=True)
+			self._flusher.start()
+
+	def append(self, kind: str, row: list, durable: bool = False) -> None:
+		with self._lock:
+			self._pending[kind].append(row)
+			self._pending_count += 1
+			if durable or self._pending_count >= self.flush_rows:
+				self._commit(durable)
+
+	def flush(self) -> None:
+		with self._lock:
+			self._commit(False)
+
+	def close(self) -> None:
+		self._closed.set()
+		if self._flusher is not None:
+			self._flusher.join(timeout=self.flush_seconds + 1.0)
+		with self._lock:
+			self._commit(True)
+			self._close_backend()
+
+	def _flush_loop(self) -> None:
+		while not self._closed.wait(self.flush_seconds):
+			self.flush()
+
+	def _commit(self, sync: bool) -> None:
+		if self._pending_count:
+			for kind, rows in self._pending.items():
+				if rows:
+					self._write_rows(kind, rows)
+					self._pending[kind] = []
+			self._pending_count = 0
+		elif not sync:
+			return
+		self._sync(sync)
+
+	@abstractmethod
+	def _write_rows(self, kind: str, rows: list[list]) -> None: ...
+
+	@abstractmethod
+	def _sync(self, fsync: bool) -> None: ...
+
+	@abstractmethod
+	def _close_backend(self) -> None: ...
+
+
+class BufferedCsvStore(_GroupCommitStore):
+	def __init__(self, directory: Path, flush_rows: int = 500, flush_seconds: float = 1.0):
+		self.paths = {kind: directory / name for kind, name in CSV_FILES.items()}
+		self._files = {}
+		self._writers = {}
+		for kind, path in self.paths.items():
+			_init_csv(path, SCHEMAS[kind])
+			f = path.open("a", newline="", encoding="utf-8")
+			self._files[kind] = f
+			self._writers[kind] = csv.writer(f)
+		self._dirty: set[str] = set()
+		super().__init__(flush_rows, flush_seconds)
+
+	def _write_rows(self, kind: str, rows: list[list]) -> None:
+		self._writers[kind].writerows(rows)
+		self._dirty.add(kind)
+
+	def _sync(self, fsync: bool) -> None:
+		for kind in self._dirty:
+			f = self._files[kind]
+			f.flush()
+			if fsync:
+				os.fsync(f.fileno())
+		self._dirty.clear()
+
+	def _close_backend(self) -> None:
+		for f in self._files.values():
+			f.close()
+
+
+class SqliteStore(_GroupCommitStore):
+	def __init__(self, path: Path, flush_rows: int = 500, flush_seconds: float = 1.0):
+		self.path = path
+		# Only ever used under self._lock, so sharing it with the flusher is safe
+		self._conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+		self._conn.execute("PRAGMA journal_mode=WAL")
+		self._conn.execute("PRAGMA synchronous=FULL")
+		self._inserts = {}
+		for kind, columns in SCHEMAS.items():
+			cols = ", ".join(f'"{c}"' for c in columns)
+			self._conn.execute(f"CREATE TABLE IF NOT EXISTS {kind} ({cols})")
+			self._inserts[kind] = f"INSERT INTO {kind} VALUES ({', '.join('?' * len(columns))})"
+		self._in_tx = False
+		super().__init__(flush_rows, flush_seconds)
+
+	def _write_rows(self, kind: str, rows: list[list]) -> None:
+		if not self._in_tx:
+			self._conn.execute("BEGIN")
+			self._in_tx = True
+		self._conn.executemany(self._inserts[kind], rows)
+
+	def _sync(self, fsync: bool) -> None:
+		# synchronous=FULL syncs the WAL on every commit; batching rows per
+		# commit is what keeps that affordable.
+		if self._in_tx:
+			self._conn.execute("COMMIT")
+			self._in_tx = False
+
+	def _close_backend(self) -> None:
+		self._conn.close()
+
+
+class SegmentManifest:
+	# STORE_DIR/segments/manifest.json: one entry per segment file, rewritten
+	# atomically on every change. States: active (being appended to), sealed,
+	# compressed (.csv.gz). ts_min/ts_max are the row timestamps as written.
+	def __init__(self, directory: Path):
+		self.directory = directory
+		self.path = directory / "manifest.json"
+		self._lock = threading.Lock()
+		self.segments: list[dict] = []
+		if self.path.exists():
+			self.segments = json.loads(self.path.read_text(encoding="utf-8"))["segments"]
+
+	def _save(self) -> None:
+		tmp = self.path.with_suffix(".tmp")
+		tmp.write_text(json.dumps({"segments": self.segments}, indent=1), encoding="utf-8")
+		os.replace(tmp, self.path)
+
+	def add(self, kind: str) -> dict:
+		with self._lock:
+			seq = max((seg["seq"] for seg in self.segments if seg["kind"] == kind), default=0) + 1
+			segment = {
+				"kind": kind,
+				"seq": seq,
+				"file": f"{kind}-{seq:06d}.csv",
+				"state": "active",
+				"compacted": False,
+				"created": time.time(),
+				"rows": 0,
+				"bytes": 0,
+				"ts_min": None,
+				"ts_max": None,
+			}
+			self.segments.append(segment)
+			self._save()
+			return segment
+
+	def update(self, segment: dict, **fields) -> None:
+		with self._lock:
+			segment.update(fields)
+			self._save()
+
+	def active(self, kind: str) -> Optional[dict]:
+		with self._lock:
+			for segment in self.segments:
+				if segment["kind"] == kind and segment["state"] == "active":
+					return segment
+			return None
+
+	def snapshot(self, kind: Optional[str] = None) -> list[dict]:
+		with self._lock:
+			return [dict(seg) for seg in self.segments if kind is None or seg["kind"] == kind]
+
+	def find(self, kind: str, seq: int) -> Optional[dict]:
+		with self._lock:
+			for segment in self.segments:
+				if segment["kind"] == kind and segment["seq"] == seq:
+					return segment
+			return None
+
+
+class SegmentedCsvStore(_GroupCommitStore):
+	# Buffered CSV split into segments under STORE_DIR/segments/. The active
+	# segment of a kind rolls once it reaches segment_bytes or segment_seconds,
+	# checked after each batch write, so appends always go to a small open
+	# file. Sealed segments are gzipped, and old status segments downsampled,
+	# by a maintenance thread (see SegmentMaintainer); neither touches the
+	# append path beyond one manifest rewrite per roll.
+	def __init__(
+		self,
+		directory: Path,
+		flush_rows: int = 500,
+		flush_seconds: float = 1.0,
+		segment_bytes: int = 64 * 1024 * 1024,
+		segment_seconds: float = 86400.0,
+		maintainer: Optional[dict] = None,
+	):
+		self.directory = directory / "segments"
+		self.directory.mkdir(parents=True, exist_ok=True)
+		self.segment_bytes = segment_bytes
+		self.segment_seconds = segment_seconds
+		self.manifest = SegmentManifest(self.directory)
+		self._segments: dict[str, dict] = {}
+		self._files = {}
+		self._writers = {}
+		self._opened: dict[str, float] = {}
+		self._ts: dict[str, list] = {}
+		for kind in SCHEMAS:
+			self._open(kind, self.manifest.active(kind) or self.manifest.add(kind))
+		self._dirty: set[str] = set()
+		super().__init__(flush_rows, flush_seconds)
+		# maintainer: SegmentMaintainer keyword arguments, or None to disable
+		self.maintainer: Optional[SegmentMaintainer] = None
+		if maintainer is not None:
+			self.maintainer = SegmentMaintainer(self.manifest, **maintainer)
+			self.maintainer.start()
+
+	def close(self) -> None:
+		if self.maintainer is not None:
+			self.maintainer.stop()
+		super().close()
+
+	def _open(self, kind: str, segment: dict) -> None:
+		path = self.directory / segment["file"]
+		_init_csv(path, SCHEMAS[kind])
+		f = path.open("a", newline="", encoding="utf-8")
+		self._segments[kind] = segment
+		self._files[kind] = f
+		self._writers[kind] = csv.writer(f)
+		self._opened[kind] = segment["created"]
+		self._ts[kind] = [segment["ts_min"], segment["ts_max"], segment["rows"]]
+
+	def _write_rows(self, kind: str, rows: list[list]) -> None:
+		self._writers[kind].writerows(rows)
+		# ISO timestamps in one offset compare correctly as strings
+		stamps = [str(row[0]) for row in rows]
+		acc = self._ts[kind]
+		lo, hi = min(stamps), max(stamps)
+		acc[0] = lo if acc[0] is None or lo < acc[0] else acc[0]
+		acc[1] = hi if acc[1] is None or hi > acc[1] else acc[1]
+		acc[2] += len(rows)
+		self._dirty.add(kind)
+
+	def _sync(self, fsync: bool) -> None:
+		now = time.time()
+		for kind in self._dirty:
+			f = self._files[kind]
+			f.flush()
+			if fsync:
+				os.fsync(f.fileno())
+			if f.tell() >= self.segment_bytes or now - self._opened[kind] >= self.segment_seconds:
+				self._roll(kind)
+		self._dirty.clear()
+
+	def _roll(self, kind: str) -> None:
+		f = self._files[kind]
+		f.flush()
+		os.fsync(f.fileno())
+		size = f.tell()
+		f.close()
+		ts_min, ts_max, rows = self._ts[kind]
+		self.manifest.update(self._segments[kind], state="sealed", bytes=size, rows=rows, ts_min=ts_min, ts_max=ts_max)
+		self._open(kind, self.manifest.add(kind))
+
+	def _close_backend(self) -> None:
+		for kind, f in self._files.items():
+			ts_min, ts_max, rows = self._ts[kind]
+			size = f.tell()
+			f.close()
+			self.manifest.update(self._segments[kind], bytes=size, rows=rows, ts_min=ts_min, ts_max=ts_max)
+
+
+def _ts_epoch(ts: str) -> Optional[float]:
+	try:
+		parsed = datetime.fromisoformat(ts)
+	except ValueError:
+		return None
+	if parsed.tzinfo is None:
+		parsed = parsed.replace(tzinfo=timezone.utc)
+	return parsed.timestamp()
+
+
+def read_segment(path: Path) -> Iterator[list[str]]:
+	# Rows of a plain or gzipped segment, header skipped
+	opener = gzip.open if path.suffix == ".gz" else open
+	with opener(path, "rt", newline="", encoding="utf-8") as f:
+		reader = csv.reader(f)
+		next(reader, None)
+		yield from reader
+
+
+class SegmentMaintainer:
+	# Background upkeep for SegmentedCsvStore, run every interval seconds:
+	# gzip sealed segments (unless compress is off), and rewrite sealed or
+	# compressed status segments whose newest row is older than
+	# compact_after_seconds to keep one row per device per resolution_seconds,
+	# in the segment's own format. SOS and tamper segments are never thinned.
+	def __init__(
+		self,
+		manifest: SegmentManifest,
+		compress: bool = True,
+		compact_after_seconds: float = 7 * 86400.0,
+		resolution_seconds: float = 60.0,
+		interval: float = 60.0,
+	):
+		self.manifest = manifest
+		self.directory = manifest.directory
+		self.compress = compress
+		self.compact_after_seconds = compact_after_seconds
+		self.resolution_seconds = resolution_seconds
+		self.interval = interval
+		self._stop = threading.Event()
+		self._thread: Optional[threading.Thread] = None
+		self.compressed = 0
+		self.compacted = 0
+		self.rows_dropped = 0
+
+	def start(self) -> None:
+		self._thread = threading.Thread(target=self._loop, name="store-maintenance", daemon=True)
+		self._thread.start()
+
+	def stop(self) -> None:
+		self._stop.set()
+		if self._thread is not None:
+			self._thread.join(timeout=30.0)
+
+	def _loop(self) -> None:
+		while True:
+			try:
+				self.run_once()
+			except Exception as exc:
+				print(f"[storage] segment maintenance failed: {exc}")
+			if self._stop.wait(self.interval):
+				return
+
+	def run_once(self, now: Optional[float] = None) -> None:
+		now = time.time() if now is None else now
+		for segment in self.manifest.snapshot():
+			if self._stop.is_set():
+				return
+			if segment["state"] == "sealed" and self.compress:
+				self._gzip(segment)
+			elif (
+				segment["state"] in ("sealed", "compressed")
+				and segment["kind"] in COMPACTABLE
+				and not segment["compacted"]
+				and self.compact_after_seconds > 0
+			):
+				newest = _ts_epoch(segment["ts_max"] or "")
+				if newest is not None and now - newest >= self.compact_after_seconds:
+					self._compact(segment)
+
+	def _gzip(self, segment: dict) -> None:
+		src = self.directory / segment["file"]
+		dst = src.with_name(src.name + ".gz")
+		tmp = dst.with_name(dst.name + ".tmp")
+		with src.open("rb") as fin, gzip.open(tmp, "wb", compresslevel=6) as fout:
+			shutil.copyfileobj(fin, fout, 1024 * 1024)
+		os.replace(tmp, dst)
+		live = self.manifest.find(segment["kind"], segment["seq"])
+		self.manifest.update(live, state="compressed", file=dst.name, bytes=dst.stat().st_size)
+		src.unlink()
+		self.compressed += 1
+
+	def _compact(self, segment: dict) -> None:
+		src = self.directory / segment["file"]
+		tmp = src.with_name(src.name + ".tmp")
+		seen: set[tuple[str, int]] = set()
+		kept = dropped = 0
+		if src.suffix == ".gz":
+			out = gzip.open(tmp, "wt", newline="", encoding="utf-8", compresslevel=6)
+		else:
+			out = tmp.open("w", newline="", encoding="utf-8")
+		with out as fout:
+			writer = csv.writer(fout)
+			writer.writerow(SCHEMAS[segment["kind"]])
+			for row in read_segment(src):
+				ts = _ts_epoch(row[0]) if row else None
+				if ts is not None and len(row) > 1:
+					key = (row[1], int(ts // self.resolution_seconds))
+					if key in seen:
+						dropped += 1
+						continue
+					seen.add(key)
+				writer.writerow(row)
+				kept += 1
+		os.replace(tmp, src)
+		live = self.manifest.find(segment["kind"], segment["seq"])
+		self.manifest.update(live, compacted=True, rows=kept, bytes=src.stat().st_size)
+		self.compacted += 1
+		self.rows_dropped += dropped
+
+
+def _init_csv(path: Path, headers: list[str]) -> None:
+	# Also covers a file that exists but is empty (created and never written)
+	if not path.exists() or path.stat().st_size == 0:
+		with path.open("w", newline="", encoding="utf-8") as f:
+			writer = csv.writer(f)
+			writer.writerow(headers)
+
+
+def open_store(config: dict) -> EventStore:
+	backend = config.get("store_backend", "buffered")
+	directory = Path(config.get("store_dir", "."))
+	directory.mkdir(parents=True, exist_ok=True)
+	flush_rows = config.get("store_flush_rows", 500)
+	flush_seconds = config.get("store_flush_seconds", 1.0)
+	if backend == "csv":
+		return CsvStore(directory)
+	if backend == "buffered":
+		return BufferedCsvStore(directory, flush_rows, flush_seconds)
+	if backend == "sqlite":
+		return SqliteStore(directory / "events.db", flush_rows, flush_seconds)
+	if backend == "segmented":
+		return SegmentedCsvStore(
+			directory,
+			flush_rows,
+			flush_seconds,
+			segment_bytes=config.get("store_segment_bytes", 64 * 1024 * 1024),
+			segment_seconds=config.get("store_segment_seconds", 86400.0),
+			maintainer={
+				"compress": config.get("store_compress", True),
+				"compact_after_seconds": config.get("store_compact_after_seconds", 7 * 86400.0),
+				"resolution_seconds": config.get("store_compact_resolution_seconds", 60.0),
+				"interval": config.get("store_maintenance_seconds", 60.0),
+			},
+		)
+	raise ValueError(f"unknown STORE_BACKEND '{backend}' (expected csv, buffered, sqlite or segmented)")
@@ -0,0 +1,39 @@
+import contextlib
+import io
+
+import pytest
+
+from server import SosServer, load_config
+
+
+@pytest.fixture
+def make_server(tmp_path):
+	# An offline SosServer (no broker, Twilio, metrics or outbox) writing to tmp_path
+	servers: list[SosServer] = []
+
+	def make(**overrides) -> SosServer:
+		config = load_config()
+		config.update({
+			"store_dir": str(tmp_path),
+			"emergency_numbers": ["+15550000001"],
+			"twilio_sid": "",
+			"metrics_port": 0,
+			"metrics_file": "",
+			"live_port": 0,
+			"outbox_enabled": False,
+			"routes_file": "",
+			"geofence_file": "",
+			"offline_grace_multiple": 0,
+		})
+		config.update(overrides)
+		with contextlib.redirect_stdout(io.StringIO()):
+			server = SosServer(config)
+		servers.append(server)
+		return server
+
+	yield make
+	for server in servers:
+		server._stopping.set()
+		server.store.close()
+		if server.outbox is not None:
+			server.outbox.close()
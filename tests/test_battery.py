@@ -0,0 +1,43 @@
+import pytest
+
+from battery import LEVEL_CRITICAL, LEVEL_LOW, BatteryTracker
+
+T0 = 1_700_000_000.0
+
+
+def _drain(tracker: BatteryTracker, start: float, per_hour: float, minutes: int, device_id: str = "ring-1") -> list:
+	# One heartbeat a minute on a straight line
+	alerts = []
+	for minute in range(minutes + 1):
+		alert = tracker.update(device_id, start - per_hour * minute / 60, now=T0 + minute * 60)
+		if alert is not None:
+			alerts.append(alert)
+	return alerts
+
+
+def test_time_to_empty_on_a_linear_drain():
+	tracker = BatteryTracker()
+	assert _drain(tracker, 90.0, 6.0, 60) == []
+	estimate = tracker.estimate("ring-1", now=T0 + 3600)
+	assert estimate.percent == pytest.approx(84.0)
+	assert estimate.drain_per_hour == pytest.approx(6.0, rel=0.01)
+	assert estimate.hours_left == pytest.approx(14.0, rel=0.01)
+
+
+def test_no_estimate_before_min_span():
+	tracker = BatteryTracker(min_span_seconds=600)
+	_drain(tracker, 90.0, 6.0, 5)
+	assert tracker.estimate("ring-1", now=T0 + 300).hours_left is None
+
+
+def test_fast_drain_alerts_once_per_level_until_charged():
+	tracker = BatteryTracker(warn_hours=2.0)
+	# 30 %/h from 80 %: two hours left at 60 %, low by level at 10 %, critical at 5 %
+	alerts = _drain(tracker, 80.0, 30.0, 150)
+	assert [alert.level for alert in alerts] == [LEVEL_LOW, LEVEL_CRITICAL]
+	assert alerts[0].estimate.percent == pytest.approx(60.0, abs=1.0)
+	assert alerts[0].estimate.hours_left <= 2.0
+	# A jump up is a charge: the fit starts over
+	assert tracker.update("ring-1", 100.0, now=T0 + 151 * 60) is None
+	assert tracker.charges == 1
+	assert tracker.estimate("ring-1", now=T0 + 151 * 60).hours_left is None
@@ -0,0 +1,12 @@
+import pytest
+
+
+def test_partition_index_must_be_below_worker_count(make_server):
+	with pytest.raises(ValueError, match="CLUSTER_INDEX 2 out of range for CLUSTER_WORKERS 2"):
+		make_server(cluster_mode="partition", cluster_workers=2, cluster_index=2)
+	with pytest.raises(ValueError, match="CLUSTER_INDEX -1"):
+		make_server(cluster_mode="partition", cluster_workers=2, cluster_index=-1)
+	workers = [make_server(cluster_mode="partition", cluster_workers=2, cluster_index=i) for i in range(2)]
+	for n in range(50):
+		topic = f"wearable/ring-{n}/sos"
+		assert sum(worker._owns(topic) for worker in workers) == 1
@@ -0,0 +1,35 @@
+from notify import PRIORITY_ALERT, PRIORITY_INFO, PRIORITY_SOS, NotificationCoalescer
+
+
+def _coalescer():
+	delivered: list[tuple[str, int, tuple[str, ...]]] = []
+	coalescer = NotificationCoalescer(10.0, lambda device, channel, to, text, priority, keys: delivered.append((text, priority, keys)))
+	return coalescer, delivered
+
+
+def test_every_sos_in_a_window_is_delivered_immediately():
+	coalescer, delivered = _coalescer()
+	coalescer.submit("ring-1", "sms", "+1555", "battery low", PRIORITY_INFO)
+	coalescer.submit("ring-1", "sms", "+1555", "SOS #1", PRIORITY_SOS, keys=("k1",))
+	coalescer.submit("ring-1", "sms", "+1555", "SOS #2", PRIORITY_SOS, keys=("k2",))
+	assert delivered == [
+		("battery low", PRIORITY_INFO, ()),
+		("SOS #1", PRIORITY_SOS, ("k1",)),
+		("SOS #2", PRIORITY_SOS, ("k2",)),
+	]
+	# Nothing was held back for the window to close
+	coalescer.stop()
+	assert len(delivered) == 3
+
+
+def test_merged_follow_up_lists_most_urgent_first():
+	coalescer, delivered = _coalescer()
+	coalescer.submit("ring-1", "sms", "+1555", "SOS", PRIORITY_SOS)
+	coalescer.submit("ring-1", "sms", "+1555", "battery low", PRIORITY_INFO)
+	coalescer.submit("ring-1", "sms", "+1555", "tamper", PRIORITY_ALERT)
+	coalescer.submit("ring-1", "sms", "+1555", "left safe zone", PRIORITY_ALERT)
+	assert len(delivered) == 1
+	coalescer.stop()
+	text, priority, _ = delivered[1]
+	assert text == "3 more alerts for ring-1: tamper | left safe zone | battery low"
+	assert priority == PRIORITY_ALERT
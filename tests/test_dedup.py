@@ -0,0 +1,79 @@
+import contextlib
+import io
+import json
+import time
+
+import paho.mqtt.client as mqtt
+
+from dedup import DedupCache, sos_key
+
+# What the ESP32 sketch publishes: no msgId, no ts
+FIRMWARE_SOS = {"deviceId": "esp32-ring-01", "type": "SOS", "reason": "button", "batteryPercent": 96, "lat": None, "lon": None}
+
+
+def _message(payload: dict, retain: bool = False, dup: bool = False) -> mqtt.MQTTMessage:
+	msg = mqtt.MQTTMessage(mid=1, topic=f"wearable/{payload['deviceId']}/sos".encode())
+	msg.payload = json.dumps(payload).encode()
+	msg.retain = retain
+	msg.dup = dup
+	return msg
+
+
+def _recording(server):
+	acks: list[dict] = []
+	notified: list[str] = []
+	server.client.publish = lambda topic, payload, qos=0, retain=False: acks.append(json.loads(payload))
+	server._send_sms = lambda body, **kwargs: notified.append(body)
+	server._send_calls = lambda body, **kwargs: None
+	return acks, notified
+
+
+def test_sos_key_without_ids_falls_back_to_payload_digest():
+	key = sos_key(dict(FIRMWARE_SOS))
+	assert key is not None
+	assert key == sos_key(dict(reversed(list(FIRMWARE_SOS.items()))))
+	assert key != sos_key(dict(FIRMWARE_SOS, batteryPercent=95))
+	assert sos_key({"deviceId": "ring-1", "msgId": 7, "ts": "t"}) == ("ring-1", 7, "t")
+
+
+def test_redelivered_firmware_sos_notifies_once(make_server):
+	server = make_server()
+	acks, notified = _recording(server)
+	with contextlib.redirect_stdout(io.StringIO()):
+		server._on_message(server.client, None, _message(FIRMWARE_SOS))
+		server._on_message(server.client, None, _message(FIRMWARE_SOS))
+	assert len(notified) == 1
+	assert len(acks) == 2
+
+
+def test_identical_press_after_the_digest_window_notifies_again(make_server):
+	server = make_server(sos_dedup_digest_window_seconds=0.05)
+	acks, notified = _recording(server)
+	with contextlib.redirect_stdout(io.StringIO()):
+		server._on_message(server.client, None, _message(FIRMWARE_SOS))
+		time.sleep(0.1)
+		# The broker redelivering the first copy is still answered from the cache
+		server._on_message(server.client, None, _message(FIRMWARE_SOS, dup=True))
+		assert len(notified) == 1
+		server._on_message(server.client, None, _message(FIRMWARE_SOS))
+	assert len(notified) == 2
+	assert len(acks) == 3
+
+
+def test_sos_with_ids_matches_for_the_whole_ttl():
+	cache = DedupCache(ttl_seconds=60)
+	key = ("ring-1", 7, "t")
+	assert cache.check(key, '{"ok": true}', window=None) is None
+	assert cache.check(key, '{"ok": false}') == '{"ok": true}'
+	assert cache.check(("ring-1", None, "sha:x"), "a", window=0.0) is None
+	assert cache.check(("ring-1", None, "sha:x"), "b", window=0.0) is None
+	assert cache.check(("ring-1", None, "sha:x"), "c", redelivery=True) == "b"
+
+
+def test_retained_sos_is_acked_but_not_notified(make_server):
+	server = make_server()
+	acks, notified = _recording(server)
+	with contextlib.redirect_stdout(io.StringIO()):
+		server._on_message(server.client, None, _message(dict(FIRMWARE_SOS, msgId=3), retain=True))
+	assert notified == []
+	assert len(acks) == 1 and acks[0]["msgId"] == 3
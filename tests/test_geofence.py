@@ -0,0 +1,59 @@
+import random
+
+from geofence import Fence, GeofenceEngine
+
+
+def _moves(engine: GeofenceEngine, device_id: str, path: list[tuple[float, float]]) -> list[list[tuple[str, bool]]]:
+	return [[(event.fence.fence_id, event.entered) for event in engine.check(device_id, lat, lon)] for lat, lon in path]
+
+
+def test_circle_fence_on_a_cell_corner():
+	# Centred on the corner of four 0.01° cells, 300 m across all of them
+	engine = GeofenceEngine(cell_degrees=0.01)
+	engine.add(Fence("market", "danger", lat=13.0, lon=80.0, radius_m=300))
+	path = [
+		(12.995, 80.0),  # 556 m south: outside
+		(12.999, 80.0),  # inside, cell south of the corner
+		(13.001, 80.001),  # inside, across two cell edges
+		(13.001, 79.999),  # inside, across another
+		(13.005, 79.999),  # outside
+	]
+	assert _moves(engine, "ring-1", path) == [[], [("market", True)], [], [], [("market", False)]]
+
+
+def test_polygon_fence_across_cells():
+	engine = GeofenceEngine(cell_degrees=0.01)
+	engine.add(Fence("home", "safe", polygon=[(13.005, 80.005), (13.005, 80.025), (13.025, 80.025), (13.025, 80.005)]))
+	events = []
+	for lat, lon in [(13.006, 80.006), (13.015, 80.015), (13.024, 80.019), (13.026, 80.019), (13.015, 80.015)]:
+		events.append([(e.fence.fence_id, e.entered, e.alarming) for e in engine.check("ring-1", lat, lon)])
+	# First fix inside a safe zone is no news; leaving it is
+	assert events == [[], [], [], [("home", False, True)], [("home", True, False)]]
+	assert [fence.fence_id for fence in engine.inside("ring-1")] == ["home"]
+
+
+def test_device_fences_only_apply_to_their_device():
+	engine = GeofenceEngine()
+	engine.add(Fence("school", "safe", device_id="ring-1", lat=13.0, lon=80.0, radius_m=200))
+	assert engine.check("ring-2", 13.0, 80.0) == []
+	assert engine.check("ring-1", 13.0, 80.0) == []
+	assert [e.entered for e in engine.check("ring-1", 13.01, 80.0)] == [False]
+
+
+def test_grid_agrees_with_testing_every_fence():
+	rng = random.Random(7)
+	engine = GeofenceEngine(cell_degrees=0.005)
+	fences = []
+	for i in range(40):
+		lat, lon = 13.0 + rng.uniform(0, 0.05), 80.0 + rng.uniform(0, 0.05)
+		if i % 2:
+			fence = Fence(f"c{i}", "safe", lat=lat, lon=lon, radius_m=rng.uniform(50, 800))
+		else:
+			d = rng.uniform(0.001, 0.01)
+			fence = Fence(f"p{i}", "danger", polygon=[(lat, lon), (lat + d, lon + d / 2), (lat, lon + d)])
+		fences.append(fence)
+		engine.add(fence)
+	for _ in range(2000):
+		lat, lon = 13.0 + rng.uniform(-0.01, 0.06), 80.0 + rng.uniform(-0.01, 0.06)
+		engine.check("ring-1", lat, lon)
+		assert {f.fence_id for f in engine.inside("ring-1")} == {f.fence_id for f in fences if f.contains(lat, lon)}
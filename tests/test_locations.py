@@ -0,0 +1,25 @@
+import contextlib
+import csv
+import io
+from pathlib import Path
+
+from pipeline import status_row
+
+
+def test_sos_log_keeps_the_fix_the_device_sent(make_server, tmp_path):
+	server = make_server(store_backend="csv")
+	server.client.publish = lambda *args, **kwargs: None
+	server._send_sms = lambda body, **kwargs: None
+	server._send_calls = lambda body, **kwargs: None
+	with contextlib.redirect_stdout(io.StringIO()):
+		server._apply_status(status_row({"deviceId": "ring-1", "ts": "2024-01-01T00:00:00+00:00", "lat": 13.08, "lon": 80.27}))
+		# A 100 km jump a moment later: the filter rejects it and the
+		# message falls back to the last known position
+		server._handle_sos({"deviceId": "ring-1", "ts": "2024-01-01T00:00:01+00:00", "lat": 14.0, "lon": 80.27, "reason": "button"})
+		# No fix at all: nothing to log but the estimate stays in mapsUrl
+		server._handle_sos({"deviceId": "ring-1", "ts": "2024-01-01T00:00:02+00:00", "reason": "button"})
+	server.store.close()
+	with Path(tmp_path, "sos_log.csv").open(newline="", encoding="utf-8") as f:
+		rows = list(csv.DictReader(f))
+	assert [(row["lat"], row["lon"]) for row in rows] == [("14.0", "80.27"), ("", "")]
+	assert all("13.08" in row["mapsUrl"] for row in rows)
@@ -0,0 +1,40 @@
+import sys
+import threading
+
+import pytest
+
+from metrics import MetricsRegistry, _LabeledMetric
+
+
+def test_incomplete_metric_fails_at_construction():
+	class Half(_LabeledMetric):
+		def _new_child(self):
+			return None
+
+	with pytest.raises(TypeError):
+		Half("half", "missing _render_child")
+
+
+def test_shared_children_do_not_lose_updates():
+	# Switch threads as often as possible so unlocked adds would interleave
+	previous = sys.getswitchinterval()
+	sys.setswitchinterval(1e-6)
+	try:
+		registry = MetricsRegistry()
+		counter = registry.counter("t_total", "test", ("channel",), shared=True).labels("sms")
+		hist = registry.histogram("t_seconds", "test", ("channel",), shared=True).labels("sms")
+
+		def work() -> None:
+			for _ in range(20000):
+				counter.inc()
+				hist.observe(0.001)
+
+		threads = [threading.Thread(target=work) for _ in range(4)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+	finally:
+		sys.setswitchinterval(previous)
+	assert counter.value == 80000
+	assert sum(hist.counts) == 80000
@@ -0,0 +1,43 @@
+import contextlib
+import io
+import threading
+import time
+
+from pipeline import status_row
+from server import SosServer
+
+
+def _heartbeat(server: SosServer, device_id: str) -> None:
+	server._apply_status(status_row({"deviceId": device_id, "ts": "2024-01-01T00:00:00+00:00", "state": "armed", "batteryPercent": 80}))
+
+
+def test_no_offline_alerts_while_server_link_is_down(make_server):
+	# Offline after 0.6 s of silence, checked every 0.05 s
+	server = make_server(heartbeat_seconds=0.2, offline_grace_multiple=3, offline_tick_seconds=0.05)
+	sent: list[tuple[str, str]] = []
+	server._send_sms = lambda body, priority=0, device_id="", **kwargs: sent.append((device_id, body))
+	with contextlib.redirect_stdout(io.StringIO()):
+		server._on_connect(server.client, None, {}, 0)
+		for i in range(20):
+			_heartbeat(server, f"ring-{i}")
+		monitor = threading.Thread(target=server._offline_loop, daemon=True)
+		monitor.start()
+		try:
+			# Our own link drops for well over the grace period: the rings are
+			# silent only because we cannot hear them
+			server._on_disconnect(server.client, None, 1)
+			time.sleep(1.2)
+			assert sent == []
+			# Back up: every device gets a full grace period before an alert
+			server._on_connect(server.client, None, {}, 0)
+			time.sleep(0.3)
+			assert sent == []
+			_heartbeat(server, "ring-0")
+			# The ones that stay silent are reported once the grace period is over
+			time.sleep(0.45)
+			offline = {device_id for device_id, _ in sent}
+			assert offline == {f"ring-{i}" for i in range(1, 20)}
+			assert all("is offline" in body for _, body in sent)
+		finally:
+			server._stopping.set()
+			monitor.join(1.0)
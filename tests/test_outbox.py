@@ -0,0 +1,69 @@
+import contextlib
+import io
+import json
+import time
+
+import paho.mqtt.client as mqtt
+
+from outbox import OutboxEntry, payload_digest, sos_id
+
+# What the ESP32 sketch publishes: no msgId, no ts
+FIRMWARE_SOS = {"deviceId": "esp32-ring-01", "type": "SOS", "reason": "button", "batteryPercent": 5, "lat": None, "lon": None}
+
+
+def _message(payload: dict, mid: int, dup: bool = False) -> mqtt.MQTTMessage:
+	msg = mqtt.MQTTMessage(mid=mid, topic=f"wearable/{payload['deviceId']}/sos".encode())
+	msg.payload = json.dumps(payload).encode()
+	msg.dup = dup
+	return msg
+
+
+def _submitted(server) -> list[tuple[str, str]]:
+	submitted: list[tuple[str, str]] = []
+	server.coalescer.submit = lambda device_id, channel, number, body, priority, **kwargs: submitted.append((channel, number))
+	server.client.publish = lambda *args, **kwargs: None
+	return submitted
+
+
+def test_sos_id():
+	assert payload_digest(FIRMWARE_SOS) == payload_digest(dict(reversed(list(FIRMWARE_SOS.items()))))
+	assert sos_id(FIRMWARE_SOS, "1:1") != sos_id(FIRMWARE_SOS, "1:2")
+	assert sos_id({"deviceId": "ring-1", "ts": "2024-01-01T00:00:00+00:00"}, "1:1") == "2024-01-01T00:00:00+00:00"
+	assert sos_id({"deviceId": "ring-1", "ts": "t", "msgId": 4}, "1:1") != sos_id({"deviceId": "ring-1", "ts": "t", "msgId": 5}, "1:1")
+
+
+def test_identical_second_press_without_ids_is_notified(make_server):
+	# Dedup off, as once its window is over: two presses with the same
+	# battery, no fix and the same reason are still two emergencies
+	server = make_server(outbox_enabled=True, sos_dedup_ttl_seconds=0)
+	submitted = _submitted(server)
+	with contextlib.redirect_stdout(io.StringIO()):
+		server._on_message(server.client, None, _message(FIRMWARE_SOS, mid=1))
+		server._on_message(server.client, None, _message(FIRMWARE_SOS, mid=2))
+	assert submitted == [("sms", "+15550000001")] * 2
+	assert server.outbox.duplicates == 0
+
+
+def test_broker_redelivery_without_ids_is_not_notified_again(make_server):
+	server = make_server(outbox_enabled=True, sos_dedup_ttl_seconds=0)
+	submitted = _submitted(server)
+	with contextlib.redirect_stdout(io.StringIO()):
+		server._on_message(server.client, None, _message(FIRMWARE_SOS, mid=7))
+		server._on_message(server.client, None, _message(FIRMWARE_SOS, mid=7, dup=True))
+	assert submitted == [("sms", "+15550000001")]
+	assert server.outbox.duplicates == 1
+
+
+def test_replay_loop_prunes_rows_older_than_the_max_age(make_server):
+	server = make_server(outbox_enabled=True, outbox_max_age_seconds=0.05)
+	outbox = server.outbox
+	old = outbox.record([OutboxEntry("ring-1|a|sms|+1", "ring-1", "sms", "+1", "SOS")])
+	outbox.mark_sent(tuple(entry.key for entry in old))
+	time.sleep(0.1)
+	outbox.record([OutboxEntry("ring-1|b|sms|+1", "ring-1", "sms", "+1", "SOS")])
+	# One pass of the loop, as on every OUTBOX_REPLAY_SECONDS
+	server._stopping.set()
+	with contextlib.redirect_stdout(io.StringIO()):
+		server._outbox_loop()
+	keys = [row[0] for row in outbox._conn.execute("SELECT key FROM outbox")]
+	assert keys == ["ring-1|b|sms|+1"]
@@ -0,0 +1,68 @@
+import json
+import threading
+import time
+
+from pipeline import StatusPipeline
+
+
+def _payload(i: int) -> bytes:
+	return json.dumps({"deviceId": f"ring-{i}", "ts": "2024-01-01T00:00:00+00:00", "batteryPercent": 80}).encode()
+
+
+def test_applier_stands_aside_while_an_sos_is_handled():
+	applied: list[str] = []
+	done = threading.Event()
+
+	def apply(row: tuple) -> None:
+		applied.append(row[1])
+		if len(applied) == 200:
+			done.set()
+
+	pipeline = StatusPipeline(apply, mode="thread", batch_size=200, flush_seconds=0.05, workers=1, apply_chunk=10)
+	pipeline.start()
+	try:
+		with pipeline.urgent():
+			for i in range(200):
+				pipeline.submit(_payload(i))
+			time.sleep(0.3)
+			# Nothing decoded or applied while the SOS is in hand
+			assert applied == []
+		assert done.wait(5.0)
+		assert applied == [f"ring-{i}" for i in range(200)]
+	finally:
+		pipeline.stop()
+
+
+def test_batches_are_applied_in_the_order_they_were_cut():
+	applied: list[str] = []
+	done = threading.Event()
+
+	def apply(row: tuple) -> None:
+		applied.append(row[1])
+		if len(applied) == 6:
+			done.set()
+
+	pipeline = StatusPipeline(apply, mode="thread", batch_size=5, flush_seconds=10.0, workers=2)
+	decode = pipeline._decode_in_thread
+	finished: list[int] = []
+
+	def slow_first(payloads: list[bytes]) -> tuple[list[tuple], int]:
+		# The full first batch decodes slowly; the one-row batch after it is done first
+		if len(payloads) == 5:
+			time.sleep(0.3)
+		result = decode(payloads)
+		finished.append(len(payloads))
+		return result
+
+	pipeline._decode_in_thread = slow_first
+	pipeline.start()
+	try:
+		for i in range(5):
+			pipeline.submit(_payload(i))
+		pipeline.submit(_payload(5))
+		pipeline._cut()
+		assert done.wait(5.0)
+		assert finished == [1, 5]
+		assert applied == [f"ring-{i}" for i in range(6)]
+	finally:
+		pipeline.stop()
@@ -0,0 +1,70 @@
+import time
+
+import pytest
+
+import query
+from query import EventQuery, parse_args
+from storage import CsvStore, SqliteStore
+
+
+def test_since_and_until_are_parsed_by_argparse():
+	args = parse_args(["sos", "--since", "2h", "--until", "2024-01-01T00:00:00"])
+	assert abs(args.since - (time.time() - 7200)) < 5
+	assert args.until == 1704067200.0
+
+
+def test_malformed_since_is_a_usage_error(capsys):
+	with pytest.raises(SystemExit) as exit:
+		parse_args(["track", "--device", "ring-1", "--since", "yesterday"])
+	assert exit.value.code == 2
+	assert "argument --since: 'yesterday' is not an ISO time" in capsys.readouterr().err
+
+
+def _sos(ts: str, reason: str) -> list:
+	return [ts, "ring-1", 13.08, 80.27, reason, ""]
+
+
+def test_blocks_end_on_record_boundaries(tmp_path, monkeypatch):
+	monkeypatch.setattr(query, "BLOCK_ROWS", 2)
+	store = CsvStore(tmp_path)
+	reasons = ["button", 'fell\non "stairs"', "a\nb\nc", "button", "x\n"]
+	for i, reason in enumerate(reasons):
+		store.append("sos", _sos(f"2024-01-01T00:00:0{i}+00:00", reason))
+	events = EventQuery(tmp_path, "csv")
+	try:
+		assert [row["reason"] for row in events.sos()] == reasons
+		# Appended later: indexing resumes at the last record end
+		store.append("sos", _sos("2024-01-01T00:00:09+00:00", "late\nrow"))
+		assert [row["reason"] for row in events.sos(since=query.parse_time("2024-01-01T00:00:03Z"))] == ["button", "x\n", "late\nrow"]
+	finally:
+		events.close()
+
+
+def test_record_still_being_written_is_indexed_once_complete(tmp_path):
+	log = tmp_path / "sos_log.csv"
+	log.write_text('ts,deviceId,lat,lon,reason,mapsUrl\r\n2024-01-01T00:00:00+00:00,ring-1,,,button,\r\n2024-01-01T00:00:01+00:00,ring-1,,,"half\n', encoding="utf-8")
+	events = EventQuery(tmp_path, "csv")
+	try:
+		assert [row["reason"] for row in events.sos()] == ["button"]
+		with log.open("a", encoding="utf-8", newline="") as f:
+			f.write('done",\r\n')
+		assert [row["reason"] for row in events.sos()] == ["button", "half\ndone"]
+	finally:
+		events.close()
+
+
+def test_sqlite_bounds_compare_instants_not_strings(tmp_path):
+	store = SqliteStore(tmp_path / "events.db", flush_seconds=0)
+	# Three instants one hour apart, written in different offsets
+	store.append("sos", _sos("2024-01-01T05:30:00+05:30", "first"))
+	store.append("sos", _sos("2024-01-01T01:00:00Z", "second"))
+	store.append("sos", _sos("2023-12-31T21:00:00-05:00", "third"))
+	store.close()
+	events = EventQuery(tmp_path, "sqlite")
+	try:
+		since = query.parse_time("2024-01-01T00:30:00+00:00")
+		assert [row["reason"] for row in events.sos(since=since)] == ["second", "third"]
+		until = query.parse_time("2024-01-01T01:00:00+00:00")
+		assert [row["reason"] for row in events.sos(until=until)] == ["first", "second"]
+	finally:
+		events.close()
@@ -0,0 +1,50 @@
+import time
+
+from notify import PRIORITY_ALERT, PRIORITY_INFO, PRIORITY_SOS
+from ratelimit import TokenBucketLimiter
+
+
+def test_one_token_refills_every_refill_seconds():
+	limiter = TokenBucketLimiter(0.1, {PRIORITY_INFO: 1})
+	assert limiter.allow("ring-1", "sms", "+1", PRIORITY_INFO)
+	assert not limiter.allow("ring-1", "sms", "+1", PRIORITY_INFO)
+	# Buckets are per recipient
+	assert limiter.allow("ring-1", "sms", "+2", PRIORITY_INFO)
+	time.sleep(0.12)
+	assert limiter.allow("ring-1", "sms", "+1", PRIORITY_INFO)
+	assert limiter.stats()["suppressed"] == {"info/sms": 1}
+
+
+def test_burst_then_suppressed():
+	limiter = TokenBucketLimiter(60.0, {PRIORITY_ALERT: 3, PRIORITY_INFO: 1})
+	assert [limiter.allow("ring-1", "sms", "+1", PRIORITY_ALERT) for _ in range(5)] == [True, True, True, False, False]
+	# Each priority class has its own bucket
+	assert limiter.allow("ring-1", "sms", "+1", PRIORITY_INFO)
+
+
+def test_sos_is_never_limited():
+	limiter = TokenBucketLimiter(60.0, {PRIORITY_INFO: 1}, max_buckets=1)
+	assert all(limiter.allow("ring-1", "call", "+1", PRIORITY_SOS) for _ in range(50))
+	assert len(limiter) == 0
+
+
+def test_bucket_cap_evicts_least_recently_used():
+	limiter = TokenBucketLimiter(60.0, {PRIORITY_INFO: 1}, max_buckets=3)
+	limiter.allow("ring-0", "sms", "+1", PRIORITY_INFO)
+	for i in range(1, 10):
+		# ring-0 stays busy; none of the buckets is idle
+		limiter.allow("ring-0", "sms", "+1", PRIORITY_INFO)
+		limiter.allow(f"ring-{i}", "sms", "+1", PRIORITY_INFO)
+		assert len(limiter) <= 3
+	assert [key[0] for key in limiter._buckets] == ["ring-8", "ring-0", "ring-9"]
+	assert not limiter.allow("ring-0", "sms", "+1", PRIORITY_INFO)
+	assert limiter.evicted == 7
+
+
+def test_idle_buckets_are_dropped():
+	limiter = TokenBucketLimiter(0.02, {PRIORITY_ALERT: 3, PRIORITY_INFO: 1})
+	limiter.allow("ring-1", "sms", "+1", PRIORITY_INFO)
+	limiter.allow("ring-2", "sms", "+1", PRIORITY_ALERT)
+	time.sleep(0.1)
+	limiter.allow("ring-3", "sms", "+1", PRIORITY_INFO)
+	assert len(limiter) == 1
@@ -0,0 +1,89 @@
+from storage import SegmentedCsvStore, SegmentMaintainer, read_segment
+
+
+def _ts(second: int) -> str:
+	return f"2024-01-01T00:{second // 60:02d}:{second % 60:02d}+00:00"
+
+
+def _store(tmp_path, segment_bytes: int = 1) -> SegmentedCsvStore:
+	# No flusher and no maintainer: rows are written on flush(), and a
+	# segment at or above segment_bytes rolls right after the write
+	return SegmentedCsvStore(tmp_path, flush_rows=100_000, flush_seconds=0, segment_bytes=segment_bytes)
+
+
+def _rows(store: SegmentedCsvStore, kind: str) -> list[list[str]]:
+	return [row for seg in store.manifest.snapshot(kind) for row in read_segment(store.directory / seg["file"])]
+
+
+def _fill(store: SegmentedCsvStore) -> None:
+	# Two devices reporting every 10 s for three minutes, plus SOS and
+	# tamper rows just as dense
+	for second in range(0, 180, 10):
+		for device_id in ("ring-1", "ring-2"):
+			store.append("status", [_ts(second), device_id, "armed", 80, 13.08, 80.27])
+			store.append("sos", [_ts(second), device_id, 13.08, 80.27, "button", ""])
+			store.append("tamper", [_ts(second), device_id, "vibration"])
+	store.flush()
+
+
+def test_segments_roll_by_size(tmp_path):
+	store = _store(tmp_path, segment_bytes=120)
+	for second in range(12):
+		store.append("status", [_ts(second), "ring-1", "armed", 80, 13.08, 80.27])
+		store.flush()
+	store.close()
+	segments = store.manifest.snapshot("status")
+	assert len(segments) > 2
+	assert [seg["state"] for seg in segments[:-1]] == ["sealed"] * (len(segments) - 1)
+	assert segments[-1]["state"] == "active"
+	assert sum(seg["rows"] for seg in segments) == 12
+	assert [row[0] for row in _rows(store, "status")] == [_ts(second) for second in range(12)]
+
+
+def test_sealed_segments_are_gzipped(tmp_path):
+	store = _store(tmp_path)
+	_fill(store)
+	before = _rows(store, "sos")
+	SegmentMaintainer(store.manifest, compact_after_seconds=0).run_once()
+	sealed = [seg for seg in store.manifest.snapshot() if seg["state"] != "active"]
+	assert sealed and all(seg["state"] == "compressed" and seg["file"].endswith(".csv.gz") for seg in sealed)
+	assert not any((store.directory / seg["file"].removesuffix(".gz")).exists() for seg in sealed)
+	assert _rows(store, "sos") == before
+	store.close()
+
+
+def _check_compacted(store: SegmentedCsvStore) -> None:
+	status = _rows(store, "status")
+	# One row per device per minute survives, the first of each
+	assert [(row[0], row[1]) for row in status] == [(_ts(m * 60), d) for m in range(3) for d in ("ring-1", "ring-2")]
+	assert len(_rows(store, "sos")) == 36
+	assert len(_rows(store, "tamper")) == 36
+	compacted = [seg for seg in store.manifest.snapshot("status") if seg["state"] != "active"]
+	assert all(seg["compacted"] and seg["rows"] == 6 for seg in compacted)
+
+
+def test_compaction_keeps_every_sos_and_tamper_row(tmp_path):
+	store = _store(tmp_path)
+	_fill(store)
+	maintainer = SegmentMaintainer(store.manifest)
+	# First pass gzips, the second thins the (week-old) status segment
+	maintainer.run_once()
+	maintainer.run_once()
+	assert maintainer.compressed == 3 and maintainer.compacted == 1
+	_check_compacted(store)
+	store.close()
+
+
+def test_compaction_without_compression_keeps_plain_csv(tmp_path):
+	store = _store(tmp_path)
+	_fill(store)
+	maintainer = SegmentMaintainer(store.manifest, compress=False)
+	maintainer.run_once()
+	assert maintainer.compressed == 0 and maintainer.compacted == 1
+	_check_compacted(store)
+	segment = store.manifest.snapshot("status")[0]
+	assert segment["file"].endswith(".csv")
+	path = store.directory / segment["file"]
+	assert path.read_bytes()[:2] != b"\x1f\x8b"
+	assert path.read_text(encoding="utf-8").startswith("ts,deviceId,")
+	store.close()
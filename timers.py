@@ -0,0 +1,67 @@
+from typing import Hashable
+
+
+# Hashed timer wheel with lazy rescheduling. Each key has at most one live
+# deadline; pushing a deadline later (the common case: another heartbeat
+# arrived) only updates a dict, and the key is moved to its new slot when the
+# old slot comes round. advance() therefore costs O(ticks elapsed + entries in
+# those slots) rather than a scan of every key. Deadlines further out than one
+# wheel rotation are simply re-placed each time their slot is visited.
+# Expiry is reported at tick granularity (up to one tick late). Not thread-safe.
+class TimerWheel:
+	def __init__(self, tick_seconds: float = 1.0, slots: int = 512, now: float = 0.0):
+		self.tick_seconds = tick_seconds
+		self._slots: list[set] = [set() for _ in range(max(1, slots))]
+		self._deadlines: dict[Hashable, float] = {}
+		self._current = int(now // tick_seconds)
+
+	def __len__(self) -> int:
+		return len(self._deadlines)
+
+	def __contains__(self, key: Hashable) -> bool:
+		return key in self._deadlines
+
+	def schedule(self, key: Hashable, deadline: float) -> None:
+		old = self._deadlines.get(key)
+		self._deadlines[key] = deadline
+		if old is None or deadline < old:
+			self._place(key, deadline)
+
+	def cancel(self, key: Hashable) -> None:
+		# Any slot entry left behind is dropped when its slot is visited
+		self._deadlines.pop(key, None)
+
+	def postpone_all(self, deadline: float) -> None:
+		# Moves every deadline earlier than this out to it; later deadlines
+		# need no re-placing (see above), so this only touches the dict
+		deadlines = self._deadlines
+		for key, old in deadlines.items():
+			if old < deadline:
+				deadlines[key] = deadline
+
+	def advance(self, now: float) -> list:
+		expired = []
+		target = int(now // self.tick_seconds)
+		# Only whole ticks that have fully elapsed are processed, so anything
+		# re-placed lands in a slot that has not been visited yet.
+		while self._current < target:
+			slot = self._slots[self._current % len(self._slots)]
+			self._current += 1
+			if not slot:
+				continue
+			keys = list(slot)
+			slot.clear()
+			for key in keys:
+				deadline = self._deadlines.get(key)
+				if deadline is None:
+					continue
+				if deadline <= now:
+					del self._deadlines[key]
+					expired.append(key)
+				else:
+					self._place(key, deadline)
+		return expired
+
+	def _place(self, key: Hashable, deadline: float) -> None:
+		tick = max(int(deadline // self.tick_seconds), self._current)
+		self._slots[tick % len(self._slots)].add(key)